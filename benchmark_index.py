@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import yaml
+import platform
+import itertools
+import numpy as np
+from argparse import ArgumentParser
+
+from halexp.index import setIndexPath
+from halexp.evaluation import exactTopK, benchmarkHnsw
+from halexp.__version__ import __version__
+
+ap = ArgumentParser(
+    description="Benchmark HNSW index settings over a fixed embedding set.")
+ap.add_argument('--config', type=str, default=os.environ.get('APPCONFIG'))
+ap.add_argument('--embeddings', type=str,
+    help="embeddings .npy file, defaults to the one of the configured index")
+ap.add_argument('--M', type=int, nargs='+', default=[16, 32, 64])
+ap.add_argument('--ef-construction', type=int, nargs='+', default=[100, 400])
+ap.add_argument('--num-threads', type=int, nargs='+', default=[1])
+ap.add_argument('--ef', type=int, nargs='+', default=[100, 500, 1000, 2000])
+ap.add_argument('--top-k', type=int, nargs='+', default=[10, 100, 1000])
+ap.add_argument('--queries', type=int, default=200,
+    help="number of embeddings held out of the index and used as queries")
+ap.add_argument('--max-elements', type=int, default=None,
+    help="only index this number of embeddings")
+ap.add_argument('--seed', type=int, default=0)
+ap.add_argument('--output', type=str, default='benchmark.json')
+args = ap.parse_args()
+
+space = 'cosine'
+embeddings_path = args.embeddings
+if args.config:
+    with open(args.config, "r") as fh:
+        params = yaml.load(fh, Loader=yaml.SafeLoader)
+    space = params['index']['hnswlib_space']
+    if embeddings_path is None:
+        index_path = setIndexPath(params)
+        embeddings_path = os.path.splitext(index_path)[0] + '.embeddings.npy'
+if embeddings_path is None:
+    sys.exit("Either --config or --embeddings must be given.")
+
+embeddings = np.load(embeddings_path, mmap_mode='r')
+rng = np.random.default_rng(args.seed)
+order = rng.permutation(len(embeddings))
+queries = np.asarray(embeddings[np.sort(order[:args.queries])])
+data_ids = np.sort(order[args.queries:])
+if args.max_elements is not None:
+    data_ids = data_ids[:args.max_elements]
+data = np.asarray(embeddings[data_ids])
+top_ks = [k for k in args.top_k if k <= len(data)]
+print(
+    f"Benchmark: {len(data)} embeddings indexed, {len(queries)} held out "
+    f"queries from {embeddings_path}.")
+
+print(f"Benchmark: computing exact neighbours...")
+exact_ids = exactTopK(data, queries, max(top_ks))
+
+rows = []
+for M, ef_construction, num_threads in itertools.product(
+        args.M, args.ef_construction, args.num_threads):
+    print(
+        f"Benchmark: M {M} | ef_construction {ef_construction} "
+        f"| num_threads {num_threads}")
+    for row in benchmarkHnsw(
+            data, queries, exact_ids, space, M, ef_construction, num_threads,
+            args.ef, top_ks):
+        print(
+            f"\tef {row['ef']} | k {row['top_k']} "
+            f"| build {row['build_time_s']:.1f}s "
+            f"| size {row['index_size_bytes'] / 2**20:.1f}MB "
+            f"| p50 {row['latency_p50_ms']:.2f}ms "
+            f"| p99 {row['latency_p99_ms']:.2f}ms "
+            f"| {row['qps']:.0f} qps | recall {row['recall']:.4f}")
+        rows.append(row)
+
+report = {
+    'version': __version__,
+    'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'machine': {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count()},
+    'embeddings': embeddings_path,
+    'nb_elements': len(data),
+    'nb_queries': len(queries),
+    'dim': int(data.shape[1]),
+    'space': space,
+    'seed': args.seed,
+    'results': rows,
+}
+with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+print(f"Benchmark: report saved to {args.output}.")
@@ -0,0 +1,45 @@
+import os
+import yaml
+from time import time as now
+from argparse import ArgumentParser
+
+from halexp.index import setIndexPath, getArtifactPath, Index
+
+ap = ArgumentParser()
+ap.add_argument('--force', action='store_true',
+    help="calibrate again an already calibrated index")
+args = ap.parse_args()
+
+config_path = os.environ['APPCONFIG']
+with open(config_path, "r") as fh:
+    params = yaml.load(fh, Loader=yaml.SafeLoader)
+
+params['index']['index_path'] = setIndexPath(params)
+
+# the calibration is removed when the HNSW graph is rebuilt, there is
+# nothing to do (and no model to load) while it is still there
+index_path = params['index']['index_path']
+if not os.path.exists(index_path):
+    print(f"No HNSW index at {index_path}, no calibration needed.")
+    exit()
+if os.path.exists(getArtifactPath(index_path, '.params.json')) and not args.force:
+    print(f"Index already calibrated, use --force to calibrate it again.")
+    exit()
+
+print("Loading Index...")
+index = Index(**params['index'])
+index.loadSavedIndex()
+if index.backend.name != 'hnsw':
+    print(f"Index uses the {index.backend.name} search backend, no calibration needed.")
+    exit()
+
+calibration = params['index'].get('calibration', {})
+k = calibration.get('k', params['app']['retrieve']['top_k'])
+print(f"Calibrating query time ef for recall@{k}...")
+t0 = now()
+ef, recall = index.calibrateEf(
+    k=k,
+    recall_target=calibration.get('recall_target', 0.95),
+    sample_size=calibration.get('sample_size', 200))
+print("Index calibrated in %ss: ef %s, recall@%s %.4f." % (
+    int(now() - t0), ef, index.indexParams['k'], recall))
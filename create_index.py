@@ -1,23 +1,42 @@
 import os
+import sys
 import yaml
 from time import time as now
 
 from halexp.index import setIndexPath, Index
 from halexp.corpus import Corpus
+from halexp.generations import readMarker, writeMarker, acquireBuildLock
 
 config_path = os.environ['APPCONFIG']
 with open(config_path, "r") as fh:
     params = yaml.load(fh, Loader=yaml.SafeLoader)
 
 params['index']['index_path'] = setIndexPath(params)
+marker = params['app'].get('reload', {}).get('marker')
+# a single build writes the index files at a time (e.g. a rebuild started
+# from the app, see `GenerationManager`)
+if marker:
+    try:
+        lock = acquireBuildLock(marker)
+    except BlockingIOError:
+        sys.exit(f"Another build of {params['index']['index_path']} is running.")
+
 print("Preparing Index...")
 t0 = now()
 index = Index(**params['index'])
 t1 = now()
 print("Index prepared in %ss." % int(t1 - t0))
 print("Indexing corpus...")
+# the dump is always processed, the snapshot is written afterwards
+use_snapshot = params['corpus'].get('snapshot', True)
+params['corpus']['snapshot'] = False
 corpus = Corpus(index=index, **params['corpus'])
 t2 = now()
 print("Corpus indexed in %ss." % int(t2 - t1))
-print("Index path prebuilt in:", params['index']['index_path'])
+if use_snapshot:
+    corpus.saveSnapshot()
 
+# running servers watching the marker load the new generation
+if marker:
+    writeMarker(marker, readMarker(marker) + 1)
+print("Index path prebuilt in:", params['index']['index_path'])
@@ -0,0 +1,45 @@
+import gc
+import os
+
+# Gunicorn settings of the app (read from the working directory, the command
+# line arguments of the Dockerfile take precedence).
+#
+# The app is loaded once in the master process before the workers are
+# forked: the model weights, the HNSW graph and the corpus arrays are shared
+# copy-on-write between the workers, and the embeddings are memory-mapped,
+# so adding workers barely raises the memory used.
+
+preload_app = True
+
+# the app defers the model inference (query encoder check, query cache warm
+# up) to the workers, torch thread pools must not be started before fork
+os.environ['HALEXP_PRELOAD'] = '1'
+
+
+def when_ready(server):
+    # move the objects loaded with the app out of the collected generations:
+    # garbage collections in the workers do not touch (and copy) their pages
+    gc.collect()
+    gc.freeze()
+    server.log.info("halexp: app preloaded, objects frozen before fork.")
+
+
+def post_fork(server, worker):
+    import torch
+
+    # share the cores between the workers
+    num_threads = int(os.environ.get(
+        'TORCH_NUM_THREADS',
+        max(1, (os.cpu_count() or 1) // server.cfg.workers)))
+    torch.set_num_threads(num_threads)
+    server.log.info(
+        f"halexp: worker {worker.pid} forked, {num_threads} torch threads.")
+
+
+def post_worker_init(worker):
+    # after the gevent worker patched threading, so that the background
+    # threads of the app (marker watcher, reloads) are greenlets
+    from halexp import wsgi
+
+    wsgi.initWorker()
+    worker.log.info(f"halexp: worker {worker.pid} ready.")
@@ -6,6 +6,10 @@ class Author:
     Object representing one of the authors of a document.
     """
 
+    __slots__ = (
+        'authFullNameId', 'authIdHal', 'fullName', 'normalizedFullName',
+        'authLabs', 'authLabIdHals', 'authSciencesPoSignature')
+
     sciencesPoLabsMap = {
         301587: 'https://sciencespo.hal.science',
         1846: 'https://sciencespo.hal.science/CDSP',
@@ -0,0 +1,346 @@
+import os
+import hnswlib
+import numpy as np
+
+from .evaluation import exactSearch, recallAtK, topK
+from .quantization import QuantizedEmbeddings, RowReader, residentFileBytes
+
+
+class SearchBackend:
+    """
+    Search backend of an `Index`, finding the nearest documents of queries
+    embeddings among the index documents. Results are given as corpus
+    positions and cosine similarity scores.
+    """
+
+    name = None
+
+    def __init__(self, index):
+        self.index = index
+
+    def __str__(self):
+        return f"{self.name} search backend"
+
+    def build(self, saved, toEmbed):
+        """
+        Create or update the search structure once the index embeddings are
+        up to date. `saved` is the mapping saved with the previous version
+        of the index (or None) and `toEmbed` the positions of the documents
+        embedded since.
+        """
+        raise NotImplementedError
+
+    def load(self):
+        """
+        Load the saved search structure.
+        """
+        raise NotImplementedError
+
+    def search(self, query_embeddings, top_k, allowed=None):
+        """
+        Corpus positions and scores of the `top_k` nearest documents of each
+        query, only among the documents whose position is True in the
+        `allowed` mask if given.
+        """
+        raise NotImplementedError
+
+    def emptyResults(self, nb_queries):
+        empty = np.zeros((nb_queries, 0))
+        return empty.astype(np.int64), empty
+
+
+class ExactBackend(SearchBackend):
+    """
+    Exact brute-force search over the normalized embeddings of the index,
+    suited to small corpora.
+
+    With a float16 or int8 `storage_dtype` the candidates are generated with
+    a quantized copy of the embeddings, `rescore_factor` times the number of
+    results, and rescored with their full precision embeddings read from
+    disk (not memory-mapped, so that only the quantized vectors stay
+    resident).
+    """
+
+    name = 'exact'
+
+    # queries sampled from the index to measure the recall of the quantized
+    # search at build time
+    recallK = 100
+    recallSampleSize = 200
+    # queries whose resident memory is measured
+    memorySampleSize = 10
+
+    def __init__(self, index, keep_graph=False):
+        """
+        keep_graph - keep the graph left by a previous hnsw backend up to
+        date instead of removing it (backend picked by `auto`, which uses
+        the graph again when the corpus grows)
+        """
+        super().__init__(index)
+        self.keepGraph = keep_graph
+        self.quantized = None
+        self.rows = None
+
+    def build(self, saved, toEmbed):
+        index = self.index
+        # a graph left by a previous hnsw backend would not be updated
+        # anymore, remove it so that it is rebuilt if needed (unless kept)
+        if os.path.exists(index.path) and self.keepGraph:
+            HnswBackend(index).build(saved, toEmbed)
+        elif os.path.exists(index.path):
+            os.remove(index.path)
+            print(f"Index: removed obsolete HNSW index {index.path}.")
+        if index.storageDtype != 'float32' and QuantizedEmbeddings.load(
+                index.embeddingsPath, index.storageDtype, index.length) is None:
+            QuantizedEmbeddings.quantize(
+                index.embeddings, index.storageDtype).save(index.embeddingsPath)
+        self.load()
+        if self.quantized is not None:
+            self.reportQuantization()
+
+    def load(self):
+        index = self.index
+        if index.embeddings is None:
+            raise ValueError(f"Exact search requires the stored embeddings.")
+        if index.storageDtype == 'float32':
+            return
+
+        self.quantized = QuantizedEmbeddings.load(
+            index.embeddingsPath, index.storageDtype, index.length)
+        if self.quantized is None:
+            raise ValueError(
+                f"No up to date {index.storageDtype} embeddings next to "
+                f"{index.embeddingsPath}, run create_index.py.")
+        self.rows = RowReader(index.embeddingsPath)
+        print(f"Index: using {self.quantized} to generate candidates.")
+
+    def reportQuantization(self, seed=0):
+        """
+        Print the recall of the search with and without rescoring, documents
+        of the index being used as queries, and the memory one query keeps
+        resident, measured on fresh mappings of the vectors: the whole
+        embeddings without quantization, only the quantized vectors with it
+        (the rescored rows are read from the file).
+        """
+        index = self.index
+        k = min(self.recallK, index.length)
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(
+            index.length, size=min(self.recallSampleSize, index.length),
+            replace=False)
+        queries = np.asarray(index.embeddings[sample])
+
+        exact, _ = exactSearch(index.embeddings, queries, k)
+        quantized, _ = topK(self.quantized.scores(queries), k)
+        rescored, _ = self.search(queries, k)
+        print(
+            f"Index: recall@{k} of the {self.quantized.dtype} search "
+            f"{recallAtK(quantized, exact):.4f}, "
+            f"{recallAtK(rescored, exact):.4f} after rescoring.")
+
+        def measure(search):
+            nbytes = []
+            for query in queries[:self.memorySampleSize]:
+                embeddings = np.load(index.embeddingsPath, mmap_mode='r')
+                quantized = QuantizedEmbeddings.load(
+                    index.embeddingsPath, self.quantized.dtype, index.length)
+                before = residentFileBytes()
+                search(embeddings, quantized, query[None])
+                nbytes.append(residentFileBytes() - before)
+                del embeddings, quantized
+            return int(np.mean(nbytes))
+
+        if residentFileBytes() is None:
+            return
+        fullMemory = measure(
+            lambda embeddings, quantized, q: exactSearch(embeddings, q, k))
+        memory = measure(
+            lambda embeddings, quantized, q: rescoredSearch(
+                quantized, self.rows, q, k, index.rescoreFactor))
+        print(
+            f"Index: a query maps {memory} bytes of {self.quantized.dtype} "
+            f"vectors in memory instead of {fullMemory} bytes of embeddings "
+            f"({1 - memory / max(fullMemory, 1):.1%} saved).")
+
+    def search(self, query_embeddings, top_k, allowed=None):
+        candidates = None
+        nb_candidates = self.index.length
+        if allowed is not None:
+            candidates = np.flatnonzero(allowed)
+            nb_candidates = len(candidates)
+        k = min(top_k, nb_candidates)
+        if k == 0:
+            return self.emptyResults(len(query_embeddings))
+        if self.quantized is None:
+            return exactSearch(
+                self.index.embeddings, query_embeddings, k, candidates)
+        return rescoredSearch(
+            self.quantized, self.rows, query_embeddings, k,
+            self.index.rescoreFactor, candidates)
+
+
+def rescoredSearch(
+    quantized, embeddings, query_embeddings, k, rescore_factor,
+    candidates=None):
+    """
+    Search of the `rescore_factor * k` nearest candidates with the quantized
+    vectors, rescored with the full precision `embeddings` (an array or a
+    `RowReader`).
+    """
+    nb_candidates = len(embeddings) if candidates is None else len(candidates)
+    nb_rescored = min(k * rescore_factor, nb_candidates)
+    ids, _ = topK(quantized.scores(query_embeddings, candidates), nb_rescored)
+    if candidates is not None:
+        ids = candidates[ids]
+
+    rows, inverse = np.unique(ids, return_inverse=True)
+    vectors = np.asarray(embeddings[rows])
+    scores = np.einsum(
+        'qkd,qd->qk', vectors[inverse.reshape(ids.shape)], query_embeddings)
+    best, scores = topK(scores, k)
+    return np.take_along_axis(ids, best, axis=1), scores
+
+
+class HnswBackend(SearchBackend):
+    """
+    Approximate search with Hierarchical Navigable Small World graphs
+    (HNSW), the graph being saved at the index path.
+    """
+
+    name = 'hnsw'
+
+    # filtered searches are exact when the number of documents passing the
+    # filter is lower than this factor times the number of results
+    exactSearchFactor = 10
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.graph = None
+
+    def load(self):
+        index = self.index
+        if not os.path.exists(index.path):
+            raise ValueError(
+                f"No HNSW index at {index.path}, run create_index.py.")
+        self.graph = hnswlib.Index(space=index.space, dim=index.embedding_size)
+        self.graph.load_index(index.path, max_elements=index.length)
+        print(f"Index: index loaded from {index.path}.\n{index}")
+        a1 = index.embedding_size == self.graph.dim
+        a2 = index.space == self.graph.space
+        if not (a1 and a2):
+            raise ValueError(f"Index loaded not coherent with parameters.")
+        self.graph.set_num_threads(index.num_threads)
+        self.checkStorageDtype()
+
+    def checkStorageDtype(self):
+        # hnswlib only stores float32 vectors in the graph
+        if self.index.storageDtype != 'float32':
+            print(
+                f"Index: storage dtype {self.index.storageDtype} is only "
+                f"supported by the exact backend, the HNSW graph keeps "
+                f"float32 vectors (set backend to exact to use it).")
+
+    def build(self, saved, toEmbed):
+        """
+        Update the saved graph: the new or modified documents are added, the
+        withdrawn ones are marked as deleted and the graph is resized as
+        needed. When there is no saved graph it is built from the stored
+        embeddings.
+        """
+        index = self.index
+
+        # load index, check its coherence and update it
+        if os.path.exists(index.path) and saved is not None:
+            self.load()
+
+            removed = [
+                label for label, _, _, _ in saved
+                    if label not in index.positions]
+            for label in removed:
+                self.graph.mark_deleted(label)
+
+            max_elements = self.graph.element_count + len(toEmbed)
+            if max_elements > self.graph.max_elements:
+                self.graph.resize_index(max_elements)
+            if toEmbed:
+                self.graph.add_items(
+                    data=index.embeddings[toEmbed], ids=index.labels[toEmbed])
+
+            if removed or toEmbed:
+                print(
+                    f"Index: added or updated {len(toEmbed)} documents, "
+                    f"deleted {len(removed)} documents.")
+                self.graph.save_index(index.path)
+                print(f"Index: HNSW index saved to {index.path}\n{index}")
+        # init index and populate it with embeddings
+        else:
+            self.graph = hnswlib.Index(
+                space=index.space, dim=index.embedding_size)
+            self.graph.init_index(
+                max_elements=index.length, **index.indexKwargs)
+            self.graph.set_num_threads(index.num_threads)
+            self.checkStorageDtype()
+            print("Index: populating HNSWLIB index...")
+            self.graph.add_items(data=index.embeddings, ids=index.labels)
+            self.graph.save_index(index.path)
+            print(f"Index: HNSW index saved to {index.path}\n{index}")
+            # the parameters calibrated for a previous graph are obsolete
+            if os.path.exists(index.paramsPath):
+                os.remove(index.paramsPath)
+
+    def setEf(self, ef):
+        self.graph.set_ef(int(ef))
+
+    def knnQuery(self, query_embeddings, k, filter=None):
+        labels, distances = self.graph.knn_query(
+            query_embeddings, k=k, num_threads=self.index.num_threads,
+            filter=filter)
+        return self.index.labelsToPositions(labels), 1 - distances
+
+    def search(self, query_embeddings, top_k, allowed=None):
+        """
+        The filter is applied during the HNSW search; when few documents
+        pass it the search is exact.
+        """
+        index = self.index
+        if allowed is None:
+            return self.knnQuery(query_embeddings, min(top_k, index.length))
+
+        candidates = np.flatnonzero(allowed)
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return self.emptyResults(len(query_embeddings))
+        if len(candidates) <= self.exactSearchFactor * k:
+            return exactSearch(
+                index.embeddings, query_embeddings, k, candidates)
+
+        try:
+            return self.knnQuery(
+                query_embeddings, k,
+                filter=lambda label: allowed[index.positions[label]])
+        except RuntimeError:
+            # the filtered graph search found less than k documents
+            return exactSearch(
+                index.embeddings, query_embeddings, k, candidates)
+
+
+backends = {
+    ExactBackend.name: ExactBackend,
+    HnswBackend.name: HnswBackend,
+}
+
+
+def createBackend(name, index, exact_max_elements):
+    """
+    Search backend named `name` for the index, `auto` choosing the exact
+    backend when the index has at most `exact_max_elements` documents.
+    """
+    if name == 'auto':
+        if index.length <= exact_max_elements:
+            return ExactBackend(index, keep_graph=True)
+        name = 'hnsw'
+    if not name in backends:
+        raise ValueError(
+            f"Invalid search backend `{name}`, "
+            f"must be one of {['auto'] + list(backends)}")
+    return backends[name](index)
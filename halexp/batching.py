@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+
+
+def isGeventPatched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class EncodingRequest:
+
+    __slots__ = ('queries', 'done', 'embeddings', 'error')
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+class BatchEncoder:
+    """
+    Micro-batching of the queries encoding: the queries of concurrent
+    requests are collected during at most `max_wait_ms` milliseconds (or
+    until `max_batch_size` queries are pending) and encoded in one batch by
+    a dispatcher thread, their embeddings being handed back to the waiting
+    requests. Queries pending while a batch is encoded form the next batch.
+
+    Under gevent (monkey-patched threading) the dispatcher is a greenlet and
+    the model runs in the gevent threadpool, so that the event loop keeps
+    serving the other requests during the forward pass.
+    """
+
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=5, **kwargs):
+        self.encode = encode
+        self.maxBatchSize = max_batch_size
+        self.maxWait = max_wait_ms / 1000
+        # the condition, the pending requests and the dispatcher belong to
+        # the process that made them (see `start`)
+        self.startLock = threading.Lock()
+        self.condition = None
+        self.pending = []
+        self.pid = None
+        self.nbBatches = 0
+        self.nbQueries = 0
+
+    def __str__(self):
+        mean = self.nbQueries / self.nbBatches if self.nbBatches else 0
+        return (
+            f"Batch encoder: {self.nbQueries} queries in {self.nbBatches} "
+            f"batches ({mean:.2f} queries per batch)")
+
+    def start(self):
+        """
+        Make the condition, the pending requests and the dispatcher of the
+        current process. The encoder may be made (and used) by the preloaded
+        master of gunicorn before the fork: its threads do not survive the
+        fork and its lock is a native one while the gevent workers patch
+        threading after forking, so each worker makes its own.
+        """
+        with self.startLock:
+            if self.pid == os.getpid():
+                return
+            self.condition = threading.Condition()
+            self.pending = []
+            self.runInThreadpool = isGeventPatched()
+            dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+            self.pid = os.getpid()
+        # under gevent starting the dispatcher yields to the other greenlets
+        dispatcher.start()
+
+    def __call__(self, queries):
+        """
+        Embeddings of a list of queries, encoded with the queries of the
+        concurrent requests.
+        """
+        if self.pid != os.getpid():
+            self.start()
+        request = EncodingRequest(queries)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.embeddings
+
+    def nbPending(self):
+        return sum(len(r.queries) for r in self.pending)
+
+    def nextBatch(self):
+        """
+        Wait for pending requests and take the next batch of them, a request
+        with more than `max_batch_size` queries being encoded alone.
+        """
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            deadline = time.monotonic() + self.maxWait
+            while self.nbPending() < self.maxBatchSize:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch, size = [], 0
+            while self.pending and (
+                    not batch or
+                    size + len(self.pending[0].queries) <= self.maxBatchSize):
+                request = self.pending.pop(0)
+                batch.append(request)
+                size += len(request.queries)
+            return batch
+
+    def runEncode(self, queries):
+        if self.runInThreadpool:
+            import gevent
+            return gevent.get_hub().threadpool.apply(self.encode, (queries,))
+        return self.encode(queries)
+
+    def dispatch(self):
+        while True:
+            batch = self.nextBatch()
+            queries = [q for request in batch for q in request.queries]
+            try:
+                embeddings = self.runEncode(queries)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            self.nbBatches += 1
+            self.nbQueries += len(queries)
+            start = 0
+            for request in batch:
+                end = start + len(request.queries)
+                request.embeddings = embeddings[start: end]
+                start = end
+                request.done.set()
@@ -0,0 +1,257 @@
+import os
+import hashlib
+import sqlite3
+import zipfile
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings stored in a SQLite database, keyed by the
+    name of the model and the hash of the embedded text. It is shared across
+    index builds and corpus configurations.
+    """
+
+    # maximum number of variables in a SQLite query
+    chunk_size = 500
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash)) WITHOUT ROWID")
+        self.connection.commit()
+
+    def __str__(self):
+        return f"Embedding cache {self.path}: {self.hits} hits, " \
+            f"{self.misses} misses ({100 * self.hitRate():.2f}% hit rate)"
+
+    def hitRate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.
+
+    def get(self, hashes):
+        """
+        Returns a dict mapping the cached hashes to their embedding.
+        """
+        found = {}
+        unique = list(set(hashes))
+        for n in range(0, len(unique), self.chunk_size):
+            chunk = unique[n: n+self.chunk_size]
+            rows = self.connection.execute(
+                "SELECT hash, embedding FROM embeddings WHERE model = ? "
+                f"AND hash IN ({','.join('?' * len(chunk))})",
+                [self.model_name] + chunk)
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+
+        nb_hits = sum(h in found for h in hashes)
+        self.hits += nb_hits
+        self.misses += len(hashes) - nb_hits
+        return found
+
+    def put(self, hashes, embeddings):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+            [
+                (self.model_name, h, np.asarray(e, dtype=np.float32).tobytes())
+                    for h, e in zip(hashes, embeddings)
+            ])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of queries embeddings, keyed by the normalized text of
+    the queries. It can be saved to and loaded from disk, along with the
+    name of the `encoder` of the embeddings.
+    """
+
+    def __init__(self, size, encoder=None):
+        self.size = size
+        self.encoder = encoder
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.
+        return f"Query cache: {len(self.entries)}/{self.size} entries, " \
+            f"{self.hits} hits, {self.misses} misses " \
+            f"({100 * rate:.2f}% hit rate)"
+
+    def __contains__(self, query):
+        return self.normalizeQuery(query) in self.entries
+
+    @staticmethod
+    def normalizeQuery(query):
+        return unicodedata.normalize('NFC', ' '.join(query.split()))
+
+    def get(self, query):
+        key = self.normalizeQuery(query)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, query, embedding):
+        key = self.normalizeQuery(query)
+        with self.lock:
+            self.entries[key] = embedding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def save(self, path):
+        with self.lock:
+            queries = list(self.entries.keys())
+            embeddings = list(self.entries.values())
+        if not queries:
+            return
+        # the workers of the app save their cache at exit at the same time
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            queries=np.array(queries),
+            embeddings=np.stack(embeddings),
+            encoder=np.array(str(self.encoder)))
+        os.replace(tmp_path, path)
+        print(f"Query cache: saved {len(queries)} entries to {path}.")
+
+    def load(self, path):
+        """
+        Load the entries saved at `path`, an unreadable file or one saved
+        for another encoder being ignored.
+        """
+        try:
+            with np.load(path) as data:
+                encoder = str(data['encoder']) if 'encoder' in data else None
+                if encoder != str(self.encoder):
+                    print(f"Query cache: ignoring {path} encoded with {encoder}.")
+                    return
+                queries, embeddings = data['queries'], data['embeddings']
+                if embeddings.ndim != 2 or len(queries) != len(embeddings):
+                    raise ValueError("queries and embeddings do not match")
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            print(f"Query cache: ignoring unreadable {path} ({e!r}).")
+            return
+        for query, embedding in zip(queries, embeddings):
+            self.put(str(query), embedding)
+        print(f"Query cache: loaded {len(self.entries)} entries from {path}.")
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of full query responses, keyed by the endpoint, the
+    index generation, the normalized query and the query parameters. The
+    entries are the response body, its mimetype and its ETag.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.
+        return f"Response cache: {len(self.entries)}/{self.size} entries, " \
+            f"{self.hits} hits, {self.misses} misses " \
+            f"({100 * rate:.2f}% hit rate)"
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total > 0 else 0.,
+        }
+
+    @staticmethod
+    def makeKey(endpoint, generation, query, queryParams):
+        params = tuple(sorted(
+            (k, v) for k, v in queryParams.items() if k != 'query'))
+        return (
+            endpoint, generation, QueryCache.normalizeQuery(query), params)
+
+    @staticmethod
+    def makeETag(generation, body):
+        return f"{generation}-{hashlib.sha1(body).hexdigest()[:20]}"
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, key, body, mimetype, etag):
+        with self.lock:
+            self.entries[key] = (body, mimetype, etag)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class FragmentCache:
+    """
+    Bounded LRU cache of rendered HTML fragments of the authors and
+    documents, keyed by the index generation, the kind of fragment and the
+    author or document.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.
+        return f"Fragment cache: {len(self.entries)}/{self.size} entries, " \
+            f"{self.hits} hits, {self.misses} misses " \
+            f"({100 * rate:.2f}% hit rate)"
+
+    def get(self, key, render):
+        """
+        Cached fragment of `key`, rendered by `render()` if missing.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        fragment = render()
+        with self.lock:
+            self.entries[key] = fragment
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return fragment
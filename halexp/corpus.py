@@ -1,10 +1,16 @@
+import os
 import re
-import json
+from itertools import islice
+from multiprocessing import Pool
 from tqdm import tqdm
 import numpy as np
 import nltk.data
+from scipy import sparse
 
-from .document import Document
+from .store import DocumentStore
+from .dump import iterDump
+from .snapshot import readManifest, saveSnapshot, loadSnapshot
+from .profiles import AuthorProfiles
 
 def remove_html_tags(text):
     """Remove html tags from a string"""
@@ -14,6 +20,36 @@ def remove_html_tags(text):
     return re.sub(clean, '', text)
 
 
+def loadSentencesSplitter():
+    return nltk.data.load('tokenizers/punkt/english.pickle')
+
+
+def chunkSentences(sentences, max_length):
+    """
+    Group consecutive sentences in chunks of at most `max_length` sentences.
+    """
+    chunks = []
+    na = 0
+    nb = 0
+    while na < len(sentences)-1:
+        nb += min(max_length, len(sentences)-nb)
+        chunks.append(sentences[na: nb])
+        na = nb
+    return chunks
+
+
+# sentences splitter of the processes splitting abstracts in parallel
+workerSplitter = None
+
+def initSplitWorker():
+    global workerSplitter
+    workerSplitter = loadSentencesSplitter()
+
+def splitAndChunk(args):
+    text, max_length = args
+    return chunkSentences(workerSplitter.tokenize(text.strip()), max_length)
+
+
 class Corpus:
     """
     A Corpus is a collection of documents.
@@ -54,6 +90,14 @@ class Corpus:
         "Commentaire d’arrêt"
     ]
 
+    # chunk numbers of the documents created from the metadata of a HAL
+    # document, the abstract chunks are numbered from `abstractChunk`
+    metadataChunks = {'keywords': 0, 'title': 1, 'subtitle': 2}
+    abstractChunk = 3
+
+    # maximum number of cached year filters
+    maxYearFilters = 128
+
     def __init__(
             self,
             index,
@@ -62,90 +106,211 @@ class Corpus:
             use_keys,
             min_num_characters,
             filter_non_sciencespo_authors,
+            num_workers=1,
+            worker_chunksize=64,
+            snapshot=True,
+            author_profiles=None,
+            read_only=False,
             **kwargs):
         """
-        dump_file[str]: path to the HAL dump in json format.
+        dump_file[str]: path to the HAL dump in json or json lines format,
+        optionally gzip or zstd compressed.
 
         max_length [int]: maximum lenght of the serie of phrases of each doc.
 
         use_keys [dict]: wheter to include or not the title, subtirle,
         author and keywords of HAL document in the text to be embedded.
+
+        num_workers [int]: number of processes splitting the abstracts in
+        sentences and chunks (in the main process if 1).
+
+        worker_chunksize [int]: number of abstracts sent at once to each
+        process.
+
+        snapshot [bool]: load the documents from the binary snapshot saved
+        next to the index (see `saveSnapshot`) when it was built from the
+        same dump with the same parameters, instead of processing the dump.
+
+        author_profiles [dict]: parameters of the `AuthorProfiles` index used
+        to retrieve authors directly (disabled if None or not `enabled`).
+
+        read_only [bool]: load the index and author profiles built by
+        `create_index.py` without writing any file (serving processes),
+        instead of building or updating them.
         """
 
         self.nlp_loaded = False
 
         self.index = index
 
-        self.documents = []
+        self.store = DocumentStore()
+        self.documents = self.store
         self.nb_documents = 0
         self.halIds = set([])
+        self.yearFilters = {}
 
         self.doc_max_length = max_length
         self.include = use_keys
         self.minNbCharacters = min_num_characters
         self.filterNonSPAuthors = filter_non_sciencespo_authors
+        self.num_workers = num_workers
+        self.worker_chunksize = worker_chunksize
 
-        self.loadDump(dump_file)
-        self.createDocuments()
+        self.snapshotPath = self.index.getArtifactPath('.snapshot')
+        if not (snapshot and self.loadSnapshot(dump_file)):
+            self.createDocuments(self.loadDump(dump_file))
+        self.buildAggregationMatrices()
 
-        self.index.createIndex(self.documents)
+        if read_only:
+            self.index.loadIndex(self.documents)
+        else:
+            self.index.createIndex(self.documents)
+
+        self.profiles = None
+        if author_profiles is not None and author_profiles.get('enabled', True):
+            self.profiles = AuthorProfiles(
+                self, read_only=read_only, **author_profiles)
 
 
+    # metadata keys checked for each HAL document of the dump: missing
+    # entries are either replaced or the document is dropped
+    requiredMetadata = [
+        ('keyword_s', False),
+        ('title_s', False),
+        ('subtitle_s', False),
+        ('authIdHasPrimaryStructure_fs', True),
+    ]
+
     def checkAndReplaceMissingMetadata(
         self,
+        hd,
         key,
         drop=False,
-        replace_value=''):
-
-        nb_missing = 0
-        nb_dropped = 0
-        for n, hd in enumerate(self.halData):
-            if not key in hd:
-                if drop:
-                    self.halData.pop(n)
-                    nb_dropped += 1
-                else:
-                    replace = [replace_value,]
-                    hd[key] = replace
-                    nb_missing += 1
-
-        if nb_missing > 0:
+        replace_value='',
+        count=True):
+        """
+        Check a HAL document has the `key` entry, replacing it if missing.
+        Returns False if the document has to be dropped. Missing entries
+        are counted unless `count` is False.
+        """
+
+        if key in hd:
+            return True
+        counts = self.nbDropped if drop else self.nbMissing
+        if count:
+            counts[key] = counts.get(key, 0) + 1
+        if drop:
+            return False
+        hd[key] = [replace_value,]
+        return True
+
+    def checkRecord(self, hd, count=True):
+        return all([
+            self.checkAndReplaceMissingMetadata(hd, key, drop, count=count)
+                for key, drop in self.requiredMetadata])
+
+    def iterHalData(self):
+        """
+        Stream the valid HAL documents of the dump again, one at a time, once
+        it was checked by `loadDump`.
+        """
+        for hd in iterDump(self.dump_file):
+            if self.checkRecord(hd, count=False):
+                yield hd
+
+    def loadDump(self, dump_file):
+        """
+        Stream the valid HAL documents of the dump, one at a time, while
+        checking it: the halIds have to be unique and the missing metadata
+        are counted, and reported once the dump is read. The content of the
+        dump is not kept in memory, the documents are read again with
+        `iterHalData` when needed.
+        """
+
+        self.dump_file = dump_file
+        self.nbMissing = {}
+        self.nbDropped = {}
+
+        nb_entries = 0
+        for hd in iterDump(dump_file):
+            # check if duplicated hal ids
+            if hd['halId_s'] in self.halIds:
+                raise ValueError(
+                    f"There are documents in dump with repeated 'halId_s' key.")
+            self.halIds.add(hd['halId_s'])
+            nb_entries += 1
+            if self.checkRecord(hd):
+                yield hd
+
+        print(f"Corpus: found {nb_entries} unique entries from json dump.")
+
+        for key, nb_missing in self.nbMissing.items():
             mssg = f"Corpus: Found {nb_missing} HAL docs out of "
-            mssg += f"{len(self.halData)} "
-            mssg += f"({100 * nb_missing / len(self.halData):.2f}%) "
+            mssg += f"{nb_entries} "
+            mssg += f"({100 * nb_missing / nb_entries:.2f}%) "
             mssg += f"without `{key}` entry."
             print(mssg)
 
-        if nb_dropped > 0:
+        for key, nb_dropped in self.nbDropped.items():
             mssg = f"Corpus: Dropped {nb_dropped} HAL docs out of "
-            mssg += f"{len(self.halData)} "
-            mssg += f"({100 * nb_dropped / len(self.halData):.2f}%) "
+            mssg += f"{nb_entries} "
+            mssg += f"({100 * nb_dropped / nb_entries:.2f}%) "
             mssg += f"without `{key}` entry."
             print(mssg)
 
-    def loadDump(self, dump_file):
+        self.nb_records = nb_entries - sum(self.nbDropped.values())
 
-        with open(dump_file) as f:
-            self.halData = json.load(f)
+    def getSnapshotManifest(self, dump_file):
+        """
+        Description of the dump and parameters the documents are built from.
+        """
+        manifest = {
+            'max_length': self.doc_max_length,
+            'use_keys': self.include,
+            'min_num_characters': self.minNbCharacters,
+            'dump_file': os.path.abspath(dump_file),
+        }
+        if os.path.exists(dump_file):
+            stat = os.stat(dump_file)
+            manifest['dump_size'] = stat.st_size
+            manifest['dump_mtime'] = stat.st_mtime
+        return manifest
 
-        # check if duplicated hal ids
-        nb_unique_halId = len(set([hd['halId_s'] for hd in self.halData]))
-        if not nb_unique_halId == len(self.halData):
-            raise ValueError(
-                f"There are documents in dump with repeated 'halId_s' key.")
+    def loadSnapshot(self, dump_file):
+        """
+        Load the documents from the snapshot if it matches the dump and the
+        corpus parameters (a missing dump is not checked).
+        Returns False if there is no valid snapshot.
+        """
+        saved = readManifest(self.snapshotPath)
+        if saved is None:
+            return False
 
-        print(
-            f"Corpus: found {len(self.halData)} unique entries from json dump.")
+        manifest = self.getSnapshotManifest(dump_file)
+        keys = manifest.keys()
+        if not os.path.exists(dump_file):
+            keys = ['max_length', 'use_keys', 'min_num_characters']
+        outdated = [k for k in keys if saved.get(k) != manifest[k]]
+        if outdated:
+            print(
+                f"Corpus: ignoring snapshot {self.snapshotPath}, "
+                f"{', '.join(outdated)} changed.")
+            return False
 
-        self.checkAndReplaceMissingMetadata('keyword_s', '')
-        self.checkAndReplaceMissingMetadata('title_s', '')
-        self.checkAndReplaceMissingMetadata('subtitle_s', '')
-        self.checkAndReplaceMissingMetadata(
-            'authIdHasPrimaryStructure_fs', drop=True)
+        self.dump_file = dump_file
+        self.store = loadSnapshot(self.snapshotPath)
+        self.documents = self.store
+        self.nb_documents = len(self.store)
+        self.nb_records = self.store.nb_records
+        return True
+
+    def saveSnapshot(self):
+        saveSnapshot(
+            self.store, self.snapshotPath,
+            self.getSnapshotManifest(self.dump_file))
 
     def loadNlp(self):
-        self.sentenes_splitter =  nltk.data.load(
-            'tokenizers/punkt/english.pickle')
+        self.sentenes_splitter = loadSentencesSplitter()
         self.nlp_loaded = True
 
     def split(self, text):
@@ -206,29 +371,27 @@ class Corpus:
 
         return authorsData
 
-    def createDocument(self, hd, phrases):
+    def getRecord(self, hd):
+        """
+        Code of a HAL document in the store, adding it on first use.
+        """
+        record = self.store.recordsCodes.get(hd["halId_s"])
+        if record is None:
+            record = self.store.addRecord(hd, self.parseStructure(
+                hd["authFullNameId_fs"],
+                hd["authIdHasPrimaryStructure_fs"]))
+        return record
+
+    def createDocument(self, hd, phrases, chunk):
 
         phrases_ok = self.getValidLengthPhrases(phrases)
         if len(phrases_ok) == 0:
             jp = ','.join([f" `{p}`" for p in phrases])
             print(f"Removing document with too short phrases:{jp}.")
-            return None
-        phrases = phrases_ok
-
-        document = Document(phrases, self.doc_max_length)
-        document.setMetadata(hd)
-        document.setAuthors(self.parseStructure(
-            hd["authFullNameId_fs"],
-            hd["authIdHasPrimaryStructure_fs"]))
-        document.setPublicationDate(hd["publicationDate_s"])
-        document.setUri(hd["uri_s"])
-        document.setHalId(hd["halId_s"])
-        document.setOpenAccess(hd["openAccess_bool"])
-        document.setTitle(hd["title_s"][0])
-        document.setKeywords(hd["keyword_s"])
-        document.setSubtitle(hd["subtitle_s"])
-
-        return document
+            return
+        phrases = phrases_ok[:self.doc_max_length]
+
+        self.store.addDocument(self.getRecord(hd), phrases, chunk)
 
     def getValidLengthPhrases(self, phrases):
         return [p for p in phrases if len(p) > self.minNbCharacters]
@@ -242,166 +405,336 @@ class Corpus:
                 return False
         return True
 
-
-    def addDocument(self, document):
-        if document is not None:
-            self.documents.append(document)
-
-    def createDocuments(self):
+    def iterAbstractsChunks(self, records):
+        """
+        Split the abstracts of the HAL documents in sentences and chunks,
+        yielding each HAL document with its chunks in the records order.
+        With several workers the abstracts are processed by a pool of
+        processes, one block of records at a time.
         """
-        Create documents from dump data
+        progress = tqdm()
+
+        if self.num_workers <= 1:
+            for hd in records:
+                progress.update()
+                yield hd, chunkSentences(
+                    self.split(hd["abstract_s"][0]), self.doc_max_length)
+            progress.close()
+            return
+
+        block_size = 4 * self.num_workers * self.worker_chunksize
+        with Pool(self.num_workers, initializer=initSplitWorker) as pool:
+            while True:
+                block = list(islice(records, block_size))
+                if not block:
+                    break
+                tasks = [
+                    (hd["abstract_s"][0], self.doc_max_length) for hd in block]
+                # map keeps the order of the tasks
+                chunks = pool.map(
+                    splitAndChunk, tasks, chunksize=self.worker_chunksize)
+                progress.update(len(block))
+                yield from zip(block, chunks)
+        progress.close()
+
+    def createDocuments(self, records):
+        """
+        Create documents from dump data: the documents of the metadata while
+        the dump is checked and streamed as `records`, then the documents of
+        the abstracts in a second pass.
         """
 
-        for hd in self.halData:
+        for hd in records:
 
             # create docs from metadata
             if self.include['keywords'] and hd['keyword_s'][0]:
-                self.addDocument(
-                    self.createDocument(hd, [' '.join(hd['keyword_s'])]))
+                self.createDocument(
+                    hd, [' '.join(hd['keyword_s'])],
+                    self.metadataChunks['keywords'])
             if self.include['title'] and hd['title_s']:
-                self.addDocument(
-                    self.createDocument(hd, hd['title_s']))
+                self.createDocument(
+                    hd, hd['title_s'], self.metadataChunks['title'])
             if self.include['subtitle'] and hd['subtitle_s'][0]:
-                self.addDocument(
-                    self.createDocument(hd, hd['subtitle_s']))
+                self.createDocument(
+                    hd, hd['subtitle_s'], self.metadataChunks['subtitle'])
         nb_docs = len(self.documents)
         print(f"Corpus: {nb_docs} documents created from metadata.")
 
         if self.include['abstract']:
             print("Corpus: splitting sentences from abstracts.")
-            for hd in tqdm(self.halData):
+            records = (
+                hd for hd in self.iterHalData() if self.hasValidAbstracts(hd))
+            for hd, chunks in self.iterAbstractsChunks(records):
                 # create docs with phrases
-                if self.hasValidAbstracts(hd):
-                    sentences = self.split(hd["abstract_s"][0])
-                    na = 0
-                    nb = 0
-                    while na < len(sentences)-1:
-                        nb += min(self.doc_max_length, len(sentences)-nb)
-                        document = self.createDocument(hd, sentences[na: nb])
-                        na = nb
-                        self.addDocument(document)
+                for n, phrases in enumerate(chunks):
+                    self.createDocument(hd, phrases, self.abstractChunk + n)
+        self.store.freeze()
         self.nb_documents = len(self.documents)
         print(
             f"Corpus: {self.nb_documents - nb_docs} docs from valid abstracts.")
 
 
-    def filter_documents(self, results, filters):
-        filter_docs = []
-        scores = []
-
-        l0 = len(results)
-        for r in results:
-            document = self.documents[r['corpus_id']]
-            if any([f(document) for f in filters]):
+    def buildAggregationMatrices(self):
+        """
+        Precompute the sparse matrices mapping each document (i.e. chunk) to
+        its authors and to its HAL document, used to aggregate the scores of
+        the retrieved documents.
+        """
+        store = self.store
+        nb_docs = len(store)
+
+        # authors equal as `Author` objects share the same column
+        authorsColumns = {}
+        self.authors = []
+        columns = np.full(len(store.authors), -1, dtype=np.int64)
+        for code, author in enumerate(store.authors):
+            if self.filterNonSPAuthors and not author.isSPSignature():
                 continue
-            filter_docs.append(document)
-            scores.append(r['score'])
-        print(
-            f"Corpus: filtered {l0 - len(filter_docs)} out of {l0}.")
-
-        return scores, filter_docs
+            if not author in authorsColumns:
+                authorsColumns[author] = len(self.authors)
+                self.authors.append(author)
+            columns[code] = authorsColumns[author]
+        columns[columns < 0] = len(self.authors)
+
+        self.docHalMatrix = sparse.csr_matrix(
+            (
+                np.ones(nb_docs, dtype=np.float32),
+                store.records,
+                np.arange(nb_docs+1)),
+            shape=(nb_docs, store.nb_records))
+
+        halAuthors = sparse.csr_matrix(
+            (
+                np.ones(len(store.authorsIndices), dtype=np.float32),
+                (
+                    np.repeat(
+                        np.arange(store.nb_records),
+                        np.diff(store.authorsIndptr)),
+                    columns[store.authorsIndices])),
+            shape=(store.nb_records, len(self.authors) + 1))
+        # drop the last column, gathering the filtered authors
+        halAuthors = halAuthors[:, :len(self.authors)]
+        halAuthors.data[:] = 1
+        self.docAuthorMatrix = (self.docHalMatrix @ halAuthors).tocsr()
+
+        self.publicationYears = store.years[store.records]
 
-    def sortAndRankResults(self, agg_scores_dics):
+        print(
+            f"Corpus: {len(self.authors)} authors and "
+            f"{store.nb_records} HAL documents to aggregate results.")
 
-        sorted_results = sorted(
-            agg_scores_dics,
-            key=lambda x: x['rank_score'],
-            reverse=True)
+    def getYearFilter(self, min_year):
+        """
+        Boolean mask of the documents published from `min_year`, passed to
+        the index search (None if all documents pass it).
+        """
+        min_year = int(min_year)
+        if min_year <= 0:
+            return None
+        if not min_year in self.yearFilters:
+            if len(self.yearFilters) >= self.maxYearFilters:
+                self.yearFilters.clear()
+            allowed = self.publicationYears >= min_year
+            self.yearFilters[min_year] = None if allowed.all() else allowed
+        return self.yearFilters[min_year]
+
+    def resultsArrays(self, results):
+        """
+        Corpus positions and scores of the results.
+        """
+        positions = np.array(
+            [r['corpus_id'] for r in results], dtype=np.int64)
+        scores = np.array([r['score'] for r in results], dtype=np.float64)
+        return positions, scores
 
-        for k, sr in enumerate(sorted_results):
-            sr.update({'rank': k})
+    rankMetrics = ['mean', 'median', 'log-mean', 'sigmoid-mean', 'sigmoid']
 
-        return sorted_results
+    def rankScores(self, scores, groups, nb_groups, rank_metric):
+        """
+        Aggregate the `scores` of the hits of each group (author or HAL
+        document), `groups` being the group of each hit.
+        Returns the rank score and number of hits of every group.
+        """
+        if not rank_metric in self.rankMetrics:
+            raise ValueError(
+                f"Invalid rank metric `{rank_metric}`, "
+                f"must be one of {self.rankMetrics}")
 
+        counts = np.bincount(groups, minlength=nb_groups)
+        nonzero = np.maximum(counts, 1)
 
-    def rankScores(self, scores, rank_metric):
         if rank_metric == 'median':
-            return np.median(scores)
-        elif rank_metric == 'mean':
-            return np.mean(scores)
-        elif rank_metric == 'log-mean':
-            return np.log(1+len(scores)) * np.mean(scores)
-        elif rank_metric == 'sigmoid-mean':
-            return  1/(1+np.exp(-0.5 * len(scores))) * np.mean(scores)
-        elif rank_metric == 'sigmoid':
-            return np.mean(1/(1+np.exp(-0.5 * np.array(scores))) * np.array(scores))
+            order = np.lexsort((scores, groups))
+            sorted_scores = scores[order]
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            low = starts + np.maximum(counts-1, 0) // 2
+            high = starts + counts // 2
+            rank_scores = np.zeros(nb_groups)
+            has_hits = counts > 0
+            rank_scores[has_hits] = (
+                sorted_scores[low[has_hits]] +
+                sorted_scores[high[has_hits]]) / 2
+            return rank_scores, counts
+
+        if rank_metric == 'sigmoid':
+            weights = 1/(1+np.exp(-0.5 * scores)) * scores
         else:
-            rms = ['mean', 'median', 'log-mean', 'sigmoid-mean', 'sigmoid']
-            raise ValueError(
-                f"Invalid rank metric `{rank_metric}`, must be one of {rms}")
-
-
-    def sortFilterAndFormatAuthorsResults(self, results, rank_metric, min_year=-1):
+            weights = scores
+        means = np.bincount(
+            groups, weights=weights, minlength=nb_groups) / nonzero
 
-        filters = []
-        if min_year > 0:
-            filters = [lambda doc: doc.publication_year < int(min_year)]
-
-        scores, filter_docs = self.filter_documents(results, filters)
-
-        authors_agg_scores = dict()
-        for score, doc in zip(scores, filter_docs):
-            for author in doc.getAuthors():
-
-                if self.filterNonSPAuthors and not author.isSPSignature():
-                    continue
-
-                if not author in authors_agg_scores:
-                    authors_agg_scores[author] = {'scores': [], 'docs': []}
-                authors_agg_scores[author]['scores'].append(score)
-                authors_agg_scores[author]['docs'].append(doc)
-
-        print(f"Corpus: found {len(authors_agg_scores)} different authors.")
-
-
-        authors_agg_scores_r = [{
-            'author': a,
-            'rank_score': self.rankScores(d['scores'], rank_metric),
-            'docs_scores': d['scores'],
-            'nb_hits': len(d['scores']),
-            'docs': d['docs']
-        } for a, d in authors_agg_scores.items()]
-
-        return self.sortAndRankResults(authors_agg_scores_r)
-
-
-    def sortFilterAndFormatDocsResults(self, results, rank_metric, min_year=-1):
-
-        filters = []
-        if min_year > 0:
-            filters = [lambda doc: doc.publication_year < int(min_year)]
-
-        scores, filter_docs = self.filter_documents(results, filters)
-
-        docs_agg_scores = dict()
-        for score, doc in zip(scores, filter_docs):
-            if not doc in docs_agg_scores:
-                docs_agg_scores[doc] = {'scores': [], 'phrases': []}
-            docs_agg_scores[doc]['scores'].append(score)
-            docs_agg_scores[doc]['phrases'].append(doc.phrases)
-
-        print(f"Corpus: Found {len(docs_agg_scores)} different documents.")
-        docs_agg_scores_r = [{
-            'rank_score': self.rankScores(values['scores'], rank_metric),
-            'doc_scores': values['scores'],
-            'doc_phrases': values['phrases'],
-            'nb_hits': len(values['scores']),
-            'metadata': doc.metadata,
-            'doc': doc
-            }
-                for doc, values in docs_agg_scores.items()]
-
-        return self.sortAndRankResults(docs_agg_scores_r)
-
-
-    def retrieveAuthors(self, query, top_k, score_threshold, rank_metric, min_year=-1):
-        return self.sortFilterAndFormatAuthorsResults(
-            self.index.retrieve(query, top_k, score_threshold),
-            rank_metric,
-            min_year)
+        if rank_metric == 'log-mean':
+            return np.log(1+counts) * means, counts
+        elif rank_metric == 'sigmoid-mean':
+            return 1/(1+np.exp(-0.5 * counts)) * means, counts
+        return means, counts
 
-    def retrieveDocuments(self, query, top_k, score_threshold, rank_metric, min_year):
+    def aggregateResults(self, positions, scores, matrix, rank_metric, limit):
+        """
+        Aggregate the scores of the retrieved documents per column of the
+        document to group `matrix` and select the `limit` best groups.
+        Returns the selected groups in rank order, their rank scores, for
+        each of them the indices of its hits in the results, and the number
+        of groups found.
+        """
+        hits = matrix[positions].tocoo()
+        hit_idx, groups = hits.row, hits.col
+        nb_groups = matrix.shape[1]
+
+        rank_scores, counts = self.rankScores(
+            scores[hit_idx], groups, nb_groups, rank_metric)
+        first_hits = np.full(nb_groups, len(positions))
+        np.minimum.at(first_hits, groups, hit_idx)
+
+        found = np.flatnonzero(counts)
+        nb_found = len(found)
+        if limit is not None and limit < len(found):
+            # the groups tied with the last selected one are ordered below
+            kth = np.partition(-rank_scores[found], limit-1)[limit-1]
+            found = found[-rank_scores[found] <= kth]
+        # tied groups are ranked by their first hit in the results
+        selected = found[
+            np.lexsort((first_hits[found], -rank_scores[found]))][:limit]
+
+        # hits of the selected groups, in results order
+        order = np.lexsort((hit_idx, groups))
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        selected_hits = [
+            hit_idx[order[starts[g]: starts[g+1]]] for g in selected]
+
+        return selected, rank_scores[selected], selected_hits, nb_found
+
+    def sortFilterAndFormatAuthorsResults(
+        self, results, rank_metric, limit=None):
+
+        positions, scores = self.resultsArrays(results)
+        authors, rank_scores, hits, nb_found = self.aggregateResults(
+            positions, scores, self.docAuthorMatrix, rank_metric, limit)
+
+        print(f"Corpus: found {nb_found} different authors.")
+
+        return [{
+            'author': self.authors[a],
+            'rank_score': float(rank_score),
+            'docs_scores': scores[h].tolist(),
+            'nb_hits': len(h),
+            'docs': [self.documents[p] for p in positions[h]],
+            'rank': k
+        } for k, (a, rank_score, h) in enumerate(zip(authors, rank_scores, hits))]
+
+
+    def sortFilterAndFormatDocsResults(
+        self, results, rank_metric, limit=None):
+
+        positions, scores = self.resultsArrays(results)
+        halDocs, rank_scores, hits, nb_found = self.aggregateResults(
+            positions, scores, self.docHalMatrix, rank_metric, limit)
+
+        print(f"Corpus: Found {nb_found} different documents.")
+
+        res = []
+        for k, (rank_score, h) in enumerate(zip(rank_scores, hits)):
+            docs = [self.documents[p] for p in positions[h]]
+            res.append({
+                'rank_score': float(rank_score),
+                'doc_scores': scores[h].tolist(),
+                'doc_phrases': [doc.phrases for doc in docs],
+                'nb_hits': len(h),
+                'doc': docs[0],
+                'rank': k
+            })
+        return res
+
+
+    authorsMethods = ['aggregate', 'profiles']
+
+    def retrieveAuthors(
+        self, query, top_k, score_threshold, rank_metric, min_year=-1,
+        limit=None, method='aggregate'):
+        return self.retrieveAuthorsBatch(
+            [query], top_k, [score_threshold], [rank_metric], [min_year],
+            [limit], [method])[0]
+
+    def retrieveDocuments(
+        self, query, top_k, score_threshold, rank_metric, min_year,
+        limit=None):
         return self.sortFilterAndFormatDocsResults(
-            self.index.retrieve(query, top_k, score_threshold),
+            self.index.retrieve(
+                query, top_k, score_threshold, self.getYearFilter(min_year)),
             rank_metric,
-            min_year)
+            limit)
+
+    def retrieveAuthorsBatch(
+        self, queries, top_k, score_thresholds, rank_metrics, min_years,
+        limits=None, methods=None):
+        """
+        Authors results of several queries, found by aggregating the
+        retrieved documents scores per author (`aggregate` method) or by
+        searching the author profiles (`profiles` method).
+        """
+        if limits is None:
+            limits = [None] * len(queries)
+        if methods is None:
+            methods = ['aggregate'] * len(queries)
+        for method in methods:
+            if not method in self.authorsMethods:
+                raise ValueError(
+                    f"Invalid authors method `{method}`, "
+                    f"must be one of {self.authorsMethods}")
+        if 'profiles' in methods and self.profiles is None:
+            raise ValueError(f"Author profiles are not enabled.")
+
+        res = [None] * len(queries)
+        aggregated = [n for n, m in enumerate(methods) if m == 'aggregate']
+        if aggregated:
+            results = self.index.retrieveBatch(
+                [queries[n] for n in aggregated], top_k,
+                [score_thresholds[n] for n in aggregated],
+                [self.getYearFilter(min_years[n]) for n in aggregated])
+            for n, r in zip(aggregated, results):
+                res[n] = self.sortFilterAndFormatAuthorsResults(
+                    r, rank_metrics[n], limits[n])
+
+        profiled = [n for n, m in enumerate(methods) if m == 'profiles']
+        if profiled:
+            query_embeddings = self.index.encodeQueries(
+                [queries[n] for n in profiled])
+            for n, query_embedding in zip(profiled, query_embeddings):
+                limit = limits[n] if limits[n] is not None else len(self.authors)
+                res[n] = self.profiles.retrieve(
+                    query_embedding, score_thresholds[n],
+                    self.getYearFilter(min_years[n]), limit)
+            print(f"Corpus: retrieved authors profiles for {len(profiled)} queries.")
+        return res
+
+    def retrieveDocumentsBatch(
+        self, queries, top_k, score_thresholds, rank_metrics, min_years,
+        limits=None):
+        results = self.index.retrieveBatch(
+            queries, top_k, score_thresholds,
+            [self.getYearFilter(min_year) for min_year in min_years])
+        if limits is None:
+            limits = [None] * len(queries)
+        return [
+            self.sortFilterAndFormatDocsResults(r, rank_metric, limit)
+                for r, rank_metric, limit in zip(results, rank_metrics, limits)]
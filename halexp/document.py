@@ -1,4 +1,4 @@
-from .author import Author
+import hashlib
 
 
 class Document:
@@ -6,35 +6,16 @@ class Document:
     Object representing a piece of text (i.e.: a serie of phrases)
     to be embedded together with the metadatq from the HAL document
     to wich it belongs to.
-    """
-
-    def __init__(self, phrases, max_length, **kwargs):
-        """
 
-        include_title [boolean]: wheter to include or not the title of HAL
-        document in the text to be embedded.
-
-        include_author [boolean]: wheter to include or not the author
-        (first name and last name) of HAL document in the text to be embedded.
+    It is a lightweight view on the position of the document in a
+    `DocumentStore`, where its data is stored.
+    """
 
-        include_keywords [boolean]: wheter to include or not the keywords of
-        the HAL document in the text to be embedded.
+    __slots__ = ('store', 'position')
 
-        """
-        self.metadata = {}
-        self.title = None
-        self.publication_date = -1
-        self.year = -1
-        self.uri = ""
-        self.halId = ""
-        self.authors = []
-        self.keywords = []
-        self.open_acces = None
-        self.subtitle = ""
-        self.phrases = []
-
-        self.max_length = max_length
-        self.setPhrases(phrases)
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
 
     def __str__(self):
         _str = f"{self.title}\n\t{self.publication_date}\n\t{self.halId}"
@@ -49,56 +30,74 @@ class Document:
     def __hash__(self):
         return hash(self.halId+self.title)
 
-    def setPhrases(self, phrases):
-        l0 = len(phrases)
-        if l0 > self.max_length:
-            m = f"Document: crop phrases from ({l0})"
-            m += f" to max number ({self.max_length})."
-            # print(m)
-            phrases = phrases[:self.max_length]
-        self.phrases = phrases
+    @property
+    def record(self):
+        return self.store.records[self.position]
 
-    def setMetadata(self, metadata):
-        self.metadata = metadata
+    @property
+    def phrases(self):
+        return list(self.store.phrases[self.position])
 
-    def setTitle(self, title):
-        self.title = title+'.'
+    @property
+    def chunk(self):
+        return int(self.store.chunks[self.position])
 
-    def setUri(self, uri):
-        self.uri = uri
+    @property
+    def metadata(self):
+        return self.store.metadata[self.record]
 
-    def setHalId(self, halId):
-        self.halId = halId
+    @property
+    def metadataJson(self):
+        return self.store.getMetadataJson(self.record)
 
-    def setSubtitle(self, subtitle):
-        self.subtitle = subtitle
+    @property
+    def halId(self):
+        return self.store.halIds[self.record]
 
-    def setOpenAccess(self, open_access):
-        self.open_acces = open_access
+    @property
+    def title(self):
+        return self.metadata["title_s"][0]+'.'
 
-    def setPublicationDate(self, publication_date):
-        self.publication_date = publication_date
-        self.publication_year = int(publication_date.split('-')[0])
+    @property
+    def uri(self):
+        return self.metadata["uri_s"]
 
-    def setKeywords(self, keywords):
-        self.keywords = keywords
+    @property
+    def subtitle(self):
+        return self.metadata["subtitle_s"]
 
-    def setAuthors(self, authorsData):
-        self.authors = [
-        Author(
-            authFullNameId,
-            data['authId_i'],
-            data['authFullName_s'],
-            data['authPrimStrucId'],
-            data['authPrimStrucName'],
-                    ) for authFullNameId, data in authorsData.items()]
+    @property
+    def keywords(self):
+        return self.metadata["keyword_s"]
 
-    def setAuthLastName(self, authLastName):
-        self.authLastName = authLastName
+    @property
+    def open_acces(self):
+        return bool(self.store.openAccess[self.record])
+
+    @property
+    def publication_date(self):
+        return self.metadata["publicationDate_s"]
+
+    @property
+    def publication_year(self):
+        return int(self.store.years[self.record])
+
+    @property
+    def authors(self):
+        return self.store.getRecordAuthors(self.record)
 
     def getHalId(self):
         return self.halId
 
+    def getLabel(self):
+        """
+        Stable integer id of the document derived from its halId and chunk
+        number, used as label in the index.
+        """
+        digest = hashlib.blake2b(
+            f"{self.halId}|{self.chunk}".encode('utf-8'), digest_size=8)
+        return int.from_bytes(digest.digest(), 'little') >> 1
+
     def getAuthors(self):
         return self.authors
 
@@ -109,4 +108,4 @@ class Document:
         return [a.fullName for a in self.authors]
 
     def getPhrasesForEmbedding(self):
-        return ' '.join(self.phrases)
+        return ' '.join(self.store.phrases[self.position])
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+from .dump import DumpWriter
+
+
+def makeSession(pool_size=8, retries=5, backoff=1.):
+    """
+    HTTP session keeping up to `pool_size` connections alive, retrying the
+    failed requests (connection errors, 429 and 5xx responses) with an
+    exponential backoff.
+    """
+    retry = Retry(
+        total=retries, backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class DocidRange:
+    """
+    Documents of the query whose docid is between `start` and `end`
+    (included), downloaded page by page with `cursorMark`. The documents are
+    appended to a part file and the progress (cursor and size of the part
+    file after the last complete page) is checkpointed after each page.
+    """
+
+    def __init__(self, number, start, end, path):
+        self.number = number
+        self.start = start
+        self.end = end
+        self.path = path
+        self.statePath = path + '.state.json'
+        self.cursorMark = '*'
+        self.size = 0
+        self.nb_docs = 0
+        self.nb_found = None
+        self.done = False
+        self.loadState()
+
+    def __str__(self):
+        return f"range {self.number} (docid {self.start} to {self.end})"
+
+    @property
+    def filter(self):
+        return f"docid:[{self.start} TO {self.end}]"
+
+    def getState(self):
+        return {
+            'start': self.start, 'end': self.end,
+            'cursorMark': self.cursorMark, 'size': self.size,
+            'nb_docs': self.nb_docs, 'nb_found': self.nb_found,
+            'done': self.done}
+
+    def loadState(self):
+        if not os.path.exists(self.statePath):
+            return
+        with open(self.statePath) as f:
+            state = json.load(f)
+        if (state['start'], state['end']) != (self.start, self.end):
+            return
+        if not os.path.exists(self.path) or \
+                os.path.getsize(self.path) < state['size']:
+            return
+        self.cursorMark = state['cursorMark']
+        self.size = state['size']
+        self.nb_docs = state['nb_docs']
+        self.nb_found = state['nb_found']
+        self.done = state['done']
+
+    def saveState(self):
+        tmp_path = self.statePath + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.getState(), f)
+        os.replace(tmp_path, self.statePath)
+
+    def download(self, fetch):
+        """
+        Download the remaining pages of the range, `fetch(filter, cursorMark)`
+        returning the json response of a page.
+        """
+        if self.done:
+            return
+        with open(self.path, 'ab') as f:
+            # drop a page written after the last checkpoint
+            f.truncate(self.size)
+            while not self.done:
+                res = fetch(self.filter, self.cursorMark)
+                docs = res['response']['docs']
+                for doc in docs:
+                    f.write((json.dumps(doc) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+                self.size = f.tell()
+                self.nb_docs += len(docs)
+                self.nb_found = res['response']['numFound']
+                self.done = res['nextCursorMark'] == self.cursorMark
+                self.cursorMark = res['nextCursorMark']
+                self.saveState()
+
+    def iterDocs(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class Downloader:
+    """
+    Download the documents of a HAL query to a dump. The query is split
+    into `num_ranges` ranges of docids downloaded concurrently by
+    `concurrency` threads over a pooled session, each range being paged
+    with `cursorMark`. The progress of each range is checkpointed in the
+    `<dump_file>.ranges` directory, so that an interrupted download resumes
+    where it stopped when it is run again with the same query and fields.
+    The ranges are then concatenated in docid order to the dump.
+    """
+
+    def __init__(
+        self, baseUrl, portail, query, fields, dump_file, pagination_count,
+        num_ranges=8, concurrency=4, retries=5, backoff=1., timeout=60):
+        self.url = f"{baseUrl}/search/{portail}/"
+        self.query = query
+        self.fields = fields
+        self.dumpFile = dump_file
+        self.rows = pagination_count
+        self.numRanges = num_ranges
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.checkpointPath = dump_file + '.ranges'
+        self.session = makeSession(
+            pool_size=concurrency, retries=retries, backoff=backoff)
+        self.printLock = threading.Lock()
+
+    def get(self, **params):
+        params = dict(params, q=self.query, wt='json')
+        x = self.session.get(self.url, params=params, timeout=self.timeout)
+        if not x.ok:
+            raise ValueError(f"Failed query: {x}")
+        res = x.json()
+        if 'error' in res:
+            raise ValueError(res['error'])
+        return res
+
+    def fetchPage(self, filter, cursorMark):
+        return self.get(
+            fq=filter, fl=','.join(self.fields), rows=self.rows,
+            sort='docid asc', cursorMark=cursorMark)
+
+    def getDocid(self, order):
+        res = self.get(fl='docid', rows=1, sort=f'docid {order}')
+        docs = res['response']['docs']
+        return int(docs[0]['docid']) if docs else None
+
+    def getManifest(self):
+        return {'url': self.url, 'query': self.query, 'fields': self.fields}
+
+    def prepareCheckpoint(self):
+        """
+        Checkpoint directory of the download, emptied if it was written by
+        a download of another query.
+        """
+        manifestPath = os.path.join(self.checkpointPath, 'manifest.json')
+        if os.path.exists(manifestPath):
+            with open(manifestPath) as f:
+                if json.load(f) == self.getManifest():
+                    return
+            print(f"Download: discarding the checkpoint of another query.")
+            for filename in os.listdir(self.checkpointPath):
+                os.remove(os.path.join(self.checkpointPath, filename))
+        os.makedirs(self.checkpointPath, exist_ok=True)
+        with open(manifestPath, 'w') as f:
+            json.dump(self.getManifest(), f)
+
+    def getRanges(self):
+        """
+        Split the docids of the query in ranges of equal width. The bounds
+        are saved with the checkpoint so that a resumed download keeps the
+        same ranges, the first and last ones being open to cover the
+        documents added meanwhile.
+        """
+        rangesPath = os.path.join(self.checkpointPath, 'ranges.json')
+        if os.path.exists(rangesPath):
+            with open(rangesPath) as f:
+                bounds = json.load(f)
+        else:
+            first, last = self.getDocid('asc'), self.getDocid('desc')
+            if first is None:
+                bounds = []
+            else:
+                step = max(1, -(-(last - first + 1) // self.numRanges))
+                bounds = [
+                    [start, min(start + step - 1, last)]
+                    for start in range(first, last + 1, step)]
+                bounds[0][0] = '*'
+                bounds[-1][1] = '*'
+            with open(rangesPath, 'w') as f:
+                json.dump(bounds, f)
+
+        return [
+            DocidRange(
+                n, start, end,
+                os.path.join(self.checkpointPath, f"range_{n}.jsonl"))
+                for n, (start, end) in enumerate(bounds)]
+
+    def downloadRange(self, docidRange):
+        if docidRange.done:
+            return
+        docidRange.download(self.fetchPage)
+        with self.printLock:
+            print(
+                f"Download: {docidRange} done, {docidRange.nb_docs} documents.")
+
+    def run(self):
+        """
+        Download the query to the dump and remove the checkpoint.
+        """
+        start = time.time()
+        self.prepareCheckpoint()
+        ranges = self.getRanges()
+        resumed = [r for r in ranges if r.nb_docs > 0]
+        print(
+            f"Download: {len(ranges)} ranges of docids, {len(resumed)} "
+            f"resumed with {sum(r.nb_docs for r in resumed)} documents.")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # on error the other ranges are still downloaded and checkpointed
+            for future in [executor.submit(self.downloadRange, r) for r in ranges]:
+                future.result()
+
+        nb_found = sum(r.nb_found for r in ranges)
+        with DumpWriter(self.dumpFile) as dump:
+            for r in ranges:
+                dump.write(r.iterDocs())
+        if dump.nb_docs != nb_found:
+            print(
+                f"Download: {dump.nb_docs} documents written, {nb_found} "
+                f"found by HAL (documents changed during the download).")
+
+        for filename in os.listdir(self.checkpointPath):
+            os.remove(os.path.join(self.checkpointPath, filename))
+        os.rmdir(self.checkpointPath)
+        print(
+            f"Download: {dump.nb_docs} documents downloaded in "
+            f"{time.time() - start:.1f}s.")
+        return dump.nb_docs
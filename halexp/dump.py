@@ -0,0 +1,88 @@
+import os
+import gzip
+import json
+
+
+def openDump(path, mode='r'):
+    """
+    Open a HAL dump file in text mode, gzip or zstd compressed according to
+    its extension (`.gz` or `.zst`).
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode+'t', encoding='utf-8')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                f"The zstandard package is required to read or write {path}.")
+        return zstandard.open(path, mode+'t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def isJsonLines(path):
+    """
+    Whether the dump is in JSON Lines format (`.jsonl`, optionally followed
+    by a compression extension) or is a single JSON array.
+    """
+    base, ext = os.path.splitext(path)
+    if ext in ['.gz', '.zst']:
+        base, ext = os.path.splitext(base)
+    return ext == '.jsonl'
+
+
+def iterDump(path):
+    """
+    Yield the HAL documents of a dump one at a time. JSON Lines dumps are
+    streamed, JSON array dumps have to be loaded at once.
+    """
+    with openDump(path) as f:
+        if isJsonLines(path):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+class DumpWriter:
+    """
+    Write HAL documents to a dump as they arrive. The dump is written to a
+    temporary file which is renamed when closed, so that an interrupted
+    download never leaves a truncated dump behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # same extensions as the dump for openDump to compress it alike
+        self.tmp_path = os.path.join(
+            os.path.dirname(path), '.part.' + os.path.basename(path))
+        self.jsonLines = isJsonLines(path)
+        self.nb_docs = 0
+        self.file = openDump(self.tmp_path, 'w')
+        if not self.jsonLines:
+            self.file.write('[')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write(self, docs):
+        for doc in docs:
+            if self.jsonLines:
+                self.file.write(json.dumps(doc) + '\n')
+            else:
+                self.file.write((',' if self.nb_docs else '') + json.dumps(doc))
+            self.nb_docs += 1
+
+    def close(self):
+        if not self.jsonLines:
+            self.file.write(']')
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
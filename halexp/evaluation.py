@@ -0,0 +1,116 @@
+import os
+import time
+import tempfile
+import hnswlib
+import numpy as np
+
+
+def topK(scores, k):
+    """
+    Columns and values of the k largest scores of each row, sorted by
+    decreasing scores.
+    """
+    best = np.argpartition(-scores, k-1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return (
+        np.take_along_axis(best, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1))
+
+
+def exactSearch(embeddings, queries, k, candidates=None, batch_size=64):
+    """
+    Exact search of the k nearest neighbours of normalized `queries` among
+    the normalized `embeddings` (cosine similarity), optionally restricted
+    to the `candidates` rows, by batches of queries.
+    Returns the rows and scores of the neighbours, sorted by decreasing
+    scores, as arrays of shape (len(queries), k).
+    """
+    if candidates is not None:
+        embeddings = embeddings[candidates]
+    embeddings = np.asarray(embeddings)
+
+    ids, scores = [], []
+    for b in range(0, len(queries), batch_size):
+        best, best_scores = topK(queries[b: b+batch_size] @ embeddings.T, k)
+        ids.append(best)
+        scores.append(best_scores)
+    ids = np.concatenate(ids) if ids else np.zeros((0, k), dtype=np.int64)
+    scores = np.concatenate(scores) if scores else np.zeros((0, k))
+
+    if candidates is not None:
+        ids = candidates[ids]
+    return ids, scores
+
+
+def exactTopK(embeddings, queries, k, batch_size=64):
+    """
+    Exact k nearest neighbours of normalized `queries` among normalized
+    `embeddings` (cosine similarity), computed by batches of queries.
+    Returns an array of shape (len(queries), k) of row indices sorted by
+    decreasing similarity.
+    """
+    return exactSearch(embeddings, queries, k, batch_size=batch_size)[0]
+
+
+def recallAtK(approx_ids, exact_ids):
+    """
+    Mean fraction of the exact neighbours found by the approximate search,
+    each row of the arguments being the ids returned for one query.
+    """
+    return float(np.mean([
+        len(set(a).intersection(e)) / len(e)
+            for a, e in zip(approx_ids, exact_ids) if len(e) > 0]))
+
+
+def benchmarkHnsw(
+    data, queries, exact_ids, space, M, ef_construction, num_threads, efs,
+    top_ks):
+    """
+    Build an HNSW index over `data` and measure its query performance for
+    every query time ef and k. `exact_ids` are the exact neighbours of the
+    queries (at least max(top_ks) of them).
+    Returns one dict of measures per (ef, k) pair.
+    """
+    index = hnswlib.Index(space=space, dim=data.shape[1])
+    index.init_index(
+        max_elements=len(data), M=M, ef_construction=ef_construction)
+    index.set_num_threads(num_threads)
+
+    start_time = time.perf_counter()
+    index.add_items(data, np.arange(len(data)))
+    build_time = time.perf_counter() - start_time
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'benchmark.index')
+        index.save_index(path)
+        index_size = os.path.getsize(path)
+
+    rows = []
+    for ef in efs:
+        index.set_ef(ef)
+        for k in top_ks:
+            latencies = []
+            for query in queries:
+                start_time = time.perf_counter()
+                index.knn_query(query, k=k, num_threads=1)
+                latencies.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            ids, _ = index.knn_query(queries, k=k, num_threads=num_threads)
+            batch_time = time.perf_counter() - start_time
+
+            rows.append({
+                'M': M,
+                'ef_construction': ef_construction,
+                'num_threads': num_threads,
+                'ef': ef,
+                'top_k': k,
+                'build_time_s': build_time,
+                'index_size_bytes': index_size,
+                'latency_p50_ms': 1000 * float(np.percentile(latencies, 50)),
+                'latency_p99_ms': 1000 * float(np.percentile(latencies, 99)),
+                'qps': len(queries) / batch_time,
+                'recall': recallAtK(ids, exact_ids[:, :k]),
+            })
+    return rows
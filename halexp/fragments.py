@@ -0,0 +1,52 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson >= 3.9 inserts pre-encoded JSON values (the metadata of the
+# documents) in the responses without decoding and encoding them again
+canSplice = orjson is not None and hasattr(orjson, 'Fragment')
+
+
+def encodeMetadata(metadata):
+    """
+    Compact JSON encoding (bytes, sorted keys) of the metadata of a HAL
+    document, as stored in the snapshot.
+    """
+    if orjson is not None:
+        return orjson.dumps(metadata, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        metadata, ensure_ascii=False, sort_keys=True,
+        separators=(',', ':')).encode('utf-8')
+
+
+def makeFragment(encoded):
+    return orjson.Fragment(encoded)
+
+
+def defaultEncoder(obj):
+    # NumPy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj):
+        """
+        JSON encoding (bytes) of a response, keys sorted like `jsonify`.
+        """
+        return orjson.dumps(
+            obj, default=defaultEncoder,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY |
+                orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj):
+        """
+        JSON encoding (bytes) of a response, keys sorted like `jsonify`.
+        """
+        return json.dumps(
+            obj, ensure_ascii=False, sort_keys=True, separators=(',', ':'),
+            default=defaultEncoder).encode('utf-8')
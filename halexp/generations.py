@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import hashlib
+import threading
+import traceback
+import subprocess
+
+from .index import Index
+from .corpus import Corpus
+from .batching import isGeventPatched
+
+
+def runInBackground(target):
+    """
+    Run `target` in a background thread (a greenlet under gevent).
+    """
+    threading.Thread(target=target, daemon=True).start()
+
+
+def runBlocking(target, *args):
+    """
+    Run the CPU bound `target`, in the gevent threadpool under gevent so
+    that the event loop keeps serving requests meanwhile.
+    """
+    if isGeventPatched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(target, args)
+    return target(*args)
+
+
+def readMarker(path):
+    """
+    Generation number stored in the marker file (0 if there is none).
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)['generation']
+
+
+def writeMarker(path, generation):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'generation': generation, 'updated': time.time()}, f)
+    os.replace(tmp_path, path)
+    print(f"Generations: marker {path} set to generation {generation}.")
+
+
+def acquireBuildLock(marker_path):
+    """
+    Take the exclusive lock of the index build, held while `create_index.py`
+    writes the index, snapshot and marker (until the returned file is
+    closed or the process exits). Raises `BlockingIOError` if another build
+    holds it.
+    """
+    lock = open(marker_path + '.lock', 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise
+    return lock
+
+
+def getBuildId(index, manifest):
+    """
+    Hash of the build of a generation: the index mapping (labels and texts
+    hashes of the chunks) and the manifest of the corpus (dump and
+    parameters), the same in every process loading them.
+    """
+    digest = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode())
+    with open(index.mappingPath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class Generation:
+    """
+    An `Index` and `Corpus` pair served together. Its `id` (number of the
+    marker and hash of the build) identifies it in the caches, ETags and
+    cursors: two loads share a number when the index was rebuilt without
+    bumping the marker, but not an id.
+    """
+
+    def __init__(self, number, index, corpus, build_id):
+        self.number = number
+        self.id = f"{number}.{build_id}"
+        self.index = index
+        self.corpus = corpus
+        self.loaded = time.time()
+
+
+class GenerationManager:
+    """
+    Keep serving the current generation while the next one is loaded (from
+    the index and snapshot on disk) in the background, and swap them once it
+    is ready.
+
+    The number of the last generation built is stored in a marker file:
+    each process watching it (see `startWatching`) loads the new generation
+    when the number changes, e.g. after `create_index.py`. A rebuild from
+    the dump runs `create_index.py` in a separate process, so that the
+    files shared by the workers are written by a single build holding the
+    build lock.
+    """
+
+    buildScript = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'create_index.py')
+
+    def __init__(
+            self, params, marker_path=None, poll_interval=60,
+            defer_inference=False):
+        self.params = params
+        # the first generation of a preloaded app is loaded before the fork
+        self.deferInference = defer_inference
+        self.markerPath = marker_path
+        self.pollInterval = poll_interval
+        self.lock = threading.Lock()
+        self.reloading = False
+        self.lastReload = None
+        self.watcherPid = None
+        self.current = None
+        self.current = self.createGeneration(readMarker(self.markerPath))
+
+    def createGeneration(self, number):
+        """
+        Load a generation from the index and snapshot on disk (read-only, a
+        ValueError being raised if they are missing), reusing the models of
+        the current one.
+        """
+        indexParams = dict(self.params['index'])
+        if self.current is not None:
+            indexParams['model_from'] = self.current.index
+        else:
+            indexParams['defer_inference'] = self.deferInference
+        index = Index(**indexParams)
+        corpusParams = self.params['corpus']
+        # the index files are written by create_index.py only
+        corpus = Corpus(index=index, read_only=True, **corpusParams)
+
+        buildId = getBuildId(
+            index, corpus.getSnapshotManifest(corpusParams['dump_file']))
+        generation = Generation(number, index, corpus, buildId)
+        print(f"Generations: generation {generation.id} ready.")
+        return generation
+
+    def reload(self, rebuild=False):
+        """
+        Start loading (or rebuilding) a new generation in the background.
+        Returns False if a reload is already running.
+        """
+        with self.lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+        runInBackground(lambda: self.runReload(rebuild))
+        return True
+
+    def runBuild(self):
+        """
+        Build the index and snapshot from the dump with `create_index.py`,
+        which bumps the marker so that the other processes load them too.
+        """
+        build = subprocess.run(
+            [sys.executable, self.buildScript],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if build.returncode != 0:
+            raise RuntimeError(
+                f"create_index.py failed ({build.returncode}): "
+                f"{build.stdout[-1000:]}")
+
+    def runReload(self, rebuild):
+        start = time.time()
+        status = {'rebuild': rebuild, 'started': start}
+        try:
+            if rebuild:
+                self.runBuild()
+            generation = runBlocking(
+                self.createGeneration, readMarker(self.markerPath))
+            # requests started before the swap finish with the previous one
+            self.current = generation
+            status.update({
+                'status': 'done', 'generation': generation.number,
+                'generation_id': generation.id})
+        except Exception as e:
+            traceback.print_exc()
+            status.update({'status': 'failed', 'error': repr(e)})
+        finally:
+            status['duration'] = time.time() - start
+            self.lastReload = status
+            self.reloading = False
+
+    def startWatching(self):
+        """
+        Watch the marker file in a background thread (once per process, the
+        threads do not survive a fork). Under gevent it must be called once
+        threading is patched, in the worker (see gunicorn.conf.py).
+        """
+        if not self.markerPath or self.watcherPid == os.getpid():
+            return
+        self.watcherPid = os.getpid()
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def watch(self):
+        while True:
+            time.sleep(self.pollInterval)
+            try:
+                number = readMarker(self.markerPath)
+            except (OSError, ValueError, KeyError):
+                continue
+            if number != self.current.number and not self.reloading:
+                print(f"Generations: marker changed to generation {number}.")
+                self.reload()
+
+    def status(self):
+        return {
+            'generation': self.current.number,
+            'generation_id': self.current.id,
+            'loaded': self.current.loaded,
+            'nb_documents': len(self.current.corpus.documents),
+            'reloading': self.reloading,
+            'last_reload': self.lastReload,
+        }
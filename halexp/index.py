@@ -1,10 +1,23 @@
 import os
+import json
 import time
-import hnswlib
+import hashlib
+from collections import OrderedDict
+import numpy as np
 from tqdm import tqdm
 
+import torch
 from sentence_transformers import SentenceTransformer
 
+from .backends import createBackend
+from .batching import BatchEncoder
+from .cache import EmbeddingCache, QueryCache
+from .evaluation import exactTopK, recallAtK
+
+
+def getArtifactPath(index_path, suffix):
+    return os.path.splitext(index_path)[0] + suffix
+
 
 def setIndexPath(params):
     indexPath = f"{params['corpus']['portail']}_"
@@ -22,20 +35,37 @@ def setIndexPath(params):
     return indexPath
 
 
+def hashText(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def quantizeModel(model):
+    """
+    Copy of a model whose linear layers are dynamically quantized to int8,
+    for faster CPU inference.
+    """
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
 class Index:
     """
     This class index the phrases of a corpus documents using a sentence bert
-    model and Hierarchical Navigable Small World graphs (HNSW).
+    model and a search backend, Hierarchical Navigable Small World graphs
+    (HNSW) or exact search (see `backends`).
     """
 
     halCorpus = None
 
-    embeddings = []
+    embeddings = None
     embedding_size = 512
     model_name = 'distiluse-base-multilingual-cased-v1'
 
     space = 'cosine'
-    index = None
+    backend = None
+
+    # query time ef tried by the calibration, as factors of k
+    efFactors = [1, 1.25, 1.5, 2, 3, 4, 6, 8, 12, 16]
 
     def __init__(
         self,
@@ -47,6 +77,20 @@ class Index:
         batch_size,
         sentence_transformer_model,
         sentence_transformer_model_dim,
+        embedding_cache=None,
+        query_cache_size=0,
+        query_cache_path=None,
+        ef=None,
+        backend='auto',
+        exact_max_elements=20000,
+        storage_dtype='float32',
+        rescore_factor=4,
+        batching=None,
+        query_encoder='default',
+        min_encoder_agreement=0.99,
+        encoder_validation_size=200,
+        defer_inference=False,
+        model_from=None,
         **kwargs):
 
         """
@@ -56,45 +100,402 @@ class Index:
         M - is tightly connected with internal dimensionality of the data.
         Strongly affects memory consumption (~M)
         Higher M leads to higher accuracy/run_time at fixed ef/efConstruction
+
+        embedding_cache - path of the SQLite database caching the embeddings
+        of the documents, shared between builds (disabled if None)
+
+        query_cache_size - maximum number of queries embeddings kept in memory
+        (disabled if 0), query_cache_path - where to save them (optional)
+
+        ef - size of the dynamic candidates list at query time, overrides the
+        value calibrated for the index (see `calibrateEf`)
+
+        backend - search backend, `hnsw`, `exact` (brute-force search over the
+        stored embeddings) or `auto` to use the exact search when the corpus
+        has at most `exact_max_elements` documents
+
+        storage_dtype - `float32`, or `float16`/`int8` to generate the exact
+        backend candidates with quantized embeddings, `rescore_factor` times
+        the number of results being rescored with the float32 embeddings
+
+        batching - micro-batching of the concurrent queries encoding, dict of
+        `BatchEncoder` parameters (disabled if None or not `enabled`)
+
+        query_encoder - `default`, or `quantized` to encode the queries with
+        a dynamically int8-quantized copy of the model, the documents being
+        always encoded with the model. The quantized encoder must reach a
+        mean cosine agreement of `min_encoder_agreement` with the stored
+        embeddings of `encoder_validation_size` documents.
+
+        defer_inference - do not run the model when creating the index, e.g.
+        in the process preloading the app before forking the workers: the
+        query encoder is then checked by `checkDeferredQueryEncoder`
+
+        model_from - index whose models and query cache are reused, if it
+        has the same model and query encoder (e.g. when reloading the index)
         """
 
 
         self.model_name = sentence_transformer_model
         self.embedding_size = sentence_transformer_model_dim
+        self.queryEncoder = query_encoder
+        self.minEncoderAgreement = min_encoder_agreement
+        self.encoderValidationSize = encoder_validation_size
+        self.deferInference = defer_inference
+        self.uncheckedDocuments = None
 
         self.length = -1
         self.space = hnswlib_space
         self.num_threads = num_threads
         self.path = index_path
+        self.embeddingsPath = self.getArtifactPath('.embeddings.npy')
+        self.mappingPath = self.getArtifactPath('.ids.json')
+        self.paramsPath = self.getArtifactPath('.params.json')
+        self.labels = None
+        self.positions = {}
         self.indexKwargs = {'M': M, 'ef_construction': ef_construction}
+        self.ef = ef
+        self.indexParams = {}
+        self.backendName = backend
+        self.exactMaxElements = exact_max_elements
+        self.storageDtype = storage_dtype
+        self.rescoreFactor = rescore_factor
 
         self.batch_size = batch_size
 
-        self.loadModel()
+        # opened while documents are embedded only, so that the serving
+        # processes (forked from the preloaded app) do not share a connection
+        self.embeddingCachePath = embedding_cache
+        self.cache = None
+
+        self.queryCache = None
+        self.queryCachePath = query_cache_path
+        if query_cache_size > 0:
+            self.queryCache = QueryCache(
+                query_cache_size, f"{self.model_name}:{self.queryEncoder}")
+
+        a1 = model_from is not None and model_from.model_name == self.model_name
+        if a1 and model_from.queryEncoder == self.queryEncoder:
+            self.model = model_from.model
+            self.queryModel = model_from.queryModel
+            if self.queryCache is not None and model_from.queryCache is not None:
+                self.queryCache = model_from.queryCache
+        else:
+            self.loadModel()
+
+        self.batchEncoder = None
+        if batching is not None and batching.get('enabled', True):
+            self.batchEncoder = BatchEncoder(self.encodeQueryTexts, **batching)
 
     def __str__(self):
-        _str = f"HNSW index: embedding_size {self.embedding_size}"
+        _str = f"Index: embedding_size {self.embedding_size}"
         _str += f" | length {self.length}"
+        if self.backend is not None:
+            _str += f" | backend {self.backend.name}"
         return _str
 
     def loadModel(self):
         self.model = SentenceTransformer(self.model_name)
+        self.loadQueryModel(self.queryEncoder)
+
+    def loadQueryModel(self, query_encoder):
+        if query_encoder == 'default':
+            self.queryModel = self.model
+        elif query_encoder == 'quantized':
+            self.queryModel = quantizeModel(self.model)
+            print(f"Index: queries encoded with int8 quantized {self.model_name}.")
+        else:
+            raise ValueError(
+                f"Invalid query encoder `{query_encoder}`, "
+                f"must be one of ['default', 'quantized']")
+        self.queryEncoder = query_encoder
 
-    def embedData(self, documents):
+    def getArtifactPath(self, suffix):
+        """
+        Path of a file stored next to the HNSW index, e.g. the embeddings.
+        """
+        return getArtifactPath(self.path, suffix)
+
+    def normalize(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+    def encode(self, texts):
+        return self.normalize(self.model.encode(texts))
+
+    def encodeQueryTexts(self, texts):
+        return self.normalize(self.queryModel.encode(texts))
+
+    def validateQueryEncoder(self, documents, sample_size, seed=0):
+        """
+        Cosine agreement between the query encoder embeddings of a sample of
+        documents and their stored embeddings, computed with the model.
+        Returns the mean and minimum agreement.
+        """
+        if self.embeddings is None:
+            raise ValueError(f"Validation requires the stored embeddings.")
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(
+            self.length, size=min(sample_size, self.length), replace=False))
+        texts = [documents[int(n)].getPhrasesForEmbedding() for n in sample]
+        agreement = np.einsum(
+            'nd,nd->n', self.encodeQueryTexts(texts), self.embeddings[sample])
+        mean, minimum = float(agreement.mean()), float(agreement.min())
+        print(
+            f"Index: {self.queryEncoder} query encoder agreement on "
+            f"{len(sample)} documents: mean {mean:.4f}, min {minimum:.4f}.")
+        return mean, minimum
+
+    def checkQueryEncoder(self, documents):
+        """
+        Refuse a query encoder that is not the model if its embeddings do
+        not agree enough with the stored ones.
+        """
+        if self.queryModel is self.model:
+            return
+        mean, _ = self.validateQueryEncoder(
+            documents, self.encoderValidationSize)
+        if mean < self.minEncoderAgreement:
+            raise ValueError(
+                f"The {self.queryEncoder} query encoder agreement {mean:.4f} "
+                f"is below {self.minEncoderAgreement}, queries and documents "
+                f"embeddings would not be comparable.")
+
+    def checkDeferredQueryEncoder(self):
+        """
+        Check the query encoder of an index created with `defer_inference`.
+        """
+        if self.uncheckedDocuments is None:
+            return
+        documents, self.uncheckedDocuments = self.uncheckedDocuments, None
+        self.checkQueryEncoder(documents)
+
+    def encodeQueries(self, queries):
+        """
+        Embeddings of a list of queries, encoded in one batch except the ones
+        found in the query cache. With micro-batching the batch also holds
+        the queries of the concurrent requests.
+        """
+        encode = self.encodeQueryTexts
+        if self.batchEncoder is not None:
+            encode = self.batchEncoder
+
+        if self.queryCache is None:
+            return encode(queries)
+
+        embeddings = [self.queryCache.get(query) for query in queries]
+        misses = [n for n, e in enumerate(embeddings) if e is None]
+        if misses:
+            encoded = encode([queries[n] for n in misses])
+            for n, embedding in zip(misses, encoded):
+                self.queryCache.put(queries[n], embedding)
+                embeddings[n] = embedding
+        return np.stack(embeddings)
+
+    def warmUpQueryCache(self, query_log=None):
+        """
+        Load the saved query cache and encode the most recent queries of a
+        `QueryLog` not cached yet.
+        """
+        if self.queryCache is None:
+            return
+
+        if self.queryCachePath and os.path.exists(self.queryCachePath):
+            self.queryCache.load(self.queryCachePath)
+
+        if query_log is None:
+            return
+
+        queries = OrderedDict()
+        for entry in query_log.iterEntries():
+            query = entry.get('query') if isinstance(entry, dict) else None
+            if isinstance(query, str) and query.strip():
+                key = self.queryCache.normalizeQuery(query)
+                queries.pop(key, None)
+                queries[key] = query
+        queries = [
+            q for q in list(queries.values())[-self.queryCache.size:]
+                if not q in self.queryCache]
+
+        print(f"Index: warming up query cache with {len(queries)} queries.")
+        bsize = self.batch_size
+        for b in range(0, len(queries), bsize):
+            batch = queries[b: b+bsize]
+            for query, embedding in zip(
+                    batch, self.encodeQueryTexts(batch)):
+                self.queryCache.put(query, embedding)
+
+    def saveQueryCache(self):
+        if self.queryCache is not None and self.queryCachePath:
+            self.queryCache.save(self.queryCachePath)
+
+    def embedData(self, documents, embeddings, positions=None):
+        """
+        Embed the documents phrases and write the normalized float32 vectors
+        in the rows `positions` (defaults to the documents order) of the
+        `embeddings` matrix. Embeddings found in the cache are reused, only
+        the cache misses are encoded by the model, in batches.
+        """
         bsize = self.batch_size
         tsize = len(documents)
-        batchl = [
-            (i*bsize, (i+1)*bsize) for i in range(int(tsize/bsize+1))]
+        if positions is None:
+            positions = np.arange(tsize)
 
-        print(f"Index: embedding data for {len(documents)} documents...")
+        print(f"Index: embedding data for {tsize} documents...")
         start_time = time.time()
-        self.embeddings = []
-        for b in tqdm(batchl):
-            batchDocs = documents[b[0]: b[1]]
+
+        misses = []
+
+        def encodeMisses():
+            texts = [text for _, _, text in misses]
+            hashes = [h for _, h, _ in misses]
+            encoded = self.encode(texts)
+            embeddings[[p for p, _, _ in misses]] = encoded
+            if self.cache is not None:
+                self.cache.put(hashes, encoded)
+            misses.clear()
+
+        for b in tqdm(range(0, tsize, bsize)):
+            batchDocs = documents[b: b+bsize]
             batch = [d.getPhrasesForEmbedding() for d in batchDocs]
-            self.embeddings.extend(self.model.encode(batch))
+            hashes = [hashText(text) for text in batch]
+            cached = {}
+            if self.cache is not None:
+                cached = self.cache.get(hashes)
+            for p, h, text in zip(positions[b: b+len(batch)], hashes, batch):
+                if h in cached:
+                    embeddings[p] = cached[h]
+                else:
+                    misses.append((p, h, text))
+            if len(misses) >= bsize:
+                encodeMisses()
+        if misses:
+            encodeMisses()
 
         print("Index: took {:.2f} seconds.".format(time.time()-start_time))
+        if self.cache is not None:
+            print(f"Index: {self.cache}")
+
+    def loadEmbeddings(self, length):
+        """
+        Memory-map the embedding matrix stored next to the index, if it
+        exists and has `length` rows.
+        """
+        if not os.path.exists(self.embeddingsPath):
+            return None
+
+        embeddings = np.load(self.embeddingsPath, mmap_mode='r')
+        if embeddings.shape != (length, self.embedding_size):
+            print(
+                f"Index: ignoring embeddings {self.embeddingsPath} of shape "
+                f"{embeddings.shape}, expected {(length, self.embedding_size)}.")
+            return None
+
+        print(f"Index: embeddings loaded from {self.embeddingsPath}.")
+        return embeddings
+
+    def loadMapping(self):
+        """
+        Load the id to document mapping saved with the index, i.e. the
+        (label, halId, chunk, text hash) of each row of the stored embeddings.
+        """
+        if not os.path.exists(self.mappingPath):
+            return None
+
+        with open(self.mappingPath) as f:
+            mapping = json.load(f)
+        a1 = mapping['model'] == self.model_name
+        a2 = mapping['dim'] == self.embedding_size
+        if not (a1 and a2):
+            print(f"Index: ignoring mapping {self.mappingPath} built with "
+                f"model {mapping['model']} ({mapping['dim']} dimensions).")
+            return None
+
+        print(
+            f"Index: found {len(mapping['documents'])} documents in mapping "
+            f"{self.mappingPath}.")
+        return mapping['documents']
+
+    def saveMapping(self, documents, hashes):
+        mapping = {
+            'model': self.model_name,
+            'dim': self.embedding_size,
+            'documents': [
+                [int(label), d.halId, d.chunk, h]
+                    for label, d, h in zip(self.labels, documents, hashes)]
+        }
+        tmp_path = self.mappingPath + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(mapping, f)
+        os.replace(tmp_path, self.mappingPath)
+        print(f"Index: mapping saved to {self.mappingPath}.")
+
+    def updateEmbeddings(self, documents, hashes, saved):
+        """
+        Build the embedding matrix of the documents, reusing the stored rows
+        of the chunks whose text did not change and embedding only the new
+        or modified ones. Returns the positions of the embedded documents.
+        """
+        savedEmbeddings = None
+        if saved is not None:
+            savedEmbeddings = self.loadEmbeddings(len(saved))
+        if savedEmbeddings is None:
+            saved = []
+
+        savedRows = {
+            label: (row, h) for row, (label, _, _, h) in enumerate(saved)}
+        reusedNew, reusedOld, toEmbed = [], [], []
+        for n, (label, h) in enumerate(zip(self.labels.tolist(), hashes)):
+            if label in savedRows and savedRows[label][1] == h:
+                reusedNew.append(n)
+                reusedOld.append(savedRows[label][0])
+            else:
+                toEmbed.append(n)
+
+        # stored embeddings already match the documents
+        if not toEmbed and reusedOld == list(range(len(saved))):
+            self.embeddings = savedEmbeddings
+            return toEmbed
+
+        print(
+            f"Index: reusing {len(reusedNew)} stored embeddings, "
+            f"{len(toEmbed)} documents to embed.")
+        tmp_path = self.embeddingsPath + '.tmp'
+        embeddings = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32,
+            shape=(self.length, self.embedding_size))
+        bsize = 10000
+        for b in range(0, len(reusedNew), bsize):
+            embeddings[reusedNew[b: b+bsize]] = \
+                savedEmbeddings[reusedOld[b: b+bsize]]
+        if self.embeddingCachePath is not None:
+            self.cache = EmbeddingCache(
+                self.embeddingCachePath, self.model_name)
+        try:
+            self.embedData(
+                [documents[n] for n in toEmbed], embeddings, np.array(toEmbed))
+        finally:
+            if self.cache is not None:
+                self.cache.close()
+                self.cache = None
+        embeddings.flush()
+        del embeddings, savedEmbeddings
+        os.replace(tmp_path, self.embeddingsPath)
+        print(f"Index: embeddings saved to {self.embeddingsPath}.")
+
+        self.embeddings = self.loadEmbeddings(self.length)
+        return toEmbed
+
+    def exactScores(self, query_embedding, corpus_ids):
+        """
+        Exact cosine similarities between a query and some corpus documents,
+        computed from the stored embeddings.
+        """
+        query_embedding = self.normalize(query_embedding)
+        return self.embeddings[np.asarray(corpus_ids)] @ query_embedding
 
     def createIndex(self, documents):
         """
@@ -102,63 +503,236 @@ class Index:
         containing the sentences embeddings.
         The HNSWLIB index uses dot-product as Index and normalize
         # vectors to unit length.
+
+        Documents are indexed with stable labels derived from their halId and
+        chunk number. When an index and its mapping already exist, only the
+        new or modified chunks are embedded and added, and the withdrawn ones
+        are marked as deleted. When the index file is missing (or was removed
+        after changing the HNSW parameters) the graph is rebuilt from the
+        stored embeddings.
+
+        With the exact backend no graph is built, the search is done over
+        the stored embeddings.
+        """
+        hashes = self.setDocuments(documents)
+
+        saved = self.loadMapping()
+        toEmbed = self.updateEmbeddings(documents, hashes, saved)
+        self.prepareQueryEncoderCheck(documents)
+
+        self.backend = createBackend(
+            self.backendName, self, self.exactMaxElements)
+        print(f"Index: using {self.backend}.")
+        self.backend.build(saved, toEmbed)
+
+        self.saveMapping(documents, hashes)
+        self.loadIndexParams()
+
+    def loadIndex(self, documents):
+        """
+        Load the index built for the documents by `createIndex` without
+        writing any file, like the serving processes do: the index files are
+        shared by them and only written by `create_index.py`. Raises a
+        ValueError if the index is missing or was built for other documents.
+        """
+        hashes = self.setDocuments(documents)
+
+        saved = self.loadMapping()
+        if saved is None or [(label, h) for label, _, _, h in saved] != \
+                list(zip(self.labels.tolist(), hashes)):
+            raise ValueError(
+                f"No index built for the corpus at {self.path}, "
+                f"run create_index.py.")
+        self.embeddings = self.loadEmbeddings(self.length)
+        if self.embeddings is None:
+            raise ValueError(
+                f"No embeddings of the corpus at {self.embeddingsPath}, "
+                f"run create_index.py.")
+        self.prepareQueryEncoderCheck(documents)
+
+        self.backend = createBackend(
+            self.backendName, self, self.exactMaxElements)
+        print(f"Index: using {self.backend}.")
+        self.backend.load()
+        self.loadIndexParams()
+
+    def setDocuments(self, documents):
+        """
+        Labels and positions of the documents, returns the hashes of their
+        texts.
         """
         self.length = len(documents)
+        self.labels = np.array(
+            [d.getLabel() for d in documents], dtype=np.uint64)
+        self.positions = dict(zip(self.labels.tolist(), range(self.length)))
+        if len(self.positions) != self.length:
+            raise ValueError(f"There are documents with repeated labels.")
+        return [hashText(d.getPhrasesForEmbedding()) for d in documents]
+
+    def prepareQueryEncoderCheck(self, documents):
+        if self.deferInference:
+            self.uncheckedDocuments = documents
+        else:
+            self.checkQueryEncoder(documents)
 
-        # Declare index
-        self.index = hnswlib.Index(
-            space=self.space,
-            dim=self.embedding_size)
-
-        # load index and check its coherence
-        if os.path.exists(self.path):
-            self.index.load_index(self.path, max_elements=self.length)
-            print(f"Index: index loaded from {self.path}.\n{self}")
-            a1 = self.embedding_size == self.index.dim
-            a2 = self.space == self.index.space
-            if not a1 and a2:
-                raise ValueError(f"Index loaded not coherent with parameters.")
-            self.index.set_num_threads(self.num_threads)
-        # init index and populate it with embeddings
+    def loadSavedIndex(self):
+        """
+        Load a saved index with its mapping and embeddings, without the
+        corpus documents.
+        """
+        saved = self.loadMapping()
+        if saved is None:
+            raise ValueError(f"No index saved at {self.path}.")
+
+        self.length = len(saved)
+        self.labels = np.array(
+            [label for label, _, _, _ in saved], dtype=np.uint64)
+        self.positions = dict(zip(self.labels.tolist(), range(self.length)))
+        self.embeddings = self.loadEmbeddings(self.length)
+        self.backend = createBackend(
+            self.backendName, self, self.exactMaxElements)
+        self.backend.load()
+        self.loadIndexParams()
+
+    def loadIndexParams(self):
+        """
+        Load the parameters saved with the index (e.g. the calibrated ef)
+        and set the query time ef.
+        """
+        self.indexParams = {}
+        if os.path.exists(self.paramsPath):
+            with open(self.paramsPath) as f:
+                self.indexParams = json.load(f)
+
+        if self.backend.name != 'hnsw':
+            return
+        ef = self.ef if self.ef is not None else self.indexParams.get('ef')
+        if ef is not None:
+            self.backend.setEf(ef)
+            print(f"Index: query time ef set to {ef}.")
+
+    def saveIndexParams(self):
+        tmp_path = self.paramsPath + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.indexParams, f, indent=2)
+        os.replace(tmp_path, self.paramsPath)
+        print(f"Index: parameters saved to {self.paramsPath}.")
+
+    def calibrateEf(self, k, recall_target, sample_size=200, seed=0):
+        """
+        Find the smallest query time ef reaching `recall_target` recall@k.
+
+        A sample of documents embeddings is used as queries, each query
+        being held out of its own results, and the results of the HNSW
+        search are compared to the exact search over the stored embeddings.
+        The chosen ef is stored with the index.
+        """
+        if self.embeddings is None:
+            raise ValueError(f"Calibration requires the stored embeddings.")
+        if self.backend.name != 'hnsw':
+            raise ValueError(
+                f"Calibration requires the hnsw backend, not {self.backend}.")
+
+        k = min(k, self.length - 1)
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(
+            self.length, size=min(sample_size, self.length), replace=False)
+        queries = np.asarray(self.embeddings[sample])
+
+        print(f"Index: computing exact recall@{k} for {len(sample)} queries...")
+        exact = exactTopK(self.embeddings, queries, k+1)
+        exact = [[p for p in e if p != q][:k] for e, q in zip(exact, sample)]
+
+        recall = 0.
+        for ef in [int(k * f) for f in self.efFactors]:
+            self.backend.setEf(ef)
+            positions, _ = self.backend.knnQuery(queries, k+1)
+            approx = [
+                [p for p in a if p != q][:k]
+                    for a, q in zip(positions, sample)]
+            recall = recallAtK(approx, exact)
+            print(f"Index: ef {ef} | recall@{k} {recall:.4f}")
+            if recall >= recall_target:
+                break
         else:
-            self.embedData(documents)
-            self.index.init_index(max_elements=self.length, **self.indexKwargs)
-            self.index.set_num_threads(self.num_threads)
-            print("Index: populating HNSWLIB index...")
-            self.index.add_items(
-                data=self.embeddings, ids=list(range(self.length)))
-            self.index.save_index(self.path)
-            print(f"Index: HNSW index saved to {self.path}\n{self}")
+            print(f"Index: recall target {recall_target} not reached.")
 
+        self.indexParams.update({
+            'ef': ef, 'k': k, 'recall': recall,
+            'recall_target': recall_target, 'sample_size': len(sample)})
+        self.saveIndexParams()
+        self.loadIndexParams()
+        return ef, recall
 
-    def parseAndFilterResults(self, corpus_ids, distances, score_threshold):
+
+    def parseAndFilterResults(self, corpus_ids, scores, score_threshold):
         """
-        Transform distances in scores, sort scores and filter query results.
+        Format and filter the results of one query given as arrays of corpus
+        positions and scores sorted by decreasing scores.
         """
         parsed_results = [
-            {'corpus_id': id, 'score': 1-distance}
-                for id, distance in zip(corpus_ids[0], distances[0])
-                    if 1-distance >= score_threshold
+            {'corpus_id': int(id), 'score': float(score)}
+                for id, score in zip(corpus_ids, scores)
+                    if score >= score_threshold
         ]
 
         return parsed_results
 
+    def labelsToPositions(self, labels):
+        return np.array(
+            [self.positions[int(label)] for label in labels.ravel()],
+            dtype=np.int64).reshape(labels.shape)
 
-    def retrieve(self, query, top_k, score_threshold):
-
-        # top_k = top_k if top_k > 0 else min(self.length, 10000)
+    def search(self, query_embeddings, top_k, allowed=None):
+        """
+        Corpus positions and scores of the `top_k` nearest documents of each
+        query, only among the documents whose position is True in the
+        `allowed` mask if given, found by the search backend.
+        """
+        return self.backend.search(query_embeddings, top_k, allowed)
 
-        query_embedding = self.model.encode(query)
+    def retrieveBatch(self, queries, top_k, score_thresholds, filters=None):
+        """
+        Retrieve the results of several queries at once: the queries are
+        encoded in one batch and searched with a single multi-threaded
+        search per distinct filter. `filters` are boolean masks of the
+        documents each query can return (or None to return any document).
+        Returns the list of results of each query.
+        """
+        query_embeddings = self.encodeQueries(queries)
+        if filters is None:
+            filters = [None] * len(queries)
 
-        # Use hnswlib knn_query method to get the closest embeddings
+        # Use the search backend to get the closest embeddings
         start_time = time.time()
 
-        corpus_ids, distances = self.index.knn_query(
-            query_embedding, k=top_k)
-        parsed_res = self.parseAndFilterResults(
-            corpus_ids, distances, score_threshold)
+        groups = {}
+        for n, allowed in enumerate(filters):
+            groups.setdefault(id(allowed), (allowed, []))[1].append(n)
+
+        parsed_res = [None] * len(queries)
+        for allowed, group in groups.values():
+            corpus_ids, scores = self.search(
+                query_embeddings[group], top_k, allowed)
+            for n, ids, sc in zip(group, corpus_ids, scores):
+                parsed_res[n] = self.parseAndFilterResults(
+                    ids, sc, score_thresholds[n])
         t = time.time() - start_time
 
-        print(f"Index: retrieved {len(parsed_res)} results after {t:.5f} s.")
+        nb_res = sum([len(r) for r in parsed_res])
+        print(
+            f"Index: retrieved {nb_res} results for {len(queries)} queries "
+            f"after {t:.5f} s.")
+        if self.queryCache is not None:
+            print(f"Index: {self.queryCache}")
+        if self.batchEncoder is not None:
+            print(f"Index: {self.batchEncoder}")
 
         return parsed_res
+
+    def retrieve(self, query, top_k, score_threshold, allowed=None):
+
+        # top_k = top_k if top_k > 0 else min(self.length, 10000)
+
+        return self.retrieveBatch(
+            [query], top_k, [score_threshold], [allowed])[0]
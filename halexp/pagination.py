@@ -0,0 +1,47 @@
+import json
+import base64
+
+from flask import abort
+
+
+def checkPage(offset, nb_show):
+    """
+    Reject (400) a page of results with a negative offset or size.
+    """
+    if offset < 0 or nb_show < 0:
+        abort(400)
+
+
+def makeCursor(offset, generation_id):
+    cursor = {'offset': offset, 'generation': generation_id}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def readCursor(cursor, generation_id):
+    """
+    Offset in the ranked results of the page designated by a cursor (0 if
+    none). Cursors expire (410) when the index generation changes.
+    """
+    if not cursor:
+        return 0
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset, generation = int(cursor['offset']), cursor['generation']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        abort(400)
+    if offset < 0:
+        abort(400)
+    if generation != generation_id:
+        abort(410)
+    return offset
+
+
+def getNextOffset(nb_results, offset, nb_show):
+    """
+    Offset of the page following the `nb_show` results at `offset`, None
+    on the last page (or for empty pages, whose next page would be the
+    same).
+    """
+    if nb_show <= 0 or nb_results <= offset + nb_show:
+        return None
+    return offset + nb_show
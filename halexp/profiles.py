@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import hnswlib
+import numpy as np
+
+from .evaluation import exactSearch
+
+
+class AuthorProfiles:
+    """
+    Vector index of the authors profiles, i.e. the pooled embeddings of the
+    documents of each author, optionally weighted by their recency. Experts
+    are retrieved with one search among the profiles, the evidence of the
+    selected authors (their best documents) being scored afterwards.
+
+    The profiles are built from the stored embeddings and saved next to the
+    index, and rebuilt when the embeddings, the authors or the parameters
+    change.
+    """
+
+    poolings = ['mean', 'max']
+
+    # number of documents of the embeddings read at once
+    blockSize = 16384
+
+    def __init__(
+        self, corpus, pooling='mean', recency_half_life=None,
+        max_evidence=10, read_only=False, **kwargs):
+        """
+        pooling - `mean` (weighted centroid) or `max` (maximum of each
+        dimension) of the documents embeddings of each author
+
+        recency_half_life - age in years of the documents whose weight is
+        halved, relative to the most recent publication year of the corpus
+        (no weighting if None)
+
+        max_evidence - maximum number of documents returned per author
+
+        read_only - only load the saved profiles (ValueError if they are
+        missing or obsolete), without building and saving them
+        """
+        if not pooling in self.poolings:
+            raise ValueError(
+                f"Invalid pooling `{pooling}`, must be one of {self.poolings}")
+
+        self.corpus = corpus
+        self.index = corpus.index
+        self.pooling = pooling
+        self.recencyHalfLife = recency_half_life
+        self.maxEvidence = max_evidence
+        self.path = self.index.getArtifactPath('.profiles.npy')
+        self.paramsPath = self.index.getArtifactPath('.profiles.json')
+
+        # documents of each author
+        self.authorDocs = corpus.docAuthorMatrix.T.tocsr()
+
+        self.vectors = self.load()
+        if self.vectors is None and read_only:
+            raise ValueError(
+                f"No up to date author profiles at {self.path}, "
+                f"run create_index.py.")
+        if self.vectors is None:
+            self.vectors = self.build()
+            self.save()
+
+        self.graph = None
+        if len(self.vectors) > self.index.exactMaxElements:
+            self.buildGraph()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def getParams(self):
+        authors = '\n'.join([
+            f"{a.authIdHal}|{a.normalizedFullName}" for a in self.corpus.authors])
+        return {
+            'pooling': self.pooling,
+            'recency_half_life': self.recencyHalfLife,
+            'nb_documents': self.index.length,
+            'authors': hashlib.sha1(authors.encode('utf-8')).hexdigest(),
+        }
+
+    def load(self):
+        if not (os.path.exists(self.path) and os.path.exists(self.paramsPath)):
+            return None
+        if os.path.getmtime(self.path) < os.path.getmtime(self.index.embeddingsPath):
+            return None
+        with open(self.paramsPath) as f:
+            if json.load(f) != self.getParams():
+                return None
+
+        vectors = np.load(self.path, mmap_mode='r')
+        print(f"Profiles: {len(vectors)} author profiles loaded from {self.path}.")
+        return vectors
+
+    def save(self):
+        tmp_path = self.path + '.tmp.npy'
+        np.save(tmp_path, self.vectors)
+        os.replace(tmp_path, self.path)
+        with open(self.paramsPath, 'w') as f:
+            json.dump(self.getParams(), f)
+        print(f"Profiles: {len(self)} author profiles saved to {self.path}.")
+
+    def getWeights(self):
+        """
+        Weight of each document in the profiles of its authors.
+        """
+        years = self.corpus.publicationYears
+        if not self.recencyHalfLife or len(years) == 0:
+            return np.ones(len(years), dtype=np.float32)
+        age = years.max() - years
+        return np.power(0.5, age / self.recencyHalfLife).astype(np.float32)
+
+    def build(self):
+        """
+        Pool the stored embeddings of the documents of each author, by
+        blocks of documents.
+        """
+        embeddings = self.index.embeddings
+        if embeddings is None:
+            raise ValueError(f"Author profiles require the stored embeddings.")
+
+        weighted = self.corpus.docAuthorMatrix.multiply(
+            self.getWeights()[:, None]).tocsr()
+        nb_authors = weighted.shape[1]
+        if self.pooling == 'mean':
+            vectors = np.zeros(
+                (nb_authors, self.index.embedding_size), dtype=np.float32)
+        else:
+            vectors = np.full(
+                (nb_authors, self.index.embedding_size), -np.inf,
+                dtype=np.float32)
+
+        for b in range(0, weighted.shape[0], self.blockSize):
+            block = weighted[b: b+self.blockSize]
+            blockEmbeddings = np.asarray(embeddings[b: b+self.blockSize])
+            if self.pooling == 'mean':
+                vectors += block.T @ blockEmbeddings
+            else:
+                block = block.tocoo()
+                np.maximum.at(
+                    vectors, block.col,
+                    blockEmbeddings[block.row] * block.data[:, None])
+
+        vectors[~np.isfinite(vectors)] = 0
+        print(
+            f"Profiles: {nb_authors} author profiles built with {self.pooling} "
+            f"pooling.")
+        return self.index.normalize(vectors)
+
+    def buildGraph(self):
+        self.graph = hnswlib.Index(
+            space='cosine', dim=self.index.embedding_size)
+        self.graph.init_index(
+            max_elements=len(self), **self.index.indexKwargs)
+        self.graph.set_num_threads(self.index.num_threads)
+        self.graph.add_items(np.asarray(self.vectors), np.arange(len(self)))
+        print(f"Profiles: HNSW index of {len(self)} author profiles built.")
+
+    def search(self, query_embeddings, k, allowed=None):
+        """
+        Authors and similarities of the k nearest profiles of each query,
+        only among the authors True in the `allowed` mask if given.
+        """
+        candidates = None if allowed is None else np.flatnonzero(allowed)
+        nb_candidates = len(self) if candidates is None else len(candidates)
+        k = min(k, nb_candidates)
+        if k == 0:
+            empty = np.zeros((len(query_embeddings), 0))
+            return empty.astype(np.int64), empty
+
+        if self.graph is not None:
+            try:
+                filter = None
+                if allowed is not None:
+                    filter = lambda label: allowed[label]
+                labels, distances = self.graph.knn_query(
+                    query_embeddings, k=k, num_threads=self.index.num_threads,
+                    filter=filter)
+                return labels.astype(np.int64), 1 - distances
+            except RuntimeError:
+                # the filtered graph search found less than k authors
+                pass
+        return exactSearch(self.vectors, query_embeddings, k, candidates)
+
+    def getEvidence(self, author, query_embedding, allowed, score_threshold):
+        """
+        Positions and scores of the best documents of an author for a query,
+        among the documents of the `allowed` mask if given.
+        """
+        start, end = self.authorDocs.indptr[author: author+2]
+        docs = self.authorDocs.indices[start: end]
+        if allowed is not None:
+            docs = docs[allowed[docs]]
+        if len(docs) == 0:
+            return docs, np.zeros(0)
+
+        scores = self.index.exactScores(query_embedding, docs)
+        keep = scores >= score_threshold
+        docs, scores = docs[keep], scores[keep]
+        best = np.argsort(-scores, kind='stable')[:self.maxEvidence]
+        return docs[best], scores[best]
+
+    def retrieve(self, query_embedding, score_threshold, allowed, limit):
+        """
+        Format the `limit` authors closest to a query like the aggregated
+        authors results, the rank score being the profile similarity.
+        `allowed` is the mask of the documents passing the filters. Authors
+        whose profile similarity is below `score_threshold`, or without
+        documents above it passing the filters, are excluded.
+        """
+        allowedAuthors = None
+        if allowed is not None:
+            allowedAuthors = (self.authorDocs @ allowed.astype(np.float32)) > 0
+
+        authors, similarities = self.search(
+            query_embedding[None], limit, allowedAuthors)
+
+        res = []
+        for a, similarity in zip(authors[0], similarities[0]):
+            if similarity < score_threshold:
+                break
+            docs, scores = self.getEvidence(
+                a, query_embedding, allowed, score_threshold)
+            if len(docs) == 0:
+                continue
+            res.append({
+                'author': self.corpus.authors[a],
+                'rank_score': float(similarity),
+                'docs_scores': scores.tolist(),
+                'nb_hits': len(docs),
+                'docs': [self.corpus.documents[int(p)] for p in docs],
+                'rank': len(res)
+            })
+        return res
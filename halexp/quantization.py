@@ -0,0 +1,173 @@
+import os
+import numpy as np
+
+
+def residentFileBytes():
+    """
+    File-backed memory resident in the process (memory-mapped files
+    included), None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssFile:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RowReader:
+    """
+    Reader of rows of a 2D array saved with `np.save`, read from the file
+    with `pread` instead of being memory-mapped: the rows read only go
+    through the page cache and do not add to the resident memory of the
+    process.
+    """
+
+    def __init__(self, path):
+        array = np.load(path, mmap_mode='r')
+        self.path = path
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.offset = array.offset
+        self.rowSize = array.itemsize * array.shape[1]
+        del array
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __del__(self):
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+
+    def __getitem__(self, rows):
+        """
+        Rows `rows` (an array of row numbers) as an array.
+        """
+        rows = np.asarray(rows)
+        data = bytearray(len(rows) * self.rowSize)
+        view = memoryview(data)
+        for n, row in enumerate(rows):
+            start = n * self.rowSize
+            view[start: start+self.rowSize] = os.pread(
+                self.fd, self.rowSize, self.offset + int(row) * self.rowSize)
+        return np.frombuffer(data, dtype=self.dtype).reshape(
+            len(rows), self.shape[1])
+
+
+class QuantizedEmbeddings:
+    """
+    Low precision copy of normalized embeddings used to generate search
+    candidates, rescored afterwards with the full precision embeddings.
+
+    float16 - half precision vectors (2 bytes per dimension)
+    int8 - scalar quantized vectors (1 byte per dimension): each vector is
+    scaled so that its largest absolute coordinate is 127, its scale being
+    kept to restore the scores.
+    """
+
+    dtypes = ('float16', 'int8')
+
+    # number of rows converted to float32 at once when computing scores
+    blockSize = 16384
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+        self.dtype = str(data.dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return f"{self.dtype} embeddings: {len(self)} vectors, {self.nbytes} bytes"
+
+    @property
+    def nbytes(self):
+        nbytes = self.data.nbytes
+        if self.scales is not None:
+            nbytes += self.scales.nbytes
+        return nbytes
+
+    @classmethod
+    def quantize(cls, embeddings, dtype):
+        if not dtype in cls.dtypes:
+            raise ValueError(
+                f"Invalid quantization dtype `{dtype}`, "
+                f"must be one of {list(cls.dtypes)}")
+
+        data = np.empty(embeddings.shape, dtype=dtype)
+        scales = None
+        if dtype == 'int8':
+            scales = np.empty(len(embeddings), dtype=np.float32)
+        for b in range(0, len(embeddings), cls.blockSize):
+            block = np.asarray(embeddings[b: b+cls.blockSize], dtype=np.float32)
+            if dtype == 'int8':
+                blockScales = np.abs(block).max(axis=1) / 127
+                blockScales[blockScales == 0] = 1
+                block = np.rint(block / blockScales[:, None])
+                scales[b: b+cls.blockSize] = blockScales
+            data[b: b+cls.blockSize] = block
+        return cls(data, scales)
+
+    @staticmethod
+    def getPaths(path, dtype):
+        """
+        Paths of the quantized vectors and of their scales, stored next to
+        the full precision embeddings file `path`.
+        """
+        root = os.path.splitext(path)[0]
+        return f"{root}.{dtype}.npy", f"{root}.{dtype}.scales.npy"
+
+    def save(self, path):
+        dataPath, scalesPath = self.getPaths(path, self.dtype)
+        for array, arrayPath in [(self.data, dataPath), (self.scales, scalesPath)]:
+            if array is None:
+                continue
+            tmp_path = arrayPath + '.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, arrayPath)
+        print(f"Index: {self} saved to {dataPath}.")
+
+    @classmethod
+    def load(cls, path, dtype, length):
+        """
+        Memory-map the quantized vectors stored next to the embeddings file
+        `path`, if they are up to date with it and have `length` rows.
+        """
+        dataPath, scalesPath = cls.getPaths(path, dtype)
+        paths = [dataPath] + ([scalesPath] if dtype == 'int8' else [])
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        if min(os.path.getmtime(p) for p in paths) < os.path.getmtime(path):
+            return None
+
+        data = np.load(dataPath, mmap_mode='r')
+        scales = None
+        if dtype == 'int8':
+            scales = np.load(scalesPath, mmap_mode='r')
+        if len(data) != length or (scales is not None and len(scales) != length):
+            return None
+        return cls(data, scales)
+
+    def scores(self, queries, rows=None):
+        """
+        Approximate scores of the queries with every vector, or only with
+        the `rows` vectors, as a float32 array of shape (len(queries), n).
+        """
+        data, scales = self.data, self.scales
+        if rows is not None:
+            data = data[rows]
+            if scales is not None:
+                scales = scales[rows]
+
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(data)), dtype=np.float32)
+        for b in range(0, len(data), self.blockSize):
+            block = np.asarray(data[b: b+self.blockSize], dtype=np.float32)
+            scores[:, b: b+self.blockSize] = queries @ block.T
+            if scales is not None:
+                scores[:, b: b+self.blockSize] *= scales[b: b+self.blockSize]
+        return scores
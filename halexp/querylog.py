@@ -0,0 +1,66 @@
+import os
+import json
+import time
+import fcntl
+import threading
+
+
+class QueryLog:
+    """
+    Json lines log of the queries, bounded in size: when the log reaches
+    `max_bytes` it is renamed to `<path>.1` (the previous backups being
+    shifted up to `<path>.<backups>`) and a new one is started.
+
+    Several worker processes append to the same log, the writes and
+    rotations are serialized by an exclusive lock on `<path>.lock`.
+    """
+
+    def __init__(self, path, max_bytes=10_000_000, backups=1):
+        self.path = path
+        self.lockPath = path + '.lock'
+        self.maxBytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+
+    def getBackupPath(self, n):
+        return f"{self.path}.{n}"
+
+    def rotate(self):
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(self.getBackupPath(n)):
+                os.replace(self.getBackupPath(n), self.getBackupPath(n + 1))
+        os.replace(self.path, self.getBackupPath(1))
+
+    def write(self, endpoint, query):
+        line = json.dumps(
+            {'time': time.time(), 'endpoint': endpoint, 'query': query}
+            ) + '\n'
+        with self.lock, open(self.lockPath, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.path) and \
+                        os.path.getsize(self.path) + len(line) > self.maxBytes:
+                    self.rotate()
+                with open(self.path, 'a') as f:
+                    f.write(line)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def iterEntries(self):
+        """
+        Entries of the log, oldest first (backups included).
+        """
+        paths = [self.getBackupPath(n) for n in range(self.backups, 0, -1)]
+        paths.append(self.path)
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
@@ -0,0 +1,187 @@
+import os
+import json
+import shutil
+from functools import lru_cache
+import numpy as np
+
+from .author import Author
+from .store import DocumentStore
+
+# version of the snapshot format, snapshots of other versions are ignored
+version = 1
+
+# separator of the phrases of a document in the phrases blob
+phrasesSeparator = '\x1f'
+
+# store columns saved as NumPy arrays
+arrayColumns = {
+    'chunks': 'chunks.npy',
+    'records': 'records.npy',
+    'years': 'years.npy',
+    'openAccess': 'open_access.npy',
+    'authorsIndptr': 'authors_indptr.npy',
+    'authorsIndices': 'authors_indices.npy',
+}
+
+
+class BlobSequence:
+    """
+    Read-only sequence of utf-8 strings stored back to back in a memory-mapped
+    blob, item n being between `offsets[n]` and `offsets[n+1]`. Items are
+    decoded on access (or returned as bytes if `raw`), the last decoded
+    ones being cached.
+    """
+
+    def __init__(self, blob, offsets, decode=None, cache_size=0, raw=False):
+        self.blob = blob
+        self.offsets = offsets
+        self.decode = decode
+        self.raw = raw
+        if cache_size > 0:
+            self.getItem = lru_cache(maxsize=cache_size)(self.getItem)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"Item {n} out of range.")
+        return self.getItem(int(n))
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.getItem(n)
+
+    def getBytes(self, n):
+        return self.blob[self.offsets[n]: self.offsets[n+1]].tobytes()
+
+    def getItem(self, n):
+        if self.raw:
+            return self.getBytes(n)
+        item = self.getBytes(n).decode('utf-8')
+        if self.decode is not None:
+            item = self.decode(item)
+        return item
+
+
+def splitPhrases(text):
+    return tuple(text.split(phrasesSeparator))
+
+
+def writeBlob(path, items):
+    """
+    Write encoded items back to back in the `path` blob and their offsets
+    next to it.
+    """
+    offsets = [0]
+    with open(path, 'wb') as f:
+        for item in items:
+            f.write(item)
+            offsets.append(offsets[-1] + len(item))
+    np.save(path + '.offsets.npy', np.array(offsets, dtype=np.int64))
+
+
+def readBlob(path, **kwargs):
+    offsets = np.load(path + '.offsets.npy', mmap_mode='r')
+    if offsets[-1] > 0:
+        blob = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        blob = np.zeros(0, dtype=np.uint8)
+    return BlobSequence(blob, offsets, **kwargs)
+
+
+def readManifest(path):
+    """
+    Manifest of the snapshot saved at `path`, None if there is no snapshot
+    of the current version.
+    """
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != version:
+        print(
+            f"Snapshot: ignoring {path} of version {manifest.get('version')}, "
+            f"expected {version}.")
+        return None
+    return manifest
+
+
+def saveSnapshot(store, path, manifest):
+    """
+    Save a frozen document store to the `path` directory: the columns as
+    NumPy arrays, the phrases, halIds and json metadata as blobs with their
+    offsets and the authors table as json. `manifest` describes how the
+    store was built. The snapshot is written next to `path` and moved in
+    place once complete.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for column, filename in arrayColumns.items():
+        np.save(os.path.join(tmp_path, filename), getattr(store, column))
+
+    writeBlob(
+        os.path.join(tmp_path, 'phrases.bin'),
+        (phrasesSeparator.join(p).encode('utf-8') for p in store.phrases))
+    writeBlob(
+        os.path.join(tmp_path, 'hal_ids.bin'),
+        (halId.encode('utf-8') for halId in store.halIds))
+    writeBlob(
+        os.path.join(tmp_path, 'metadata.bin'),
+        (store.getEncodedMetadata(n) for n in range(store.nb_records)))
+
+    with open(os.path.join(tmp_path, 'authors.json'), 'w') as f:
+        json.dump([
+            [
+                a.authFullNameId, a.authIdHal, a.fullName, a.authLabIdHals,
+                a.authLabs]
+                for a in store.authors], f, ensure_ascii=False)
+
+    manifest = dict(
+        manifest, version=version, nb_documents=len(store),
+        nb_records=store.nb_records)
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    print(
+        f"Snapshot: {len(store)} documents of {store.nb_records} HAL "
+        f"documents saved to {path}.")
+
+
+def loadSnapshot(path, metadata_cache_size=4096):
+    """
+    Document store memory-mapped from the snapshot saved at `path`.
+    """
+    store = DocumentStore()
+    for column, filename in arrayColumns.items():
+        setattr(
+            store, column,
+            np.load(os.path.join(path, filename), mmap_mode='r'))
+
+    store.phrases = readBlob(
+        os.path.join(path, 'phrases.bin'), decode=splitPhrases)
+    store.halIds = readBlob(os.path.join(path, 'hal_ids.bin'))
+    store.metadata = readBlob(
+        os.path.join(path, 'metadata.bin'), decode=json.loads,
+        cache_size=metadata_cache_size)
+    store.metadataJson = BlobSequence(
+        store.metadata.blob, store.metadata.offsets, raw=True)
+
+    with open(os.path.join(path, 'authors.json')) as f:
+        store.authors = [Author(*data) for data in json.load(f)]
+    store.recordsCodes = None
+    store.authorsCodes = None
+
+    print(
+        f"Snapshot: {len(store)} documents of {store.nb_records} HAL "
+        f"documents loaded from {path}.")
+    return store
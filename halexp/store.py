@@ -0,0 +1,139 @@
+import numpy as np
+
+from .author import Author
+from .document import Document
+from .fragments import canSplice, encodeMetadata, makeFragment
+
+
+class DocumentStore:
+    """
+    Columnar storage of the documents of a corpus (i.e. the chunks of text to
+    be embedded) and of the HAL documents they come from.
+
+    Each HAL document (record) is stored once with its metadata, publication
+    year, open access flag and the offsets of its authors, which are interned
+    and shared between records. Documents only store their phrases, chunk
+    number and record code, and are accessed through lightweight `Document`
+    views.
+    """
+
+    def __init__(self):
+        # per document
+        self.phrases = []
+        self.chunks = []
+        self.records = []
+
+        # per HAL document
+        self.recordsCodes = {}
+        self.halIds = []
+        self.metadata = []
+        # encoded metadata, read from the snapshot (encoded on demand if None)
+        self.metadataJson = None
+        self.years = []
+        self.openAccess = []
+        self.authorsIndptr = [0]
+        self.authorsIndices = []
+
+        # interned authors
+        self.authors = []
+        self.authorsCodes = {}
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [
+                Document(self, n) for n in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(f"Document position {position} out of range.")
+        return Document(self, position)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield Document(self, n)
+
+    @property
+    def nb_records(self):
+        return len(self.halIds)
+
+    def internAuthor(
+        self, authFullNameId, authIdHal, fullName, labStructId_is,
+        labStructId_names):
+        """
+        Code of an author, the same author record being shared by all the
+        HAL documents where it appears with the same structures.
+        """
+        key = (
+            authFullNameId, authIdHal, fullName, tuple(labStructId_is),
+            tuple(labStructId_names))
+        code = self.authorsCodes.get(key)
+        if code is None:
+            code = len(self.authors)
+            self.authorsCodes[key] = code
+            self.authors.append(Author(
+                authFullNameId, authIdHal, fullName, labStructId_is,
+                labStructId_names))
+        return code
+
+    def addRecord(self, hd, authorsData):
+        """
+        Store a HAL document with its parsed authors data, returns its code.
+        """
+        self.recordsCodes[hd["halId_s"]] = len(self.halIds)
+        self.halIds.append(hd["halId_s"])
+        self.metadata.append(hd)
+        self.years.append(int(hd["publicationDate_s"].split('-')[0]))
+        self.openAccess.append(bool(hd["openAccess_bool"]))
+        self.authorsIndices.extend([
+            self.internAuthor(
+                authFullNameId,
+                data['authId_i'],
+                data['authFullName_s'],
+                data['authPrimStrucId'],
+                data['authPrimStrucName'])
+                for authFullNameId, data in authorsData.items()])
+        self.authorsIndptr.append(len(self.authorsIndices))
+        return len(self.halIds) - 1
+
+    def addDocument(self, record, phrases, chunk):
+        self.phrases.append(tuple(phrases))
+        self.chunks.append(chunk)
+        self.records.append(record)
+
+    def freeze(self):
+        """
+        Convert the columns to compact NumPy arrays once all the documents
+        are added.
+        """
+        self.chunks = np.array(self.chunks, dtype=np.int16)
+        self.records = np.array(self.records, dtype=np.int32)
+        self.years = np.array(self.years, dtype=np.int16)
+        self.openAccess = np.array(self.openAccess, dtype=bool)
+        self.authorsIndptr = np.array(self.authorsIndptr, dtype=np.int64)
+        self.authorsIndices = np.array(self.authorsIndices, dtype=np.int32)
+        self.authorsCodes = None
+
+    def getEncodedMetadata(self, record):
+        """
+        JSON encoding (bytes) of the metadata of a HAL document.
+        """
+        if self.metadataJson is not None:
+            return self.metadataJson[record]
+        return encodeMetadata(self.metadata[record])
+
+    def getMetadataJson(self, record):
+        """
+        Metadata of a HAL document for the JSON responses: its encoding
+        spliced as is in the response when orjson supports it, the decoded
+        metadata otherwise.
+        """
+        if canSplice:
+            return makeFragment(self.getEncodedMetadata(record))
+        return self.metadata[record]
+
+    def getRecordAuthors(self, record):
+        start, end = self.authorsIndptr[record], self.authorsIndptr[record+1]
+        return [self.authors[a] for a in self.authorsIndices[start: end]]
@@ -1,12 +1,18 @@
 import os
 import yaml
+import atexit
 import pprint
 from collections import Counter
 
-from .index import setIndexPath, Index
-from .corpus import Corpus
+from .index import setIndexPath
+from .cache import ResponseCache, FragmentCache
+from .generations import GenerationManager
+from .querylog import QueryLog
+from .fragments import dumps
+from .pagination import checkPage, makeCursor, readCursor, getNextOffset
 
-from flask import Flask, abort, request, jsonify, redirect
+from flask import (
+    Flask, Response, abort, request, jsonify, redirect, stream_with_context)
 
 
 config_path = os.environ['APPCONFIG']
@@ -16,14 +22,51 @@ with open(config_path, "r") as fh:
 LOGOURL = params['app']['style']['logoUrl']
 IMAGEWIDTH = params['app']['style']['imageWidth']
 
+# with gunicorn preload (see gunicorn.conf.py) the app is loaded in the
+# master process and the model is only run in the forked workers
+PRELOAD = os.environ.get('HALEXP_PRELOAD') == '1'
+
 params['index']['index_path'] = setIndexPath(params)
-index = Index(**params['index'])
-corpus = Corpus(index=index, **params['corpus'])
+reloadParams = params['app'].get('reload', {})
+generations = GenerationManager(
+    params,
+    marker_path=reloadParams.get('marker'),
+    poll_interval=reloadParams.get('poll_interval', 60),
+    defer_inference=PRELOAD)
+ADMINTOKEN = reloadParams.get('admin_token')
+
+responseCacheParams = params['app'].get('response_cache', {})
+responseCache = None
+if responseCacheParams.get('size', 0) > 0:
+    responseCache = ResponseCache(responseCacheParams['size'])
+RESPONSEMAXAGE = responseCacheParams.get('max_age', 0)
+fragmentCache = FragmentCache(params['app'].get('html_cache_size', 10000))
 retrieveKwargs = params['app']['retrieve']
 
+QUERYLOG = None
+if params['app'].get('query_log'):
+    QUERYLOG = QueryLog(
+        params['app']['query_log'],
+        max_bytes=params['app'].get('query_log_max_bytes', 10_000_000),
+        backups=params['app'].get('query_log_backups', 1))
+MAXBATCHSIZE = params['app'].get('max_batch_size', 256)
+if not PRELOAD:
+    generations.current.index.warmUpQueryCache(QUERYLOG)
+    generations.startWatching()
+atexit.register(lambda: generations.current.index.saveQueryCache())
+
+
+def initWorker():
+    """
+    Initialize a worker forked from the process that preloaded the app.
+    """
+    generations.current.index.checkDeferredQueryEncoder()
+    generations.current.index.warmUpQueryCache(QUERYLOG)
+    generations.startWatching()
+
+
 # some stats
-authors = set([
-    a for doc in corpus.documents for a in doc.authors])
+authors = set(generations.current.corpus.store.authors)
 a0 = len(authors)
 print(f"Local app: found {a0} different authors.")
 
@@ -43,6 +86,126 @@ def castFloat(k):
         abort(400)
 
 
+def getQueryParams(args, authors=False):
+    """
+    Read the parameters of a query from a query string or a batch entry,
+    using the app defaults for the missing ones. The `method` is only read
+    for the `authors` queries.
+    """
+    defaults = params['app']['retrieve']
+    nb_show = args.get('hits')
+    if nb_show is None:
+        nb_show = params['app']['show']
+    score_threshold = args.get('score_threshold')
+    if score_threshold is None:
+        score_threshold = defaults['score_threshold']
+    min_year = args.get('min_year')
+    if min_year is None:
+        min_year = defaults['min_year']
+
+    queryParams = {
+        'fields': getFields(args),
+        'dedup': str(args.get('dedup', 'false')).lower() in ['true', '1'],
+        'offset': getCursorOffset(args),
+        'query': args.get('query'),
+        'nb_show': castInt(nb_show),
+        'score_threshold': castFloat(score_threshold),
+        'min_year': castInt(min_year),
+        'rank_metric': getRankMetric(args.get('rank_metric')),
+    }
+    checkPage(queryParams['offset'], queryParams['nb_show'])
+    if authors:
+        queryParams['method'] = getAuthorsMethod(args)
+    return queryParams
+
+
+def getFields(args):
+    """
+    Fields of the results to return, given as a comma separated list (or a
+    json list in batches), `metadata.<key>` selecting the metadata keys.
+    None to return all of them.
+    """
+    fields = args.get('fields')
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    if not isinstance(fields, list) or not all(
+            isinstance(f, str) for f in fields):
+        abort(400)
+    return tuple(sorted(set(f.strip() for f in fields if f.strip())))
+
+
+def getCursorOffset(args):
+    """
+    Offset in the ranked results of the page designated by the `cursor`
+    argument (0 if none). Cursors expire when the index generation changes.
+    """
+    return readCursor(args.get('cursor'), generations.current.id)
+
+
+def getRankMetric(rank_metric):
+    """
+    Metric ranking the results of a query, the app default if missing.
+    """
+    if rank_metric is None:
+        rank_metric = params['app']['retrieve']['rank_metric']
+    if not rank_metric in generations.current.corpus.rankMetrics:
+        abort(400)
+    return rank_metric
+
+
+def getQueryText(query):
+    """
+    Text of a form query, rejected if empty.
+    """
+    if query is None or not query.strip():
+        abort(400)
+    return query
+
+
+def getAuthorsMethod(args):
+    """
+    How authors are retrieved: `aggregate` (documents scores aggregated per
+    author) or `profiles` (search of the author profiles, if enabled).
+    """
+    method = args.get('method')
+    if method is None:
+        method = params['app']['retrieve'].get('authors_method', 'aggregate')
+    corpus = generations.current.corpus
+    if not method in corpus.authorsMethods:
+        abort(400)
+    if method == 'profiles' and corpus.profiles is None:
+        abort(400)
+    return method
+
+
+def getBatchParams(authors=False):
+    """
+    Read the queries of a batch request from its json body.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('queries')
+    if not isinstance(data, list) or not data or len(data) > MAXBATCHSIZE:
+        abort(400)
+
+    batch = []
+    for entry in data:
+        if isinstance(entry, str):
+            entry = {'query': entry}
+        if not isinstance(entry, dict) or not isinstance(
+                entry.get('query'), str):
+            abort(400)
+        batch.append(getQueryParams(entry, authors))
+    return batch
+
+
+def logQuery(endpoint, query):
+    if QUERYLOG is not None and query:
+        QUERYLOG.write(endpoint, query)
+
+
 def getFormHtml(imageUrl, imageWidth):
     t = "Veuillez saisir une phrase "
     t += "(sujet, projet de recherche ou d'article...) "
@@ -80,45 +243,144 @@ def getFormHtml(imageUrl, imageWidth):
               <input type="submit" value="RECHERCHER">
           </form>'''
 
-def formatDocsReponseHtml(query, res, nb_show, imageUrl, imageWidth):
-    html = f'''
+def getResultsHeaderHtml(query, title, imageUrl, imageWidth):
+    return f'''
         <img src={imageUrl} alt="" style="width:{imageWidth}px;">
         <h2>Experts search engine</h2>
         </br>
         <h3>Votre requête :</h3>
         <p>{query}</p>
-        <h3>Documents trouvés :</h3>
+        <h3>{title}</h3>
     '''
-    for r in res[:nb_show]:
 
-        # authors_names = r['doc'].getAuthorsFullNamesStr()
-        authors = r['doc'].getAuthors()
-        authors_links = []
-        for author in authors:
-            authorLink = getAuthorHalLink(author)
-            if authorLink:
-                authorNom = f"<a href='{authorLink}'>{author.fullName}</a>"
-            else:
-                authorNom = author.fullName
-            authors_links.append(authorNom)
-        authors_links = ', '.join(authors_links)
-
-        phrases_list = """<ol>"""
-        for phrase, score in zip(r['doc_phrases'], r['doc_scores']):
-            phrases_list += f"<li>{score:.3f} {' '.join(phrase)}</li>"
-        phrases_list += """</ol>"""
-
-        html += f'''
-            <p><b>  Document # {r['rank'] + 1}</b><p>
-            <p><b>  titre :</b>  {r['doc'].title}<p>
-            <p><b>  date publication :</b>  {r['doc'].publication_date}<p>
-            <p><b>  link HAL :</b> <a href="{r['doc'].uri}">{r['doc'].uri}</a><p>
-            <p><b>  auteur·ice·s :</b>  {authors_links}<p>
+
+def getAuthorKey(author):
+    """
+    Fields of an author rendered in the fragments: authors are only equal
+    as `Author` objects by their authIdHal, their names and labs may differ.
+    """
+    return (
+        author.fullName, author.authIdHal, tuple(author.authLabs),
+        tuple(author.authSciencesPoSignature))
+
+
+def getAuthorNameHtml(generation, author):
+    def render():
+        authorLink = getAuthorHalLink(author)
+        if authorLink:
+            return f"<a href='{authorLink}'>{author.fullName}</a>"
+        return author.fullName
+    return fragmentCache.get(
+        (generation, 'name', getAuthorKey(author)), render)
+
+
+def getAuthorHtml(generation, author):
+    def render():
+        signature = author.authSciencesPoSignature
+        if not signature:
+            signature = [""]
+        return f'''
+            <p><b>  nom : </b>{getAuthorNameHtml(generation, author)}<p>
+            <p><b>  id HAL :</b>  {author.authIdHal}<p>
+            <p><b>  laboratoires :</b>  {' AND '.join(author.authLabs)}<p>
+            <p><b>  signature : <a href="{signature[0]}">{signature[0]}</a></b><p>'''
+    return fragmentCache.get(
+        (generation, 'author', getAuthorKey(author)), render)
+
+
+def getDocumentHtml(generation, doc):
+    def render():
+        authors_links = ', '.join([
+            getAuthorNameHtml(generation, author)
+                for author in doc.getAuthors()])
+        return f'''
+            <p><b>  titre :</b>  {doc.title}<p>
+            <p><b>  date publication :</b>  {doc.publication_date}<p>
+            <p><b>  link HAL :</b> <a href="{doc.uri}">{doc.uri}</a><p>
+            <p><b>  auteur·ice·s :</b>  {authors_links}<p>'''
+    return fragmentCache.get((generation, 'doc', doc.record), render)
+
+
+def getEvidenceHtml(generation, doc):
+    def render():
+        return f'{" ".join(doc.phrases)} <a href="{doc.uri}">doc</a>'
+    return fragmentCache.get((generation, 'evidence', doc.position), render)
+
+
+def formatDocsReponseHtml(res, nb_show, generation):
+    """
+    HTML of the documents results, one fragment per result.
+    """
+    for r in res[:nb_show]:
+        doc = r['doc']
+        phrases_list = ''.join([
+            f"<li>{score:.3f} {' '.join(phrase)}</li>"
+            for phrase, score in zip(r['doc_phrases'], r['doc_scores'])])
+
+        yield (
+            f"\n            <p><b>  Document # {r['rank'] + 1}</b><p>"
+            + getDocumentHtml(generation, doc)
+            + f'''
             <p><b>  aggregation score :</b>  {r['rank_score']:.3f}<p>
-            <p><b>  phrases similaires :</b> <i>{phrases_list}</i><p>
+            <p><b>  phrases similaires :</b> <i><ol>{phrases_list}</ol></i><p>
             <br>
-        '''
-    return html
+        ''')
+
+
+def streamHtml(header, render):
+    """
+    Streamed HTML page: the header is sent before `render` retrieves the
+    results and renders their fragments.
+    """
+    def generate():
+        yield header
+        yield from render()
+
+    response = Response(stream_with_context(generate()), mimetype='text/html')
+    # let nginx forward the fragments as they are rendered
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def projectMetadata(doc, fields):
+    """
+    Metadata keys of a document selected by the `metadata.<key>` fields,
+    all of them (encoded once, see `getMetadataJson`) if there are none.
+    """
+    keys = []
+    if fields is not None:
+        keys = [f[len('metadata.'):] for f in fields if f.startswith('metadata.')]
+    if not keys:
+        return doc.metadataJson
+    metadata = doc.metadata
+    return {k: metadata[k] for k in keys if k in metadata}
+
+
+def projectResult(result, fields, metadataKey):
+    selected = set(fields)
+    if any(f.startswith('metadata.') for f in fields):
+        selected.add(metadataKey)
+    return {k: v for k, v in result.items() if k in selected}
+
+
+def formatDocsReponseJson(res, nb_show, fields=None, documents=None):
+    """
+    JSON results of a documents query. When `documents` is a dict the
+    metadata are moved to it, keyed by halId, and the results only give the
+    halId.
+    """
+    reponses = []
+    for r in res[:nb_show]:
+        tmp = dict(r)
+        doc = tmp.pop('doc')
+        tmp['metadata'] = projectMetadata(doc, fields)
+        if documents is not None:
+            documents[doc.halId] = tmp['metadata']
+            tmp['metadata'] = doc.halId
+        if fields is not None:
+            tmp = projectResult(tmp, fields, 'metadata')
+        reponses.append(tmp)
+    return reponses
 
 
 def getAuthorHalLink(author):
@@ -135,46 +397,122 @@ def getAuthorHalLink(author):
     return None
 
 
-def formatAuthorsReponseHtml(query, res, nb_show, imageUrl, imageWidth):
-    html = f'''
-        <img src={imageUrl} alt="" style="width:{imageWidth}px;">
-        <h2>Experts search engine</h2>
-        </br>
-        <h3>Votre requête :</h3>
-        <p>{query}</p>
-        <h3>Auteur·ice·s trouvé·es :</h3>
-    '''
+def formatAuthorsReponseHtml(res, nb_show, generation):
+    """
+    HTML of the authors results, one fragment per result.
+    """
     for r in res[:nb_show]:
-        author = r['author']
+        phrases_list = ''.join([
+            f'<li>{score:.3f} '
+            f'{getEvidenceHtml(generation, doc)}</li>'
+            for score, doc in zip(r['docs_scores'], r['docs'])])
+
+        yield (
+            f"\n            <p><b>  auteur·ice # {r['rank'] + 1}</b><p>"
+            + getAuthorHtml(generation, r['author'])
+            + f'''
+            <p><b>  aggregation score :</b>  {r['rank_score']:.3f}<p>
+            <p><b>  phrases similaires :</b> <i><ol>{phrases_list}</ol></i><p>
+            <br>
+        ''')
 
-        signature = author.authSciencesPoSignature
-        if not signature:
-            signature = [""]
 
-        phrases_list = """<ol>"""
-        for n, (score, doc) in enumerate(zip(r['docs_scores'], r['docs'])):
-                phrases_list += f'<li>{score:.3f} {" ".join(doc.phrases)} <a href="{doc.uri}">doc</a></li>'
-        phrases_list += """</ol>"""
+def formatAuthorsReponseJson(res, nb_show, fields=None, documents=None):
+    """
+    JSON results of an authors query. When `documents` is a dict the
+    metadata of the documents are stored once in it, keyed by halId, and
+    the results only give the halIds.
+    """
+    reponses = []
+    for r in res[:nb_show]:
+        tmp = {
+            'position': r['rank'] + 1,
+            'author_name': r['author'].fullName,
+            'author_id-hal': r['author'].authIdHal,
+            'author_labs_id': r['author'].authLabs,
+            'aggregation score': r['rank_score'],
+            'author_signature': r['author'].authSciencesPoSignature,
+        }
+        tmp['results_phrases'] = [f'{score:.3f} {" ".join(doc.phrases)}'
+            for score, doc in zip(r['docs_scores'], r['docs'])]
+
+        metadata = [projectMetadata(doc, fields) for doc in r['docs']]
+        if documents is not None:
+            for doc, m in zip(r['docs'], metadata):
+                documents[doc.halId] = m
+            metadata = [doc.halId for doc in r['docs']]
+        tmp['results_metadata'] = metadata
 
-        authorLink = getAuthorHalLink(r['author'])
-        if authorLink:
-            authorNom = f"<a href='{authorLink}'>{r['author'].fullName}</a>"
-        else:
-            authorNom = r['author'].fullName
-
-        html += f'''
-            <p><b>  auteur·ice # {r['rank'] + 1}</b><p>
-            <p><b>  nom : </b>{authorNom}<p>
-            <p><b>  id HAL :</b>  {r['author'].authIdHal}<p>
-            <p><b>  laboratoires :</b>  {' AND '.join(r['author'].authLabs)}<p>
-            <p><b>  signature : <a href="{signature[0]}">{signature[0]}</a></b><p>
-            <p><b>  aggregation score :</b>  {r['rank_score']:.3f}<p>
-            <p><b>  phrases similaires :</b> <i>{phrases_list}</i><p>
-            <br>
-        '''
+        if fields is not None:
+            tmp = projectResult(tmp, fields, 'results_metadata')
+        reponses.append(tmp)
+
+    return reponses
+
+
+def formatQueryResponse(res, queryParams, formatter, generation):
+    """
+    Page of the results of a query starting at its cursor offset, with the
+    cursor of the next page (in the `generation` the results come from) if
+    there are more results.
+    """
+    offset, nb_show = queryParams['offset'], queryParams['nb_show']
+    documents = {} if queryParams['dedup'] else None
+    response = {'reponses': formatter(
+        res[offset:], nb_show, queryParams['fields'], documents)}
+    if documents is not None:
+        response['documents'] = documents
+    nextOffset = getNextOffset(len(res), offset, nb_show)
+    if nextOffset is not None:
+        response['next_cursor'] = makeCursor(nextOffset, generation.id)
+    return response
+
+
+def jsonResponse(obj):
+    """
+    JSON response of `obj`, encoded with orjson if available (the encoded
+    metadata of the documents being spliced as is, see `getMetadataJson`).
+    """
+    return Response(dumps(obj), mimetype='application/json')
+
+
+def getPageLimit(queryParams):
+    # one more result tells if there is a next page
+    return queryParams['offset'] + queryParams['nb_show'] + 1
 
-    return html
 
+def cachedResponse(endpoint, queryParams, build):
+    """
+    Response of a query built by `build(generation)`, or served from the response cache
+    when the active generation of the index already answered the same query
+    with the same parameters. Responses have an ETag (304 responses to
+    matching conditional requests) and can be cached by the clients and
+    the proxy for `max_age` seconds.
+    """
+    # the same generation builds the response and keys it, even if a reload
+    # swaps it meanwhile
+    generation = generations.current
+    key = ResponseCache.makeKey(
+        endpoint, generation.id, queryParams['query'], queryParams)
+
+    entry = None
+    if responseCache is not None:
+        entry = responseCache.get(key)
+    if entry is None:
+        response = build(generation)
+        body = response.get_data()
+        entry = (
+            body, response.mimetype, ResponseCache.makeETag(generation.id, body))
+        if responseCache is not None:
+            responseCache.put(key, *entry)
+
+    body, mimetype, etag = entry
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    if RESPONSEMAXAGE > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = RESPONSEMAXAGE
+    return response.make_conditional(request)
 
 
 app = Flask(__name__)
@@ -184,38 +522,105 @@ def landing():
     return redirect("authors/form")
 
 
+@app.route('/health')
+def health():
+    """
+    Readiness of the app and active generation of the index.
+    """
+    return jsonify(
+        status='ok', generation=generations.current.number,
+        generation_id=generations.current.id)
+
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def adminReload():
+    """
+    Reload status (GET), or load a new generation of the index in the
+    background (POST), rebuilt from the dump by `create_index.py` with
+    `rebuild=true`. Requires
+    the `X-Admin-Token` header to match the configured `admin_token`.
+    """
+    if not ADMINTOKEN:
+        abort(404)
+    if request.headers.get('X-Admin-Token') != ADMINTOKEN:
+        abort(403)
+
+    if request.method == 'POST':
+        rebuild = request.args.get('rebuild', 'false').lower() in ['true', '1']
+        started = generations.reload(rebuild=rebuild)
+        return jsonify(started=started, **generations.status()), \
+            202 if started else 409
+    return jsonify(**generations.status())
+
+
+@app.route('/admin/stats')
+def adminStats():
+    """
+    Hit rates of the response and query caches. Requires the
+    `X-Admin-Token` header like `/admin/reload`.
+    """
+    if not ADMINTOKEN:
+        abort(404)
+    if request.headers.get('X-Admin-Token') != ADMINTOKEN:
+        abort(403)
+
+    queryCache = generations.current.index.queryCache
+    return jsonify(
+        generation=generations.current.number,
+        generation_id=generations.current.id,
+        response_cache=responseCache.stats() if responseCache else None,
+        query_cache=str(queryCache) if queryCache else None)
+
+
 @app.route('/docs/query')
 def queryDocs():
     query = request.args.get('query')
     if query is None:
         return {'error': 'Missing `query` argument in query string'}
-    nb_show = request.args.get('hits')
-    if nb_show is None:
-        nb_show = params['app']['show']
-    nb_show = castInt(nb_show)
-    score_threshold = request.args.get('score_threshold')
-    if score_threshold is None:
-        score_threshold = params['app']['retrieve']['score_threshold']
-    min_year = request.args.get('min_year')
-    if min_year is None:
-        min_year = params['app']['retrieve']['min_year']
-    rank_metric = request.args.get('rank_metric')
-    if rank_metric is None:
-        rank_metric = params['app']['retrieve']['rank_metric']
+    queryParams = getQueryParams(request.args)
+
+    logQuery('docs/query', query)
+
+    def build(generation):
+        res = generation.corpus.retrieveDocuments(
+            query=query,
+            top_k=castInt(params['app']['retrieve']['top_k']),
+            score_threshold=queryParams['score_threshold'],
+            min_year=queryParams['min_year'],
+            rank_metric=queryParams['rank_metric'],
+            limit=getPageLimit(queryParams)
+            )
+        return jsonResponse(
+            formatQueryResponse(
+                res, queryParams, formatDocsReponseJson, generation))
+
+    return cachedResponse('docs/query', queryParams, build)
+
+
+@app.route('/docs/batch', methods=['POST'])
+def batchDocs():
+    """
+    Run a batch of queries, given as a json list (or a json object with a
+    `queries` list) of objects with the same keys as the `/docs/query` query
+    string. Each query gets the response of `/docs/query`.
+    """
+    batch = getBatchParams()
 
-    res = corpus.retrieveDocuments(
-        query=query,
+    for queryParams in batch:
+        logQuery('docs/batch', queryParams['query'])
+    generation = generations.current
+    res = generation.corpus.retrieveDocumentsBatch(
+        queries=[b['query'] for b in batch],
         top_k=castInt(params['app']['retrieve']['top_k']),
-        score_threshold=castFloat(score_threshold),
-        min_year=castInt(min_year),
-        rank_metric=rank_metric
+        score_thresholds=[b['score_threshold'] for b in batch],
+        min_years=[b['min_year'] for b in batch],
+        rank_metrics=[b['rank_metric'] for b in batch],
+        limits=[getPageLimit(b) for b in batch]
         )
 
-    reponses = res[:nb_show]
-    for r in reponses:
-        del r['doc']
-
-    return jsonify(reponses=reponses)
+    return jsonResponse({'reponses': [
+        formatQueryResponse(r, b, formatDocsReponseJson, generation)
+            for r, b in zip(res, batch)]})
 
 @app.route('/docs/form', methods=['GET', 'POST'])
 def formDocs():
@@ -225,21 +630,38 @@ def formDocs():
     """
 
     if request.method == 'POST':
-        query = request.form.get('query')
+        # invalid parameters are rejected before the page starts streaming
+        query = getQueryText(request.form.get('query'))
         nb_show = request.form.get('hits')
         if nb_show is None:
             nb_show = params['app']['show']
         score_threshold = request.form.get('score_threshold')
         min_year = request.form.get('min_year')
-        rank_metric = request.form.get('rank_metric')
-        res = corpus.retrieveDocuments(
-            query=query,
-            top_k=castInt(params['app']['retrieve']['top_k']),
-            score_threshold=castFloat(score_threshold),
-            min_year=castInt(min_year),
-            rank_metric=rank_metric
-            )
-        return formatDocsReponseHtml(query, res, castInt(nb_show), LOGOURL, IMAGEWIDTH)
+        rank_metric = getRankMetric(request.form.get('rank_metric'))
+        top_k = castInt(params['app']['retrieve']['top_k'])
+        score_threshold = castFloat(score_threshold)
+        min_year = castInt(min_year)
+        nb_show = castInt(nb_show)
+        checkPage(0, nb_show)
+        logQuery('docs/form', query)
+
+        def render():
+            generation = generations.current
+            res = generation.corpus.retrieveDocuments(
+                query=query,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                min_year=min_year,
+                rank_metric=rank_metric,
+                limit=nb_show
+                )
+            return formatDocsReponseHtml(
+                res, nb_show, generation.id)
+
+        return streamHtml(
+            getResultsHeaderHtml(
+                query, 'Documents trouvés :', LOGOURL, IMAGEWIDTH),
+            render)
 
     return getFormHtml(LOGOURL, IMAGEWIDTH)
 
@@ -249,48 +671,52 @@ def queryAuthors():
     query = request.args.get('query')
     if query is None:
         return {'error': 'Missing `query` argument in query string'}
-    nb_show = request.args.get('hits')
-    if nb_show is None:
-        nb_show = params['app']['show']
-    nb_show = castInt(nb_show)
-    score_threshold = request.args.get('score_threshold')
-    if score_threshold is None:
-        score_threshold = params['app']['retrieve']['score_threshold']
-    min_year = request.args.get('min_year')
-    if min_year is None:
-        min_year = params['app']['retrieve']['min_year']
-    rank_metric = request.args.get('rank_metric')
-    if rank_metric is None:
-        rank_metric = params['app']['retrieve']['rank_metric']
+    queryParams = getQueryParams(request.args, authors=True)
 
-    res = corpus.retrieveAuthors(
-        query=query,
-        top_k=castInt(params['app']['retrieve']['top_k']),
-        score_threshold=castFloat(score_threshold),
-        min_year=castInt(min_year),
-        rank_metric=rank_metric
-        )
+    logQuery('authors/query', query)
 
-    res = res[:nb_show]
+    def build(generation):
+        res = generation.corpus.retrieveAuthors(
+            query=query,
+            top_k=castInt(params['app']['retrieve']['top_k']),
+            score_threshold=queryParams['score_threshold'],
+            min_year=queryParams['min_year'],
+            rank_metric=queryParams['rank_metric'],
+            limit=getPageLimit(queryParams),
+            method=queryParams['method']
+            )
+        return jsonResponse(
+            formatQueryResponse(
+                res, queryParams, formatAuthorsReponseJson, generation))
 
-    reponses = []
-    for r in res:
-        tmp = {
-            'position': r['rank'] + 1,
-            'author_name': r['author'].fullName,
-            'author_id-hal': r['author'].authIdHal,
-            'author_labs_id': r['author'].authLabs,
-            'aggregation score': r['rank_score'],
-            'author_signature': r['author'].authSciencesPoSignature,
-        }
-        tmp['results_phrases'] = [f'{score:.3f} {" ".join(doc.phrases)}'
-            for score, doc in zip(r['docs_scores'], r['docs'])]
+    return cachedResponse('authors/query', queryParams, build)
 
-        tmp['results_metadata'] = [doc.metadata for doc in r['docs']]
 
-        reponses.append(tmp)
+@app.route('/authors/batch', methods=['POST'])
+def batchAuthors():
+    """
+    Run a batch of queries, given as a json list (or a json object with a
+    `queries` list) of objects with the same keys as the `/authors/query`
+    query string. Each query gets the response of `/authors/query`.
+    """
+    batch = getBatchParams(authors=True)
+
+    for queryParams in batch:
+        logQuery('authors/batch', queryParams['query'])
+    generation = generations.current
+    res = generation.corpus.retrieveAuthorsBatch(
+        queries=[b['query'] for b in batch],
+        top_k=castInt(params['app']['retrieve']['top_k']),
+        score_thresholds=[b['score_threshold'] for b in batch],
+        min_years=[b['min_year'] for b in batch],
+        rank_metrics=[b['rank_metric'] for b in batch],
+        limits=[getPageLimit(b) for b in batch],
+        methods=[b['method'] for b in batch]
+        )
 
-    return jsonify(reponses=reponses)
+    return jsonResponse({'reponses': [
+        formatQueryResponse(r, b, formatAuthorsReponseJson, generation)
+            for r, b in zip(res, batch)]})
 
 
 @app.route('/authors/form', methods=['GET', 'POST'])
@@ -301,22 +727,40 @@ def formAuthors():
     """
 
     if request.method == 'POST':
-        query = request.form.get('query')
+        # invalid parameters are rejected before the page starts streaming
+        query = getQueryText(request.form.get('query'))
         nb_show = request.form.get('hits')
         if nb_show is None:
             nb_show = params['app']['show']
         score_threshold = request.form.get('score_threshold')
         min_year = request.form.get('min_year')
-        rank_metric = request.form.get('rank_metric')
-
-        res = corpus.retrieveAuthors(
-            query=query,
-            top_k=castInt(params['app']['retrieve']['top_k']),
-            score_threshold=castFloat(score_threshold),
-            min_year=castInt(min_year),
-            rank_metric=rank_metric
-            )
-        return formatAuthorsReponseHtml(query, res, castInt(nb_show), LOGOURL, IMAGEWIDTH)
+        rank_metric = getRankMetric(request.form.get('rank_metric'))
+        method = getAuthorsMethod(request.form)
+        top_k = castInt(params['app']['retrieve']['top_k'])
+        score_threshold = castFloat(score_threshold)
+        min_year = castInt(min_year)
+        nb_show = castInt(nb_show)
+        checkPage(0, nb_show)
+        logQuery('authors/form', query)
+
+        def render():
+            generation = generations.current
+            res = generation.corpus.retrieveAuthors(
+                query=query,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                min_year=min_year,
+                rank_metric=rank_metric,
+                limit=nb_show,
+                method=method
+                )
+            return formatAuthorsReponseHtml(
+                res, nb_show, generation.id)
+
+        return streamHtml(
+            getResultsHeaderHtml(
+                query, 'Auteur·ice·s trouvé·es :', LOGOURL, IMAGEWIDTH),
+            render)
 
     return getFormHtml(LOGOURL, IMAGEWIDTH)
 
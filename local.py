@@ -20,11 +20,11 @@ with open(config, "r") as fh:
 params['index']['index_path'] = setIndexPath(params)
 index = Index(**params['index'])
 corpus = Corpus(index=index, **params['corpus'])
-retrieveKwargs = params['app']['retrieve']
+retrieveKwargs = dict(params['app']['retrieve'])
+authorsMethod = retrieveKwargs.pop('authors_method', 'aggregate')
 
 # some stats
-authors = set([
-    a for doc in corpus.documents for a in doc.authors])
+authors = set(corpus.store.authors)
 a0 = len(authors)
 
 # labsIds = [a.authLabIdHal for a in authors]
@@ -39,7 +39,8 @@ print(f"Local app: found {a0} different authors") #  from {li0} labs.")# 1. Jean
 query = "Moralisme progressiste et pratiques punitives dans la lutte contre les violences sexistes"
 
 print(f"\n\n\n\n\nLocal app: query = `{query}`")
-res = corpus.retrieveAuthors(query=query, **retrieveKwargs)
+res = corpus.retrieveAuthors(
+    query=query, method=authorsMethod, **retrieveKwargs)
 print(res[:params['app']['show']])
 
 
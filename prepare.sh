@@ -12,5 +12,7 @@ export APPCONFIG=$(pwd)/config.yaml
 mkdir -p index
 python -c "import nltk; nltk.download('punkt')"
 python create_index.py --config=config.yaml || (echo "ERROR while building index" && exit)
+# calibrate the query time ef only when the HNSW graph was (re)built
+python calibrate_index.py || (echo "ERROR while calibrating index" && exit)
 
 exec "$@"
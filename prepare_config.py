@@ -116,6 +116,10 @@ env_vars = {
         "hierarchy": "corpus/use_keys",
         "key": "keywords",
         "convert": strToBool
+    },
+    "ADMIN_TOKEN": {
+        "hierarchy": "app/reload",
+        "key": "admin_token"
     }
 }
 
@@ -0,0 +1,169 @@
+import re
+import sys
+import json
+import time
+import random
+import threading
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in of the HAL search api, serving the documents of a dump (or
+# generated ones) to try `get_dump.py` without HAL, e.g. with
+# `baseUrl: http://127.0.0.1:8983` in the config. Only what the download
+# uses is implemented: the `q` query is ignored, `fq` may filter a range of
+# docids, results are sorted by docid and paged with `cursorMark`.
+#
+# Also used by the download tests, through `HalServer`.
+
+
+def generateDocs(nb_docs):
+    docids = random.Random(0).sample(range(1, 10 * nb_docs), nb_docs)
+    return [{
+        'docid': docid,
+        'halId_s': f'hal-{docid:08d}',
+        'uri_s': f'https://hal.science/hal-{docid:08d}',
+        'title_s': [f'Document {docid}'],
+        'abstract_s': [f'Abstract of the document {docid}.'],
+        'publicationDate_s': f'{2000 + docid % 24}-01-01',
+        'openAccess_bool': docid % 2 == 0,
+        'authFullNameId_fs': [f'Author {docid % 97}_FacetSep_{docid % 97}'],
+    } for docid in docids]
+
+
+def loadDocs(dump):
+    if dump.endswith('.gz'):
+        import gzip
+        f = gzip.open(dump, 'rt', encoding='utf-8')
+    else:
+        f = open(dump, encoding='utf-8')
+    with f:
+        docs = [json.loads(line) for line in f if line.strip()]
+    for n, doc in enumerate(docs):
+        doc.setdefault('docid', n + 1)
+    return docs
+
+
+def parseRange(fq):
+    match = re.fullmatch(r'docid:\[(\*|\d+) TO (\*|\d+)\]', fq)
+    if match is None:
+        raise ValueError(f"Unsupported filter {fq}")
+    start, end = match.groups()
+    return (
+        -1 if start == '*' else int(start),
+        sys.maxsize if end == '*' else int(end))
+
+
+def search(docs, query):
+    selected = docs
+    for fq in query.get('fq', []):
+        start, end = parseRange(fq)
+        selected = [doc for doc in selected if start <= doc['docid'] <= end]
+
+    sort = query.get('sort', ['docid asc'])[0]
+    if sort == 'docid desc':
+        selected = selected[::-1]
+    elif sort != 'docid asc':
+        raise ValueError(f"Unsupported sort {sort}")
+
+    rows = int(query.get('rows', ['10'])[0])
+    cursorMark = query.get('cursorMark', [None])[0]
+    page = selected
+    if cursorMark not in [None, '*']:
+        page = [doc for doc in selected if doc['docid'] > int(cursorMark)]
+    page = page[:rows]
+
+    fields = None
+    if 'fl' in query:
+        fields = [f for fl in query['fl'] for f in fl.split(',') if f]
+    res = {'response': {
+        'numFound': len(selected),
+        'docs': [
+            {k: v for k, v in doc.items() if fields is None or k in fields}
+                for doc in page]}}
+    if cursorMark is not None:
+        res['nextCursorMark'] = str(page[-1]['docid']) if page else cursorMark
+    return res
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            server.nbRequests += 1
+            fail = server.random.random() < server.failRate
+            server.nbFailures += fail
+        if fail:
+            return self.reply(503, {'error': 'Service unavailable'})
+        url = urlparse(self.path)
+        if not url.path.startswith('/search/'):
+            return self.reply(404, {'error': 'Not found'})
+        try:
+            res = search(server.docs, parse_qs(url.query))
+        except ValueError as e:
+            return self.reply(400, {'error': str(e)})
+        self.reply(200, res)
+
+    def reply(self, status, res):
+        body = json.dumps(res).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HalServer(ThreadingHTTPServer):
+    """
+    Server of `docs`, answering a `fail_rate` fraction of the requests with
+    a 503 error and waiting `delay` seconds before answering. Port 0 picks
+    a free port (see `url`).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, docs, host='127.0.0.1', port=8983, fail_rate=0., delay=0.):
+        super().__init__((host, port), Handler)
+        self.docs = sorted(docs, key=lambda doc: doc['docid'])
+        self.failRate = fail_rate
+        self.delay = delay
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.nbRequests = 0
+        self.nbFailures = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('--host', type=str, default="127.0.0.1")
+    ap.add_argument('--port', type=int, default=8983)
+    ap.add_argument('--dump', type=str, default=None,
+        help="json lines dump whose documents are served (gzip if .gz)")
+    ap.add_argument('--nb-docs', type=int, default=25000,
+        help="number of documents generated when there is no dump")
+    ap.add_argument('--fail-rate', type=float, default=0.,
+        help="probability of answering a request with a 503 error")
+    ap.add_argument('--delay', type=float, default=0.,
+        help="seconds waited before answering a request")
+    args = ap.parse_args()
+
+    docs = generateDocs(args.nb_docs) if args.dump is None else loadDocs(args.dump)
+    server = HalServer(
+        docs, args.host, args.port, fail_rate=args.fail_rate, delay=args.delay)
+    print(f"Serving {len(docs)} documents on {server.url}")
+    server.serve_forever()
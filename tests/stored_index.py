@@ -0,0 +1,46 @@
+import numpy as np
+
+from halexp.index import Index
+
+# Index stand-in for the tests of the search backends and author profiles.
+
+
+def randomEmbeddings(length, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((length, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class StoredIndex:
+    """
+    Index attributes used by the search backends, for the `embeddings`
+    (normalized random ones by default) saved in `directory`.
+    """
+
+    labelsToPositions = Index.labelsToPositions
+    getArtifactPath = Index.getArtifactPath
+    normalize = Index.normalize
+    exactScores = Index.exactScores
+    exactMaxElements = 10000
+
+    def __init__(self, directory, length, dim=16, storage_dtype='float32',
+        seed=0, embeddings=None, labels=None):
+        if embeddings is None:
+            embeddings = randomEmbeddings(length, dim, seed)
+        length, dim = embeddings.shape
+        self.path = str(directory / 'index.bin')
+        self.paramsPath = str(directory / 'index.params.json')
+        self.embeddingsPath = str(directory / 'index.embeddings.npy')
+        np.save(self.embeddingsPath, embeddings)
+        self.embeddings = np.load(self.embeddingsPath, mmap_mode='r')
+        self.length = length
+        if labels is None:
+            labels = np.arange(1, length + 1)
+        self.labels = np.asarray(labels, dtype=np.uint64)
+        self.positions = dict(zip(self.labels.tolist(), range(length)))
+        self.storageDtype = storage_dtype
+        self.rescoreFactor = 4
+        self.space = 'cosine'
+        self.embedding_size = dim
+        self.num_threads = 1
+        self.indexKwargs = {'M': 16, 'ef_construction': 100}
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from halexp.corpus import Corpus
+from halexp.index import Index
+
+
+# authors of each HAL document, its chunks being consecutive documents
+halAuthors = [['a', 'b'], ['b'], ['c', 'a'], ['d'], ['b', 'd', 'e'], ['f']]
+nbChunks = [3, 1, 2, 2, 3, 1]
+
+
+def makeCorpus():
+    """
+    Corpus with the aggregation matrices of `halAuthors`.
+    """
+    authors = sorted({a for names in halAuthors for a in names})
+    records = np.repeat(np.arange(len(halAuthors)), nbChunks)
+    corpus = object.__new__(Corpus)
+    corpus.authors = [SimpleNamespace(name=a) for a in authors]
+    corpus.documents = [
+        SimpleNamespace(halId=f'hal-{r}', phrases=[f'chunk {p}'], record=r)
+            for p, r in enumerate(records)]
+    corpus.docHalMatrix = sp.csr_matrix(
+        (np.ones(len(records), dtype=np.float32), (
+            np.arange(len(records)), records)),
+        shape=(len(records), len(halAuthors)))
+    rows, cols = zip(*[
+        (p, authors.index(a)) for p, r in enumerate(records)
+            for a in halAuthors[r]])
+    corpus.docAuthorMatrix = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(records), len(authors)))
+    return corpus
+
+
+def referenceRankScore(scores, rank_metric):
+    n = len(scores)
+    if rank_metric == 'median':
+        s = sorted(scores)
+        return (s[(n-1) // 2] + s[n // 2]) / 2
+    if rank_metric == 'sigmoid':
+        return sum(1/(1+np.exp(-0.5 * x)) * x for x in scores) / n
+    mean = sum(scores) / n
+    if rank_metric == 'log-mean':
+        return np.log(1+n) * mean
+    if rank_metric == 'sigmoid-mean':
+        return 1/(1+np.exp(-0.5 * n)) * mean
+    return mean
+
+
+def referenceAggregation(results, score_threshold, rank_metric, key):
+    """
+    Groups of the results above the threshold, scored one by one and sorted
+    by decreasing rank scores, ties in order of appearance.
+    """
+    groups = {}
+    for position, score in results:
+        if score < score_threshold:
+            continue
+        for group in key(position):
+            groups.setdefault(group, []).append((position, score))
+    ranked = sorted(
+        groups.items(), reverse=True,
+        key=lambda item: referenceRankScore(
+            [s for _, s in item[1]], rank_metric))
+    return [
+        (group, referenceRankScore([s for _, s in hits], rank_metric), hits)
+            for group, hits in ranked]
+
+
+def makeResults(seed):
+    """
+    Results of a query sorted by decreasing scores, with exact and near
+    ties between the chunks.
+    """
+    rng = np.random.default_rng(seed)
+    nb_docs = sum(nbChunks)
+    scores = rng.choice([0.3, 0.5, 0.5 + 1e-9, 0.7, 0.7 - 1e-12], nb_docs)
+    scores += rng.integers(0, 2, nb_docs) * rng.uniform(-0.2, 0.2, nb_docs)
+    positions = rng.permutation(nb_docs)
+    order = np.argsort(-scores, kind='stable')
+    return [(int(positions[p]), float(scores[p])) for p in order]
+
+
+@pytest.mark.parametrize('rank_metric', Corpus.rankMetrics)
+@pytest.mark.parametrize('score_threshold', [-1., 0.45])
+@pytest.mark.parametrize('limit', [None, 1, 3])
+@pytest.mark.parametrize('seed', range(5))
+def test_aggregation(seed, limit, score_threshold, rank_metric):
+    corpus = makeCorpus()
+    results = makeResults(seed)
+    positions, scores = map(np.array, zip(*results))
+    parsed = Index.parseAndFilterResults(
+        None, positions, scores, score_threshold)
+
+    authors = corpus.sortFilterAndFormatAuthorsResults(
+        parsed, rank_metric, limit)
+    expected = referenceAggregation(
+        results, score_threshold, rank_metric,
+        lambda p: corpus.docAuthorMatrix[p].indices.tolist())[:limit]
+    assert [r['author'].name for r in authors] == [
+        corpus.authors[a].name for a, _, _ in expected]
+    for r, (_, rank_score, hits) in zip(authors, expected):
+        assert r['rank_score'] == pytest.approx(rank_score, abs=1e-12)
+        assert r['docs_scores'] == [s for _, s in hits]
+        assert r['docs'] == [corpus.documents[p] for p, _ in hits]
+    assert [r['rank'] for r in authors] == list(range(len(authors)))
+
+    docs = corpus.sortFilterAndFormatDocsResults(parsed, rank_metric, limit)
+    expected = referenceAggregation(
+        results, score_threshold, rank_metric,
+        lambda p: [corpus.documents[p].record])[:limit]
+    assert [r['doc'].record for r in docs] == [r for r, _, _ in expected]
+    for r, (_, rank_score, hits) in zip(docs, expected):
+        assert r['rank_score'] == pytest.approx(rank_score, abs=1e-12)
+        assert r['doc_scores'] == [s for _, s in hits]
+        assert r['nb_hits'] == len(hits)
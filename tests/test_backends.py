@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import pytest
+
+from halexp.evaluation import exactSearch, recallAtK
+from halexp.backends import ExactBackend, HnswBackend, createBackend
+from stored_index import StoredIndex, randomEmbeddings
+
+
+def test_read_only_load(tmp_path):
+    index = StoredIndex(tmp_path, 100, storage_dtype='int8')
+    files = sorted(os.listdir(tmp_path))
+
+    # the serving processes refuse to build the missing files
+    with pytest.raises(ValueError):
+        ExactBackend(index).load()
+    with pytest.raises(ValueError):
+        HnswBackend(index).load()
+    assert sorted(os.listdir(tmp_path)) == files
+
+    ExactBackend(index).build(None, list(range(index.length)))
+    files = sorted(os.listdir(tmp_path))
+    ExactBackend(index).load()
+    assert sorted(os.listdir(tmp_path)) == files
+
+
+def test_incremental_hnsw_build(tmp_path):
+    old = StoredIndex(tmp_path, 300)
+    HnswBackend(old).build(None, [])
+    saved = [[int(label), f'hal-{label}', 0, 'hash'] for label in old.labels]
+
+    # 50 documents removed, 20 modified and 40 added
+    rng = np.random.default_rng(1)
+    embeddings = np.asarray(old.embeddings)
+    kept = np.arange(50, 300)
+    modified = rng.choice(len(kept), 20, replace=False)
+    newEmbeddings = np.concatenate([
+        embeddings[kept], randomEmbeddings(40, old.embedding_size, seed=2)])
+    newEmbeddings[modified] = randomEmbeddings(20, old.embedding_size, seed=3)
+    labels = np.concatenate([old.labels[kept], np.arange(1001, 1041)])
+    index = StoredIndex(
+        tmp_path, len(labels), embeddings=newEmbeddings, labels=labels)
+    toEmbed = sorted(modified.tolist() + list(range(len(kept), len(labels))))
+
+    backend = HnswBackend(index)
+    backend.build(saved, toEmbed)
+    # the graph saved by the update is loaded like in the serving processes
+    backend = HnswBackend(index)
+    backend.load()
+    backend.setEf(index.length)
+
+    # queries close to the new, modified and deleted documents
+    queries = np.concatenate([
+        newEmbeddings[toEmbed], embeddings[:50], embeddings[kept[modified]]])
+    positions, scores = backend.search(queries, 10)
+    expected, expectedScores = exactSearch(newEmbeddings, queries, 10)
+    np.testing.assert_array_equal(positions, expected)
+    np.testing.assert_allclose(scores, expectedScores, atol=1e-5)
+    # deleted documents are never returned by the graph
+    returned, _ = backend.graph.knn_query(queries, k=10)
+    assert set(returned.ravel().tolist()) <= set(labels.tolist())
+
+
+@pytest.fixture
+def hnsw(tmp_path):
+    index = StoredIndex(tmp_path, 1000)
+    backend = HnswBackend(index)
+    backend.build(None, [])
+    backend.setEf(200)
+    return backend
+
+
+def test_filtered_hnsw_search(hnsw):
+    index = hnsw.index
+    rng = np.random.default_rng(1)
+    queries = randomEmbeddings(20, index.embedding_size, seed=1)
+    allowed = rng.random(index.length) < 0.5
+
+    positions, scores = hnsw.search(queries, 10, allowed)
+    assert positions.shape == (20, 10)
+    assert allowed[positions].all()
+    expected, _ = exactSearch(
+        index.embeddings, queries, 10, np.flatnonzero(allowed))
+    assert recallAtK(positions, expected) > 0.9
+
+
+@pytest.mark.parametrize('nb_allowed', [0, 3, 10, 50, 150])
+def test_selective_filter(hnsw, nb_allowed):
+    index = hnsw.index
+    allowed = np.zeros(index.length, dtype=bool)
+    allowed[np.random.default_rng(2).choice(
+        index.length, nb_allowed, replace=False)] = True
+    queries = randomEmbeddings(5, index.embedding_size, seed=2)
+
+    positions, scores = hnsw.search(queries, 10, allowed)
+    assert positions.shape == (5, min(10, nb_allowed))
+    assert allowed[positions].all()
+    if nb_allowed:
+        expected, _ = exactSearch(
+            index.embeddings, queries, min(10, nb_allowed),
+            np.flatnonzero(allowed))
+        assert recallAtK(positions, expected) > 0.9
+
+
+def test_filtered_search_fallbacks(hnsw, monkeypatch):
+    index = hnsw.index
+    queries = randomEmbeddings(5, index.embedding_size, seed=3)
+    allowed = np.zeros(index.length, dtype=bool)
+
+    def failingQuery(*args, **kwargs):
+        raise RuntimeError("Cannot return the results in a contiguous 2D array.")
+
+    # few allowed documents: exact search without the graph
+    allowed[:HnswBackend.exactSearchFactor * 10] = True
+    monkeypatch.setattr(hnsw, 'knnQuery', failingQuery)
+    positions, _ = hnsw.search(queries, 10, allowed)
+    expected, _ = exactSearch(
+        index.embeddings, queries, 10, np.flatnonzero(allowed))
+    np.testing.assert_array_equal(positions, expected)
+
+    # the graph search fails to find enough allowed documents
+    allowed[:] = True
+    allowed[::7] = False
+    positions, _ = hnsw.search(queries, 10, allowed)
+    expected, _ = exactSearch(
+        index.embeddings, queries, 10, np.flatnonzero(allowed))
+    np.testing.assert_array_equal(positions, expected)
+
+
+def test_create_backend(tmp_path):
+    index = StoredIndex(tmp_path, 100)
+    assert isinstance(createBackend('auto', index, 100), ExactBackend)
+    assert isinstance(createBackend('auto', index, 99), HnswBackend)
+    assert isinstance(createBackend('exact', index, 10), ExactBackend)
+    assert isinstance(createBackend('hnsw', index, 1000), HnswBackend)
+    with pytest.raises(ValueError, match="Invalid search backend"):
+        createBackend('flat', index, 100)
+
+
+@pytest.mark.parametrize('storage_dtype', ['float32', 'int8'])
+def test_exact_hnsw_agreement(tmp_path, storage_dtype):
+    index = StoredIndex(tmp_path, 2000, storage_dtype=storage_dtype)
+    exact = createBackend('exact', index, 0)
+    exact.build(None, [])
+    hnsw = createBackend('hnsw', index, 0)
+    hnsw.build(None, [])
+    hnsw.setEf(200)
+
+    queries = randomEmbeddings(50, index.embedding_size, seed=1)
+    exactPositions, _ = exact.search(queries, 10)
+    positions, _ = hnsw.search(queries, 10)
+    assert recallAtK(positions, exactPositions) > 0.95
+    expected, _ = exactSearch(index.embeddings, queries, 10)
+    np.testing.assert_array_equal(exactPositions, expected)
+
+
+def test_auto_keeps_graph(tmp_path):
+    index = StoredIndex(tmp_path, 100)
+    HnswBackend(index).build(None, [])
+    saved = [[int(label), '', 0, ''] for label in index.labels]
+
+    # documents added while the corpus is small enough for the exact search
+    embeddings = np.concatenate([
+        np.asarray(index.embeddings),
+        randomEmbeddings(10, index.embedding_size, seed=1)])
+    index = StoredIndex(tmp_path, 110, embeddings=embeddings)
+    createBackend('auto', index, 1000).build(saved, list(range(100, 110)))
+    hnsw = HnswBackend(index)
+    hnsw.load()
+    assert hnsw.graph.element_count == 110
+
+    createBackend('exact', index, 1000).build(None, [])
+    assert not os.path.exists(index.path)
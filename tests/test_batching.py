@@ -0,0 +1,96 @@
+import os
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from halexp.batching import BatchEncoder
+
+
+def encode(queries):
+    return np.array([[len(q), q.count('a')] for q in queries], dtype=np.float32)
+
+
+def expected(queries):
+    return encode(queries).tolist()
+
+
+def runInChild(target):
+    """
+    Run `target` in a forked process and return its json result.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            result = {'result': target()}
+        except BaseException as e:
+            result = {'error': repr(e)}
+        with os.fdopen(write, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as f:
+        result = json.load(f)
+    os.waitpid(pid, 0)
+    assert 'error' not in result, result['error']
+    return result['result']
+
+
+def encodeConcurrently(encoder, spawn, join):
+    # first request of the worker, alone
+    results = []
+    join(spawn(lambda: results.append(encoder(['first']).tolist())))
+    assert results == [expected(['first'])]
+
+    queries = [[f'query {n}', 'a' * n] for n in range(20)]
+    results = [None] * len(queries)
+
+    def run(n):
+        results[n] = encoder(queries[n]).tolist()
+
+    workers = [spawn(run, n) for n in range(len(queries))]
+    for worker in workers:
+        join(worker)
+    assert results == [expected(q) for q in queries]
+    return encoder.nbBatches
+
+
+def startThread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    return thread
+
+
+def test_batches():
+    encoder = BatchEncoder(encode, max_batch_size=8, max_wait_ms=20)
+    nbBatches = encodeConcurrently(encoder, startThread, threading.Thread.join)
+    # the 40 queries of the 20 concurrent requests are encoded in batches
+    assert nbBatches < 21
+
+
+def test_preloaded_encoder_in_forked_worker():
+    # encoder created and used in the parent, like with gunicorn preload
+    encoder = BatchEncoder(encode, max_batch_size=8, max_wait_ms=20)
+    assert encoder(['preload']).tolist() == expected(['preload'])
+
+    assert runInChild(lambda: encodeConcurrently(
+        encoder, startThread, threading.Thread.join)) > 0
+
+
+def test_preloaded_encoder_in_forked_gevent_worker():
+    pytest.importorskip('gevent')
+    encoder = BatchEncoder(encode, max_batch_size=8, max_wait_ms=20)
+    assert encoder(['preload']).tolist() == expected(['preload'])
+
+    def worker():
+        # the gevent worker patches threading after the fork
+        from gevent import monkey
+        monkey.patch_all()
+        import gevent
+        return encodeConcurrently(encoder, gevent.spawn, lambda g: g.get())
+
+    assert runInChild(worker) > 0
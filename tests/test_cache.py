@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pytest
+
+from halexp.cache import QueryCache
+
+
+def makeCache(encoder='model:default'):
+    cache = QueryCache(10, encoder)
+    for n in range(3):
+        cache.put(f'query {n}', np.full(4, n, dtype=np.float32))
+    return cache
+
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / 'query_cache.npz')
+    makeCache().save(path)
+    # the temporary file is renamed
+    assert os.listdir(tmp_path) == ['query_cache.npz']
+
+    cache = QueryCache(10, 'model:default')
+    cache.load(path)
+    assert cache.get('query  2').tolist() == [2, 2, 2, 2]
+
+    other = QueryCache(10, 'model:quantized')
+    other.load(path)
+    assert len(other.entries) == 0
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda data: data[:len(data) // 2],
+    lambda data: b'not a cache',
+    lambda data: b''])
+def test_load_corrupted(tmp_path, corrupt):
+    path = str(tmp_path / 'query_cache.npz')
+    makeCache().save(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(corrupt(data))
+
+    cache = QueryCache(10, 'model:default')
+    cache.load(path)
+    assert len(cache.entries) == 0
@@ -0,0 +1,93 @@
+import re
+
+import pytest
+
+import halexp.corpus
+from halexp.corpus import Corpus
+from halexp.dump import DumpWriter, iterDump
+from halexp.store import DocumentStore
+
+
+def makeRecord(n, **kwargs):
+    record = {
+        'halId_s': f'hal-{n:04d}',
+        'title_s': [f'Title of the HAL document number {n}'],
+        'keyword_s': ['politique', 'genre'],
+        'subtitle_s': [f'Subtitle of the HAL document number {n}'],
+        'abstract_s': [
+            f'First sentence of the abstract {n}. '
+            f'Second sentence of the abstract {n}. '
+            f'Third sentence of the abstract {n}.'],
+        'publicationDate_s': '2020-01-01',
+        'openAccess_bool': True,
+        'authFullNameId_fs': ['Author A_FacetSep_1'],
+        'authIdHasPrimaryStructure_fs': [
+            '1-1_FacetSep_Author A_JoinSep_7_FacetSep_Lab'],
+    }
+    record.update(kwargs)
+    return {k: v for k, v in record.items() if v is not None}
+
+
+class Splitter:
+
+    def tokenize(self, text):
+        return re.split(r'(?<=\.)\s+', text)
+
+
+def makeCorpus(monkeypatch):
+    monkeypatch.setattr(halexp.corpus, 'loadSentencesSplitter', Splitter)
+    corpus = object.__new__(Corpus)
+    corpus.nlp_loaded = False
+    corpus.store = DocumentStore()
+    corpus.documents = corpus.store
+    corpus.halIds = set()
+    corpus.doc_max_length = 2
+    corpus.include = {
+        'title': True, 'abstract': True, 'subtitle': True, 'keywords': True}
+    corpus.minNbCharacters = 10
+    corpus.num_workers = 1
+    return corpus
+
+
+def test_load_dump(tmp_path, monkeypatch):
+    dump_file = str(tmp_path / 'dump.jsonl.gz')
+    with DumpWriter(dump_file) as dump:
+        dump.write([
+            makeRecord(0),
+            makeRecord(1, subtitle_s=None, keyword_s=None),
+            makeRecord(2, subtitle_s=None, abstract_s=None),
+            # dropped
+            makeRecord(3, authIdHasPrimaryStructure_fs=None),
+        ])
+
+    nbPasses = []
+    def countedIterDump(path):
+        nbPasses.append(path)
+        return iterDump(path)
+    monkeypatch.setattr(halexp.corpus, 'iterDump', countedIterDump)
+
+    corpus = makeCorpus(monkeypatch)
+    corpus.createDocuments(corpus.loadDump(dump_file))
+
+    # the dump is read once for the checks and metadata, once for abstracts
+    assert len(nbPasses) == 2
+    assert corpus.nbMissing == {'subtitle_s': 2, 'keyword_s': 1}
+    assert corpus.nbDropped == {'authIdHasPrimaryStructure_fs': 1}
+    assert corpus.nb_records == 3
+    assert corpus.store.nb_records == 3
+    # metadata documents first, then the abstracts chunks
+    assert [(d.halId, d.chunk) for d in corpus.documents] == [
+        ('hal-0000', 0), ('hal-0000', 1), ('hal-0000', 2), ('hal-0001', 1),
+        ('hal-0002', 0), ('hal-0002', 1), ('hal-0000', 3), ('hal-0001', 3)]
+    # the missing entries are replaced in the stored metadata
+    assert corpus.store.metadata[1]['subtitle_s'] == ['']
+
+
+def test_repeated_hal_ids(tmp_path, monkeypatch):
+    dump_file = str(tmp_path / 'dump.jsonl')
+    with DumpWriter(dump_file) as dump:
+        dump.write([makeRecord(0), makeRecord(0)])
+
+    corpus = makeCorpus(monkeypatch)
+    with pytest.raises(ValueError):
+        corpus.createDocuments(corpus.loadDump(dump_file))
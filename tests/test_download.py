@@ -0,0 +1,91 @@
+import os
+import json
+
+import pytest
+
+from halexp.download import Downloader
+from halexp.dump import iterDump
+from hal_server import HalServer, generateDocs
+
+
+fields = ['docid', 'halId_s', 'title_s']
+docs = generateDocs(1000)
+expected = [
+    {k: doc[k] for k in fields}
+        for doc in sorted(docs, key=lambda doc: doc['docid'])]
+
+
+@pytest.fixture
+def server():
+    server = HalServer(docs, port=0).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def makeDownloader(server, dump_file, cls=Downloader, **kwargs):
+    kwargs = dict(dict(num_ranges=4, concurrency=2, backoff=0, timeout=5), **kwargs)
+    return cls(
+        server.url, 'test', '*:*', fields, dump_file, pagination_count=100,
+        **kwargs)
+
+
+def test_download(server, tmp_path):
+    dump_file = str(tmp_path / 'dump.jsonl.gz')
+    assert makeDownloader(server, dump_file).run() == len(docs)
+
+    assert list(iterDump(dump_file)) == expected
+    # the checkpoint is removed once the dump is written
+    assert os.listdir(tmp_path) == ['dump.jsonl.gz']
+
+
+class KilledDownloader(Downloader):
+    """
+    Downloader whose second range fails after two pages.
+    """
+
+    killedRange = None
+    nbPages = 0
+
+    def downloadRange(self, docidRange):
+        if docidRange.number == 1:
+            self.killedRange = docidRange
+        super().downloadRange(docidRange)
+
+    def fetchPage(self, filter, cursorMark):
+        if self.killedRange is not None and filter == self.killedRange.filter:
+            if self.nbPages == 2:
+                raise ConnectionError("killed")
+            self.nbPages += 1
+        return super().fetchPage(filter, cursorMark)
+
+
+def test_resume_killed_range(server, tmp_path):
+    dump_file = str(tmp_path / 'dump.jsonl')
+    with pytest.raises(ConnectionError):
+        makeDownloader(server, dump_file, cls=KilledDownloader).run()
+    assert not os.path.exists(dump_file)
+
+    checkpointPath = dump_file + '.ranges'
+    with open(os.path.join(checkpointPath, 'range_1.jsonl.state.json')) as f:
+        state = json.load(f)
+    assert not state['done'] and state['nb_docs'] == 200
+    # a page written after the last checkpoint
+    with open(os.path.join(checkpointPath, 'range_1.jsonl'), 'a') as f:
+        f.write('{"docid": 1, "halId_s": "hal-')
+
+    nbRequests = server.nbRequests
+    assert makeDownloader(server, dump_file).run() == len(docs)
+    assert list(iterDump(dump_file)) == expected
+    assert not os.path.exists(checkpointPath)
+    # only the remaining pages of the killed range are downloaded
+    assert server.nbRequests - nbRequests <= 2
+
+
+def test_retry_server_errors(server, tmp_path):
+    server.failRate = 0.3
+    dump_file = str(tmp_path / 'dump.jsonl')
+    assert makeDownloader(server, dump_file, retries=20).run() == len(docs)
+
+    assert list(iterDump(dump_file)) == expected
+    assert server.nbFailures > 0
@@ -0,0 +1,45 @@
+import gzip
+import json
+
+import pytest
+
+from halexp.dump import DumpWriter, iterDump
+
+
+docs = [
+    {'halId_s': 'hal-0001', 'title_s': ['Politiques publiques'], 'docid': 1},
+    {'halId_s': 'hal-0002', 'title_s': ['Réseaux numériques'], 'docid': 2},
+]
+
+
+@pytest.mark.parametrize('filename', [
+    'dump.jsonl', 'dump.jsonl.gz', 'dump.json', 'dump.json.gz'])
+def test_round_trip(tmp_path, filename):
+    path = str(tmp_path / filename)
+    with DumpWriter(path) as dump:
+        dump.write(docs[:1])
+        dump.write(docs[1:])
+
+    assert dump.nb_docs == len(docs)
+    assert list(iterDump(path)) == docs
+    # only the dump is left, the temporary file was renamed
+    assert [p.name for p in tmp_path.iterdir()] == [filename]
+
+
+def test_gzip_dump_is_compressed(tmp_path):
+    path = str(tmp_path / 'dump.jsonl.gz')
+    with DumpWriter(path) as dump:
+        dump.write(docs)
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == docs
+
+
+def test_interrupted_dump_is_not_renamed(tmp_path):
+    path = tmp_path / 'dump.jsonl.gz'
+    with pytest.raises(RuntimeError):
+        with DumpWriter(str(path)) as dump:
+            dump.write(docs)
+            raise RuntimeError("download failed")
+
+    assert not path.exists()
@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+
+from halexp.fragments import canSplice, encodeMetadata, makeFragment, dumps
+
+
+metadata = {'title_s': ['Réseaux numériques'], 'halId_s': 'hal-0001', 'docid': 1}
+
+
+def test_encode_metadata():
+    encoded = encodeMetadata(metadata)
+    assert json.loads(encoded) == metadata
+    assert encoded == json.dumps(
+        metadata, ensure_ascii=False, sort_keys=True,
+        separators=(',', ':')).encode('utf-8')
+
+
+def test_dumps():
+    value = makeFragment(encodeMetadata(metadata)) if canSplice else metadata
+    response = {
+        'reponses': [{'rank_score': np.float64(0.5), 'results_metadata': [value]}],
+        'documents': {'hal-0001': value},
+        'ids': np.arange(3),
+    }
+    assert json.loads(dumps(response)) == {
+        'documents': {'hal-0001': metadata},
+        'ids': [0, 1, 2],
+        'reponses': [{'rank_score': 0.5, 'results_metadata': [metadata]}],
+    }
+    # keys sorted like jsonify
+    assert dumps({'b': 1, 'a': 2}) == b'{"a":2,"b":1}'
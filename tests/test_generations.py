@@ -0,0 +1,35 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from halexp.generations import acquireBuildLock, getBuildId
+
+
+def writeMapping(path, documents):
+    with open(path, 'w') as f:
+        json.dump({'model': 'model', 'dim': 2, 'documents': documents}, f)
+
+
+def test_build_id(tmp_path):
+    index = SimpleNamespace(mappingPath=str(tmp_path / 'index.ids.json'))
+    manifest = {'dump_file': 'dump.jsonl.gz', 'dump_size': 10}
+    writeMapping(index.mappingPath, [[1, 'hal-0001', 0, 'a']])
+    buildId = getBuildId(index, manifest)
+
+    # same build rewritten (e.g. loaded by another worker)
+    writeMapping(index.mappingPath, [[1, 'hal-0001', 0, 'a']])
+    assert getBuildId(index, manifest) == buildId
+
+    assert getBuildId(index, dict(manifest, dump_size=11)) != buildId
+    writeMapping(index.mappingPath, [[1, 'hal-0001', 0, 'b']])
+    assert getBuildId(index, manifest) != buildId
+
+
+def test_single_build(tmp_path):
+    marker = str(tmp_path / 'generation.json')
+    lock = acquireBuildLock(marker)
+    with pytest.raises(BlockingIOError):
+        acquireBuildLock(marker)
+    lock.close()
+    acquireBuildLock(marker).close()
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from halexp.index import Index, hashText
+
+
+class EmbeddingIndex(Index):
+    """
+    Index embedding texts with a deterministic stand-in of the model.
+    """
+
+    def __init__(self, directory, texts, embedding_cache):
+        self.embeddingsPath = str(directory / 'index.embeddings.npy')
+        self.embeddingCachePath = embedding_cache
+        self.cache = None
+        self.model_name = 'model'
+        self.embedding_size = 8
+        self.batch_size = 4
+        self.length = len(texts)
+        self.labels = np.arange(1, len(texts) + 1, dtype=np.uint64)
+        self.nbEncoded = 0
+
+    def encode(self, texts):
+        self.nbEncoded += len(texts)
+        return self.normalize(np.array([
+            np.random.default_rng(int(hashText(text)[:8], 16)).random(8)
+                for text in texts]))
+
+
+def makeDocuments(texts):
+    return [
+        SimpleNamespace(getPhrasesForEmbedding=lambda text=text: text)
+            for text in texts]
+
+
+def test_embedding_cache(tmp_path):
+    texts = [f'text {n}' for n in range(10)]
+    embedding_cache = str(tmp_path / 'cache.sqlite')
+
+    (tmp_path / 'a').mkdir()
+    index = EmbeddingIndex(tmp_path / 'a', texts, embedding_cache)
+    index.updateEmbeddings(
+        makeDocuments(texts), [hashText(t) for t in texts], None)
+    assert index.nbEncoded == 10
+    # the connection is only open while documents are embedded
+    assert index.cache is None
+
+    # another index reuses the cached embeddings
+    (tmp_path / 'b').mkdir()
+    other = EmbeddingIndex(tmp_path / 'b', texts, embedding_cache)
+    other.updateEmbeddings(
+        makeDocuments(texts), [hashText(t) for t in texts], None)
+    assert other.nbEncoded == 0 and other.cache is None
+    np.testing.assert_array_equal(other.embeddings, index.embeddings)
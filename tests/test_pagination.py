@@ -0,0 +1,33 @@
+import pytest
+from werkzeug.exceptions import BadRequest, Gone
+
+from halexp.pagination import checkPage, makeCursor, readCursor, getNextOffset
+
+
+def test_cursor():
+    cursor = makeCursor(20, '3.abc')
+    assert readCursor(cursor, '3.abc') == 20
+    assert readCursor(None, '3.abc') == 0
+    with pytest.raises(Gone):
+        readCursor(cursor, '4.abc')
+    with pytest.raises(BadRequest):
+        readCursor('not a cursor', '3.abc')
+    with pytest.raises(BadRequest):
+        readCursor(makeCursor(-10, '3.abc'), '3.abc')
+
+
+def test_next_offset():
+    assert getNextOffset(25, 0, 10) == 10
+    assert getNextOffset(25, 10, 10) == 20
+    # last page
+    assert getNextOffset(25, 20, 10) is None
+    assert getNextOffset(20, 10, 10) is None
+    # an empty page would be followed by the same page
+    assert getNextOffset(25, 0, 0) is None
+    assert getNextOffset(25, 10, 0) is None
+
+
+@pytest.mark.parametrize('offset, nb_show', [(-1, 10), (0, -1), (-10, -10)])
+def test_negative_page(offset, nb_show):
+    with pytest.raises(BadRequest):
+        checkPage(offset, nb_show)
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+import scipy.sparse as sp
+
+from halexp.profiles import AuthorProfiles
+from stored_index import StoredIndex
+
+
+# documents of each author, the last author has no documents
+authorDocs = [[0, 1, 2], [2, 3], [4, 5, 6, 7], [8], []]
+
+
+def makeCorpus(directory):
+    index = StoredIndex(directory, 10)
+    rows = [d for docs in authorDocs for d in docs]
+    cols = [a for a, docs in enumerate(authorDocs) for _ in docs]
+    docAuthorMatrix = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(index.length, len(authorDocs)))
+    return SimpleNamespace(
+        index=index,
+        docAuthorMatrix=docAuthorMatrix,
+        authors=[
+            SimpleNamespace(authIdHal=f'author-{a}', normalizedFullName=f'{a}')
+                for a in range(len(authorDocs))],
+        documents=[f'doc-{p}' for p in range(index.length)],
+        publicationYears=np.full(index.length, 2020))
+
+
+def test_mean_profiles(tmp_path):
+    corpus = makeCorpus(tmp_path)
+    profiles = AuthorProfiles(corpus, pooling='mean')
+
+    embeddings = np.asarray(corpus.index.embeddings)
+    for a, docs in enumerate(authorDocs):
+        if not docs:
+            continue
+        mean = embeddings[docs].mean(axis=0)
+        np.testing.assert_allclose(
+            profiles.vectors[a], mean / np.linalg.norm(mean), atol=1e-6)
+
+    # loaded read-only afterwards
+    loaded = AuthorProfiles(corpus, pooling='mean', read_only=True)
+    np.testing.assert_array_equal(loaded.vectors, profiles.vectors)
+
+
+def test_score_threshold(tmp_path):
+    corpus = makeCorpus(tmp_path)
+    profiles = AuthorProfiles(corpus)
+    query = np.asarray(corpus.index.embeddings[5])
+    similarities = profiles.vectors @ query
+
+    res = profiles.retrieve(query, -1., None, len(authorDocs))
+    # the author without documents is not returned
+    assert [r['author'].authIdHal for r in res] == [
+        f'author-{a}' for a in np.argsort(-similarities) if authorDocs[a]]
+    assert [r['rank'] for r in res] == list(range(len(res)))
+
+    threshold = float(np.median(similarities[:-1]))
+    res = profiles.retrieve(query, threshold, None, len(authorDocs))
+    assert res
+    for r in res:
+        assert r['rank_score'] >= threshold
+        assert r['nb_hits'] > 0 and min(r['docs_scores']) >= threshold
+    assert len(res) <= sum(similarities[:-1] >= threshold)
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from halexp.backends import ExactBackend, rescoredSearch
+from halexp.evaluation import exactSearch, recallAtK
+from halexp.quantization import QuantizedEmbeddings, RowReader
+from stored_index import StoredIndex, randomEmbeddings
+
+
+@pytest.mark.parametrize('dtype', QuantizedEmbeddings.dtypes)
+def test_rescored_recall(tmp_path, dtype):
+    index = StoredIndex(tmp_path, 5000, dim=64)
+    quantized = QuantizedEmbeddings.quantize(index.embeddings, dtype)
+    queries = index.normalize(
+        np.asarray(index.embeddings[:100]) +
+        0.5 * randomEmbeddings(100, 64, seed=1))
+
+    expected, expectedScores = exactSearch(index.embeddings, queries, 10)
+    for embeddings in [np.asarray(index.embeddings), RowReader(index.embeddingsPath)]:
+        positions, scores = rescoredSearch(
+            quantized, embeddings, queries, 10, rescore_factor=4)
+        assert recallAtK(positions, expected) == 1
+        np.testing.assert_allclose(scores, expectedScores, atol=1e-5)
+
+
+def test_stale_quantization(tmp_path):
+    index = StoredIndex(tmp_path, 200, storage_dtype='int8')
+    ExactBackend(index).build(None, [])
+    dataPath, scalesPath = QuantizedEmbeddings.getPaths(
+        index.embeddingsPath, 'int8')
+    assert QuantizedEmbeddings.load(index.embeddingsPath, 'int8', 200) is not None
+
+    # embeddings rewritten after the quantized vectors were saved
+    embeddings = randomEmbeddings(200, index.embedding_size, seed=1)
+    np.save(index.embeddingsPath, embeddings)
+    mtime = os.path.getmtime(index.embeddingsPath) - 10
+    for path in [dataPath, scalesPath]:
+        os.utime(path, (mtime, mtime))
+    index.embeddings = np.load(index.embeddingsPath, mmap_mode='r')
+    assert QuantizedEmbeddings.load(index.embeddingsPath, 'int8', 200) is None
+    with pytest.raises(ValueError):
+        ExactBackend(index).load()
+
+    backend = ExactBackend(index)
+    backend.build(None, [])
+    expected = QuantizedEmbeddings.quantize(embeddings, 'int8')
+    np.testing.assert_array_equal(backend.quantized.data, expected.data)
+    np.testing.assert_array_equal(backend.quantized.scales, expected.scales)
+    positions, _ = backend.search(embeddings[:10], 1)
+    np.testing.assert_array_equal(positions[:, 0], np.arange(10))
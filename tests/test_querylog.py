@@ -0,0 +1,54 @@
+import os
+import multiprocessing
+
+from halexp.querylog import QueryLog
+
+
+def test_log_is_rotated(tmp_path):
+    path = str(tmp_path / 'queries.jsonl')
+    log = QueryLog(path, max_bytes=500, backups=2)
+    for n in range(100):
+        log.write('docs/query', f'query {n}')
+
+    assert os.path.getsize(path) <= 500
+    assert os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3')
+
+    queries = [entry['query'] for entry in log.iterEntries()]
+    # the most recent queries are kept, oldest first
+    assert queries == [f'query {n}' for n in range(100 - len(queries), 100)]
+
+
+def test_log_without_backups(tmp_path):
+    path = str(tmp_path / 'queries.jsonl')
+    log = QueryLog(path, max_bytes=200, backups=0)
+    for n in range(50):
+        log.write('docs/query', f'query {n}')
+
+    assert os.path.getsize(path) <= 200
+    assert [p.name for p in tmp_path.iterdir() if p.suffix != '.lock'] == [
+        'queries.jsonl']
+
+
+def writeQueries(path, worker):
+    log = QueryLog(path, max_bytes=2000, backups=100)
+    for n in range(200):
+        log.write('docs/query', f'worker {worker} query {n}')
+
+
+def test_concurrent_workers(tmp_path):
+    path = str(tmp_path / 'queries.jsonl')
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=writeQueries, args=(path, w)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    queries = [
+        entry['query']
+            for entry in QueryLog(path, backups=100).iterEntries()]
+    # no line is lost or interleaved by the rotations of the other workers
+    assert sorted(queries) == sorted(
+        f'worker {w} query {n}' for w in range(4) for n in range(200))
@@ -0,0 +1,111 @@
+import os
+import json
+
+import pytest
+
+from halexp.corpus import Corpus
+from halexp.store import DocumentStore
+from halexp.snapshot import readManifest, saveSnapshot, loadSnapshot
+
+
+def makeStore():
+    store = DocumentStore()
+    for n in range(5):
+        hd = {
+            'halId_s': f'hal-{n:04d}',
+            'title_s': [f'Titre {n} é'],
+            'uri_s': f'https://hal.science/hal-{n:04d}',
+            'subtitle_s': [''],
+            'keyword_s': ['a', 'b'],
+            'publicationDate_s': f'{2000 + n}-01-01',
+            'openAccess_bool': n % 2 == 0,
+        }
+        authorsData = {
+            f'{k}-{k}_FacetSep_Author {k}': {
+                'authId_i': str(k),
+                'authFullName_s': f'Author {k}',
+                'authPrimStrucId': [k % 2],
+                'authPrimStrucName': [f'Lab {k % 2}'],
+            } for k in range(n % 3 + 1)}
+        record = store.addRecord(hd, authorsData)
+        # a record without phrases, an empty phrase
+        for chunk in range(n % 3):
+            phrases = [f'phrase {n}.{chunk}', ''] if chunk else [f'phrase {n}']
+            store.addDocument(record, phrases, chunk)
+    store.freeze()
+    return store
+
+
+documentFields = [
+    'record', 'phrases', 'chunk', 'metadata', 'halId', 'title', 'uri',
+    'subtitle', 'keywords', 'open_acces', 'publication_date',
+    'publication_year']
+authorFields = [
+    'authFullNameId', 'authIdHal', 'fullName', 'normalizedFullName',
+    'authLabs', 'authLabIdHals', 'authSciencesPoSignature']
+
+
+def test_round_trip(tmp_path):
+    store = makeStore()
+    path = str(tmp_path / 'index.snapshot')
+    saveSnapshot(store, path, {'max_length': 10})
+    loaded = loadSnapshot(path)
+
+    assert len(loaded) == len(store)
+    assert loaded.nb_records == store.nb_records
+    for saved, doc in zip(store, loaded):
+        for field in documentFields:
+            assert getattr(doc, field) == getattr(saved, field), field
+        assert doc.getLabel() == saved.getLabel()
+        assert doc.getPhrasesForEmbedding() == saved.getPhrasesForEmbedding()
+        for author, savedAuthor in zip(doc.authors, saved.authors):
+            for field in authorFields:
+                assert getattr(author, field) == getattr(savedAuthor, field), field
+        assert len(doc.authors) == len(saved.authors)
+    for record in range(store.nb_records):
+        assert loaded.getEncodedMetadata(record) == \
+            store.getEncodedMetadata(record)
+
+    manifest = readManifest(path)
+    assert manifest['max_length'] == 10
+    assert manifest['nb_documents'] == len(store)
+
+
+def makeCorpus(tmp_path, max_length=10):
+    corpus = object.__new__(Corpus)
+    corpus.snapshotPath = str(tmp_path / 'index.snapshot')
+    corpus.doc_max_length = max_length
+    corpus.include = {'title': True, 'abstract': True}
+    corpus.minNbCharacters = 20
+    return corpus
+
+
+def test_manifest_mismatch(tmp_path):
+    dump_file = str(tmp_path / 'dump.jsonl')
+    with open(dump_file, 'w') as f:
+        f.write('{}\n')
+    corpus = makeCorpus(tmp_path)
+    corpus.store = makeStore()
+    corpus.dump_file = dump_file
+    corpus.saveSnapshot()
+
+    assert makeCorpus(tmp_path).loadSnapshot(dump_file)
+    # other parameters
+    assert not makeCorpus(tmp_path, max_length=20).loadSnapshot(dump_file)
+    # other dump
+    with open(dump_file, 'a') as f:
+        f.write('{}\n')
+    assert not makeCorpus(tmp_path).loadSnapshot(dump_file)
+
+
+def test_version_mismatch(tmp_path):
+    path = str(tmp_path / 'index.snapshot')
+    saveSnapshot(makeStore(), path, {})
+    manifestPath = os.path.join(path, 'manifest.json')
+    with open(manifestPath) as f:
+        manifest = json.load(f)
+    with open(manifestPath, 'w') as f:
+        json.dump(dict(manifest, version=manifest['version'] + 1), f)
+
+    assert readManifest(path) is None
+    assert not makeCorpus(tmp_path).loadSnapshot(str(tmp_path / 'dump.jsonl'))
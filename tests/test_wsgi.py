@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+# runs the app on the index built for the config (`create_index.py`)
+if 'APPCONFIG' not in os.environ:
+    pytest.skip(
+        "APPCONFIG is not set, no index to serve", allow_module_level=True)
+
+from halexp import wsgi
+from halexp.author import Author
+
+
+@pytest.fixture
+def client():
+    return wsgi.app.test_client()
+
+
+def batchPage(client, endpoint, cursor=None):
+    query = {'query': 'politique', 'hits': 2, 'score_threshold': -1}
+    if cursor is not None:
+        query['cursor'] = cursor
+    r = client.post(endpoint, json={'queries': [query, 'genre']})
+    assert r.status_code == 200
+    return r.get_json()['reponses']
+
+
+@pytest.mark.parametrize('endpoint', ['/docs/batch', '/authors/batch'])
+def test_batch_pages(client, endpoint):
+    first = batchPage(client, endpoint)
+    assert len(first) == 2 and len(first[0]['reponses']) == 2
+    second = batchPage(client, endpoint, first[0]['next_cursor'])
+    assert len(second[0]['reponses']) == 2
+
+    # the second page continues the results of the query
+    single = client.get(
+        endpoint.replace('batch', 'query'),
+        query_string={'query': 'politique', 'hits': 4, 'score_threshold': -1})
+    assert single.status_code == 200
+    assert first[0]['reponses'] + second[0]['reponses'] == \
+        single.get_json()['reponses']
+
+
+def test_batch_dedup(client):
+    r = client.post(
+        '/docs/batch', json=[{'query': 'politique', 'hits': 2, 'dedup': True}])
+    assert r.status_code == 200
+    response = r.get_json()['reponses'][0]
+    assert set(response['documents']) == {
+        res['metadata'] for res in response['reponses']}
+
+
+def test_author_fragments():
+    generation = wsgi.generations.current
+    first = Author('A_FacetSep_1', '1', 'Author A', [7], ['Lab 7'])
+    second = Author('B_FacetSep_1', '1', 'Author B', [8], ['Lab 8'])
+    # equal as `Author` objects, rendered differently
+    assert first == second
+
+    assert 'Author A' in wsgi.getAuthorNameHtml(generation, first)
+    assert 'Author B' in wsgi.getAuthorNameHtml(generation, second)
+    assert 'Lab 7' in wsgi.getAuthorHtml(generation, first)
+    assert 'Lab 8' in wsgi.getAuthorHtml(generation, second)
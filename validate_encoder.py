@@ -0,0 +1,43 @@
+import os
+import sys
+import yaml
+from time import time as now
+
+from halexp.index import setIndexPath, Index
+from halexp.corpus import Corpus
+
+config_path = os.environ['APPCONFIG']
+with open(config_path, "r") as fh:
+    params = yaml.load(fh, Loader=yaml.SafeLoader)
+
+params['index']['index_path'] = setIndexPath(params)
+encoder = params['index'].get('query_encoder', 'default')
+if len(sys.argv) > 1:
+    encoder = sys.argv[1]
+
+# the documents are embedded (or their stored embeddings reused) with the
+# model, the query encoder is loaded afterwards
+params['index']['query_encoder'] = 'default'
+print("Loading Index...")
+index = Index(**params['index'])
+corpus = Corpus(index=index, **params['corpus'])
+index.loadQueryModel(encoder)
+
+sample_size = params['index'].get('encoder_validation_size', 200)
+min_agreement = params['index'].get('min_encoder_agreement', 0.99)
+t0 = now()
+mean, minimum = index.validateQueryEncoder(corpus.documents, sample_size)
+print("%s query encoder validated in %.2fs: agreement mean %.4f, min %.4f." % (
+    encoder, now() - t0, mean, minimum))
+
+texts = [d.getPhrasesForEmbedding() for d in corpus.documents[:sample_size]]
+for name, encode in [
+        ('model', index.encode), (encoder, index.encodeQueryTexts)]:
+    t0 = now()
+    for text in texts:
+        encode([text])
+    print("%s: %.2f ms per query." % (name, 1000 * (now() - t0) / len(texts)))
+
+if mean < min_agreement:
+    print("Agreement below %s, the query encoder would be refused." % min_agreement)
+    sys.exit(1)